@@ -0,0 +1,182 @@
+"Offline fileset bundles, and serving collateral from a local githost"
+
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import unquote, urlparse
+from urllib.request import url2pathname
+from logging import getLogger
+
+from .catalog import load_yaml
+
+logger = getLogger(__name__)
+
+MANIFEST = 'bundle.json'
+
+
+def is_remote(url: str) -> bool:
+	"True if url must be retrieved over http(s), False for file:// urls and local paths"
+	return url.lower().startswith(('http://', 'https://'))
+
+
+def url_to_path(url: str) -> Path:
+	"convert a file:// url, or a plain local path, to a Path"
+	if url.lower().startswith('file:'):
+		parsed = urlparse(url)
+		return Path(url2pathname(unquote(parsed.netloc + parsed.path)))
+	return Path(url)
+
+
+@dataclass
+class LocalResponse:
+	"Minimal stand-in for requests.Response, for collateral read from a local githost"
+	status_code: int
+	content: bytes = b''
+	headers: Dict[str, str] = field(default_factory=dict)
+
+	@property
+	def text(self) -> str:
+		return self.content.decode('utf-8', errors='replace')
+
+
+class Bundle:
+	"""
+	Read-only view of a fileset bundle: a zip archive holding a githost tree (motd.html, filesets/filesets.yaml
+	and all fileset collateral) plus a manifest with the size and sha256 of every member. The archive is opened,
+	and its index read, once; members are then served from it without touching the network.
+	"""
+	def __init__(self, path: Path):
+		self.path = Path(path)
+		st = self.path.stat()
+		self.stamp = (st.st_mtime_ns, st.st_size)
+		self.mtime = formatdate(st.st_mtime, usegmt=True)
+		self._zip = zipfile.ZipFile(self.path)
+		self._lock = Lock()
+		try:
+			self.manifest: Dict[str, Dict[str, Any]] = json.loads(self._zip.read(MANIFEST))['files']
+		except KeyError:
+			raise ValueError(f"'{self.path}' is not a fileset bundle, it has no {MANIFEST}")
+
+	def __contains__(self, name: str) -> bool:
+		return name in self.manifest
+
+	def read(self, name: str) -> bytes:
+		"content of a bundle member"
+		with self._lock:
+			return self._zip.read(name)
+
+	def get(self, name: str, headers: Optional[Mapping[str, str]] = None) -> LocalResponse:
+		"serve a bundle member, honoring If-None-Match"
+		if name not in self.manifest:
+			return LocalResponse(404, b'Not Found')
+		etag = '"%s"' % self.manifest[name]['sha256']
+		resp_headers = {'ETag': etag, 'Last-Modified': self.mtime}
+		if headers and headers.get('If-None-Match') == etag:
+			return LocalResponse(304, headers=resp_headers)
+		return LocalResponse(200, self.read(name), resp_headers)
+
+
+_bundles: Dict[Path, Bundle] = {}
+_bundles_lock = Lock()
+
+
+def open_bundle(path: Path) -> Bundle:
+	"open a bundle, reusing an already open one unless it changed on disk"
+	path = Path(path).resolve()
+	with _bundles_lock:
+		bundle = _bundles.get(path)
+		st = path.stat()
+		if bundle is None or bundle.stamp != (st.st_mtime_ns, st.st_size):
+			bundle = _bundles[path] = Bundle(path)
+		return bundle
+
+
+def split_bundle_path(path: Path) -> Optional[Tuple[Path, str]]:
+	"split a path that points inside a bundle into the bundle path and member name"
+	for parent in path.parents:
+		if parent.suffix.lower() == '.zip' and parent.is_file():
+			return parent, path.relative_to(parent).as_posix()
+	return None
+
+
+def local_get(url: str, headers: Optional[Mapping[str, str]] = None) -> LocalResponse:
+	"""
+	GET equivalent for a local githost, either a directory (file:// url or plain path) or a bundle
+	archive, in which case url is the bundle path followed by the member name
+	"""
+	path = url_to_path(url)
+	inside = split_bundle_path(path)
+	if inside is not None:
+		bundle, name = inside
+		return open_bundle(bundle).get(name, headers)
+
+	try:
+		st = path.stat()
+	except OSError:
+		return LocalResponse(404, b'Not Found')
+	if not path.is_file():
+		return LocalResponse(404, b'Not Found')
+
+	etag = '"%x-%x"' % (st.st_mtime_ns, st.st_size)
+	resp_headers = {'ETag': etag, 'Last-Modified': formatdate(st.st_mtime, usegmt=True)}
+	if headers and headers.get('If-None-Match') == etag:
+		return LocalResponse(304, headers=resp_headers)
+	return LocalResponse(200, path.read_bytes(), resp_headers)
+
+
+def pack_bundle(githost: str, dest: Path, gitfileset: str = 'filesets/filesets.yaml', gitmotd: str = 'motd.html', max_workers: int = 8) -> List[str]:
+	"""
+	Pack motd.html, filesets.yaml and the collateral of every fileset available from githost into a bundle
+	archive at dest, return the names of files that could not be retrieved
+	"""
+	from .download import Downloader
+
+	if githost[-1:] != '/':
+		githost = githost + '/'
+	dest = Path(dest)
+
+	with Downloader(max_workers) as downloader:
+		response = downloader.get(githost + gitfileset)
+		if response.status_code != 200:
+			raise IOError(f"unable to retrieve {githost + gitfileset}, status code {response.status_code}")
+		filesets = load_yaml(response.content) or {}
+
+		# fileset collateral is always located under filesets/, regardless of gitfileset
+		names = [gitmotd] + sorted({'filesets/' + f['gitfile'] for s in filesets.values() for f in (s.get('files') or {}).values()})
+
+		with ThreadPoolExecutor(max_workers=downloader.max_workers, thread_name_prefix='tdcsm-bundle') as pool:
+			responses = list(pool.map(lambda n: downloader.get(githost + n), names))
+
+	contents = {gitfileset: response.content}
+	missing = []
+	for name, r in zip(names, responses):
+		if r.status_code == 200:
+			contents[name] = r.content
+		else:
+			logger.warning("skipping '%s', status code %d", name, r.status_code)
+			missing.append(name)
+
+	manifest = {
+		'githost': githost,
+		'gitfileset': gitfileset,
+		'gitmotd': gitmotd,
+		'files': {n: {'size': len(c), 'sha256': sha256(c).hexdigest()} for n, c in sorted(contents.items())},
+	}
+
+	dest.parent.mkdir(parents=True, exist_ok=True)
+	tmp = dest.with_name(f'.{dest.name}.tmp')
+	with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+		zf.writestr(MANIFEST, json.dumps(manifest, indent=1))
+		for name, content in sorted(contents.items()):
+			zf.writestr(name, content)
+	os.replace(tmp, dest)
+
+	logger.info("packed %d files into '%s'", len(contents), dest)
+	return missing
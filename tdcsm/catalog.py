@@ -0,0 +1,82 @@
+"Filesets catalog, indexing filesets.yaml once for constant time lookups, and the YAML loader for all tdcsm files"
+
+from typing import Any, Dict, IO, List, Mapping, Optional, Set, Tuple, Union
+from logging import getLogger
+
+import yaml
+
+logger = getLogger(__name__)
+
+# libyaml is an order of magnitude faster than the pure python loader, and available with most PyYAML wheels
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def load_yaml(stream: Union[str, bytes, IO]) -> Any:
+	"parse YAML content, using libyaml if available"
+	return yaml.load(stream, Loader=SafeLoader)
+
+
+def is_active(obj: Mapping[str, Any]) -> bool:
+	"True if a systems/filesets dictionary is active, dictionaries without an active flag are"
+	return str(obj.get('active', 'True')).strip().lower() == 'true'
+
+
+def file_matches(file_dict: Mapping[str, Any], dbsversion: Any, collection: Any) -> bool:
+	"True if a fileset file applies to a system's dbsversion and collection, files without either always apply"
+	if 'dbsversion' in file_dict and dbsversion not in file_dict['dbsversion']:
+		return False
+	if 'collection' in file_dict and collection not in file_dict['collection']:
+		return False
+	return True
+
+
+class FilesetCatalog:
+	"""
+	Index of filesets as defined in filesets.yaml, built once when filesets are loaded:
+	- files(fileset): files of a fileset, by file key
+	- file(fileset, basename): the (first) file entry whose gitfile has the given basename
+	- matching(fileset, dbsversion, collection): file entries applying to a system's dbsversion and collection
+	- hidden: names of filesets marked show_in_gui: False
+	"""
+	def __init__(self, filesets: Mapping[str, Mapping[str, Any]]):
+		self.filesets = filesets
+		self._files: Dict[str, Dict[str, Mapping[str, Any]]] = {}
+		self._basenames: Dict[Tuple[str, str], Mapping[str, Any]] = {}
+		self._matching: Dict[Tuple[str, str, str], List[Mapping[str, Any]]] = {}
+		self.hidden: Set[str] = set()
+
+		for setname, setobject in filesets.items():
+			files = setobject.get('files') or {}
+			self._files[setname] = files
+			for file_dict in files.values():
+				self._basenames.setdefault((setname, file_dict['gitfile'].split('/')[-1]), file_dict)
+			if str(setobject.get('show_in_gui', 'True')).strip().lower() == 'false':
+				self.hidden.add(setname)
+
+	def __contains__(self, setname: str) -> bool:
+		return setname in self.filesets
+
+	def __len__(self) -> int:
+		return len(self.filesets)
+
+	def active(self, setname: str) -> bool:
+		"True if the fileset is defined and active"
+		return setname in self.filesets and is_active(self.filesets[setname])
+
+	def files(self, setname: str) -> Dict[str, Mapping[str, Any]]:
+		"files of a fileset by file key, empty if the fileset is not defined"
+		return self._files.get(setname, {})
+
+	def file(self, setname: str, basename: str) -> Optional[Mapping[str, Any]]:
+		"file entry of a fileset by the basename of its gitfile, None if there is none"
+		return self._basenames.get((setname, basename))
+
+	def matching(self, setname: str, dbsversion: Any, collection: Any) -> List[Mapping[str, Any]]:
+		"""
+		file entries of a fileset that apply to dbsversion and collection. filesets.yaml lists dbsversion and
+		collection as strings or lists, so matches are resolved once per distinct combination and then reused.
+		"""
+		key = (setname, str(dbsversion), str(collection))
+		if key not in self._matching:
+			self._matching[key] = [f for f in self.files(setname).values() if file_matches(f, dbsversion, collection)]
+		return self._matching[key]
@@ -2,21 +2,31 @@
 "tdcsm command-line interface"
 
 import argparse
+from datetime import datetime
 from pathlib import Path
-from typing import Any, Sequence, Callable, List, Optional
+from typing import Any, Sequence, Callable, Dict, List, Optional, TYPE_CHECKING
 from logging import getLogger
 
-from .tdgui import coa as tdgui
-from .tdcoa import tdcoa
 from .model import load_filesets, load_srcsys, dump_srcsys, SrcSys, FileSet, SQLFile
+from .catalog import load_yaml
+from .configcache import ConfigCache
+from .ledger import VersionLedger, fingerprint
+from . import serve
+
+# tdcoa and the gui pull in pandas, teradatasql and tkinter, only the commands that need them import them,
+# so read-only commands (systems, filesets, status) stay fast
+if TYPE_CHECKING:
+	from .tdcoa import tdcoa
 
 logger = getLogger(__name__)
 apppath = Path.cwd()
 secrets = 'secrets.yaml'
+default_githost = 'https://raw.githubusercontent.com/tdcoa/sql/master/'
 
 
 def start_gui() -> None:
 	"invoe tdcsm GUI"
+	from .tdgui import coa as tdgui
 	tdgui(str(apppath), secrets)
 
 
@@ -96,9 +106,47 @@ def activate_filesets(system: str, filesets: Sequence[str], activate: bool = Tru
 		logger.warning('No filesets were changed')
 
 
+def app_settings() -> Dict[str, Any]:
+	"settings of the approot config.yaml, with folder names substituted, empty if there is no config.yaml"
+	try:
+		with open(apppath / 'config.yaml') as fh:
+			config = load_yaml(fh) or {}
+	except FileNotFoundError:
+		return {}
+	settings = dict(config.get('settings') or {})
+	for k, v in settings.items():
+		for folder, subfo in (config.get('folders') or {}).items():
+			v = str(v).replace('{%s}' % folder, str(subfo))
+		settings[k] = v
+	return settings
+
+
+def filesets_path() -> Path:
+	"path of the approot's local copy of filesets.yaml"
+	return apppath / app_settings().get('localfilesets', '1_download/filesets.yaml')
+
+
+def load_catalog() -> Dict[str, FileSet]:
+	"filesets of the approot, validated once per content of filesets.yaml and then read from the config cache"
+	path = filesets_path()
+	try:
+		content = path.read_bytes()
+	except FileNotFoundError:
+		raise SystemExit(f"'{path}' not found, please use run download or gui to retrieve it")
+
+	cache = ConfigCache(apppath / '.config_cache.pickle')
+	key = fingerprint(content.decode('utf-8', errors='replace'))
+	filesets = cache.get('cli:filesets', key)
+	if filesets is None:
+		filesets = load_filesets(path.name, path.parent)
+		cache.put('cli:filesets', key, filesets)
+		cache.save()
+	return filesets
+
+
 def show_filesets(name: List[str], verbose: bool, active: bool) -> None:
 	"show filesets information"
-	filesets = load_filesets()
+	filesets = load_catalog()
 
 	def make_row(k: str, p: FileSet) -> List[str]:
 		return [k, 'Yes' if p.active else 'No', '' if p.fileset_version is None else p.fileset_version]
@@ -117,17 +165,96 @@ def show_filesets(name: List[str], verbose: bool, active: bool) -> None:
 		tabulate([make_row(k, p) for k, p in filesets.items()], ["System", "Active", "Version"])
 
 
-def run_sets(action: Sequence[str]) -> None:
-	"run an action, can be all which runs all actions"
-	app = tdcoa(str(apppath), secrets)
-
-	for a, fn in [('download', app.download_files), ('prepare', app.prepare_sql), ('execute', app.execute_run), ('upload', app.upload_to_transcend)]:
-		if a in action:
-			fn()
+def show_status() -> None:
+	"show active systems and their active filesets, with the fileset versions last downloaded and prepared"
+	systems = load_srcsys(approot=apppath)
+	filesets = load_catalog()
+	ledger = VersionLedger(filesets_path().parent / 'fileset_versions.json').entries
+
+	def version(phase: str, name: str) -> str:
+		return str(ledger.get(phase, {}).get(name, {}).get('version') or '-')
+
+	rows = []
+	for sysname, srcsys in systems.items():
+		if not srcsys.active:
+			continue
+		for setname, ref in srcsys.filesets.items():
+			if not ref.active:
+				continue
+			fileset = filesets.get(setname)
+			available = 'not defined' if fileset is None else 'inactive' if not fileset.active else str(fileset.fileset_version or '-')
+			rows.append([sysname, setname, available, version('download', setname), version('prepare', f'{sysname}/{setname}')])
+	tabulate(rows, ["System", "Fileset", "Available", "Downloaded", "Prepared"])
+
+	print(f"\n{sum(s.active for s in systems.values())} of {len(systems)} systems enabled, {sum(f.active for f in filesets.values())} of {len(filesets)} filesets active")
+	print(f"filesets.yaml updated {datetime.fromtimestamp(filesets_path().stat().st_mtime):%Y-%m-%d %H:%M}")
+	lastrun = apppath / '.last_run_output_path.txt'
+	if lastrun.exists():
+		print(f"last run output: {lastrun.read_text().strip()}")
+
+
+def show_plan(app: 'tdcoa') -> None:
+	"show the files the download action would retrieve, and the systems requiring them"
+	app.wait_for_filesets()
+	plan = app.download_plan()
+	tabulate([[f.fileset, f.gitfile, ','.join(f.systems)] for f in plan], ["Fileset", "GIT File", "Systems"])
+	for sysname, setname in plan.unknown:
+		logger.warning("fileset '%s' of system '%s' is not defined in filesets.yaml", setname, sysname)
+	print(f"\n{len(plan)} unique files for {sum(len(f.systems) for f in plan)} (system, file) pairs")
+
+
+def run_sets(action: Sequence[str], plan: bool = False, system: Optional[List[str]] = None, fileset: Optional[List[str]] = None,
+		server: bool = False, socket: Optional[str] = None, jobs: int = 1) -> None:
+	"run actions in this process or, if server or socket is given, by a running server"
+	if (server or socket) and not plan:
+		try:
+			conn = serve.connect(serve.parse_address(socket) if socket else None)
+		except OSError as ex:
+			logger.warning("no server running (%s), running in this process", ex)
+		else:
+			job = dict(approot=str(apppath.resolve()), secrets=secrets, actions=list(action), systems=system, filesets=fileset, jobs=jobs)
+			if not serve.submit(conn, job):
+				raise SystemExit(1)
+			return
+
+	from .tdcoa import tdcoa
+	app = tdcoa(str(apppath), secrets=secrets)
+	app.filesets_updated.subscribe(lambda _: logger.info("filesets.yaml was updated, using the latest filesets"))
+
+	if plan:
+		show_plan(app)
+		return
+
+	with app.selection(system, fileset):
+		serve.run_actions(app, action, jobs)
+
+
+def start_server(socket: Optional[str] = None, idle_timeout: float = 600) -> None:
+	"run jobs sent by thin clients until interrupted"
+	from logging import basicConfig, INFO
+	from .pool import ConnectionPool
+	basicConfig(level=INFO, format="%(asctime)s %(levelname)s: %(message)s")
+	serve.serve(serve.parse_address(socket) if socket else None, ConnectionPool(idle_timeout=idle_timeout))
+
+
+def make_bundle(bundle: Path, githost: Optional[str] = None) -> None:
+	"pack all filesets into a bundle, usable as githost on machines without network access"
+	from .bundle import pack_bundle
+	settings = app_settings()
+
+	missing = pack_bundle(
+		githost or settings.get('githost', default_githost),
+		bundle,
+		gitfileset=settings.get('gitfileset', 'filesets/filesets.yaml'),
+		gitmotd=settings.get('gitmotd', 'motd.html'))
+	if missing:
+		logger.warning("%d files could not be retrieved and are missing from the bundle", len(missing))
+	print(f"bundle saved to '{bundle}', set githost to this path to use it")
 
 
 def first_time() -> None:
 	"Initialize a folder for the first time"
+	from .tdcoa import tdcoa
 	_ = tdcoa(str(apppath))
 
 
@@ -136,7 +263,7 @@ def run(approot: Path, secfile: str, cmd: Callable, **kwargs: Any) -> None:
 	global apppath, secrets
 
 	apppath = approot
-	if not (apppath / 'source_systems.yaml').exists() and cmd not in [first_time, start_gui]:
+	if not (apppath / 'source_systems.yaml').exists() and cmd not in [first_time, start_gui, make_bundle, start_server]:
 		raise SystemExit("Missing source_systems.yaml file, please use init or gui")
 
 	secrets = secfile
@@ -205,9 +332,28 @@ def main(argv: Sequence[str] = None) -> None:
 	p.add_argument('-a', '--active', action='store_true', help='show only active entries')
 	p.add_argument('-v', '--verbose', action='store_true', help='also include gitfile names')
 
+	p = subp.add_parser('status', help='Active systems and filesets, and what was last downloaded and prepared')
+	p.set_defaults(cmd=show_status)
+
+	p = subp.add_parser('bundle', help='Pack all filesets into a single archive for offline use')
+	p.set_defaults(cmd=make_bundle)
+	p.add_argument('bundle', type=Path, metavar='FILE', help='bundle archive to create, e.g. coa-bundle.zip')
+	p.add_argument('--githost', metavar='URL', help='source of the filesets, default: githost from APPROOT config.yaml')
+
 	p = subp.add_parser('run', help='Run actions against filesets')
 	p.set_defaults(cmd=run_sets)
-	p.add_argument('action', nargs='+', choices=['download', 'prepare', 'execute', 'upload'], help='actions to run')
+	p.add_argument('action', nargs='+', choices=['download', 'verify', 'prepare', 'execute', 'upload'], help='actions to run')
+	p.add_argument('--plan', action='store_true', help='only show the files download would retrieve, run no actions')
+	p.add_argument('-s', '--system', action='append', metavar='NAME', help='run only for this active system, can be repeated')
+	p.add_argument('-f', '--fileset', action='append', metavar='NAME', help='run only this active fileset, can be repeated')
+	p.add_argument('-j', '--jobs', type=int, default=1, metavar='N', help='prepare filesets in N processes, default: 1')
+	p.add_argument('--server', action='store_true', help='send the actions to a running "tdcsm serve", instead of running them in this process')
+	p.add_argument('--socket', metavar='ADDRESS', help='socket path or HOST:PORT of the server, implies --server, default: ~/.tdcsm/serve.sock')
+
+	p = subp.add_parser('serve', help='Keep running, and run the jobs of run commands, with imports, configs and database sessions kept warm')
+	p.set_defaults(cmd=start_server)
+	p.add_argument('--socket', metavar='ADDRESS', help='socket path or HOST:PORT to listen on, default: ~/.tdcsm/serve.sock')
+	p.add_argument('--idle-timeout', type=float, default=600, metavar='SECONDS', help='close database sessions idle for longer, default: 600')
 
 	run(**vars(parser.parse_args(argv)))
 
@@ -0,0 +1,116 @@
+"Compiled configuration cache, keyed on the content of the YAML files it was compiled from"
+
+import os
+import pickle
+import re
+import stat
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Mapping, Optional
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+# bump when the layout of the cached entries changes
+FORMAT = 3
+
+# a secret value kept out of a cached configuration, see secret_placeholders(): private use characters,
+# so neither substitution nor YAML (a plain scalar, quoted or not) takes it for anything but text
+MARK = '\ue001'
+SECRET = re.compile('%ssecret%s([^%s]*)%s' % (MARK, MARK, MARK, MARK))
+
+
+def secret_placeholders(secrets: Mapping[str, Any]) -> Dict[str, str]:
+	"""
+	a placeholder for each secret, as values of a substitution layer in place of the secrets: the
+	configuration compiled with them can be cached, and fill_secrets() puts the values in once loaded
+	"""
+	return {str(name): '%ssecret%s%s%s' % (MARK, MARK, name, MARK) for name in secrets}
+
+
+def fill_secrets(value: Any, secrets: Mapping[str, Any]) -> Any:
+	"""
+	a copy of value with the secret placeholders of its strings, in dictionaries and lists, replaced by the
+	secrets; a string that is one placeholder only becomes the secret as secrets.yaml typed it
+	"""
+	if isinstance(value, str):
+		whole = SECRET.fullmatch(value)
+		if whole and whole.group(1) in secrets:
+			return secrets[whole.group(1)]
+		return SECRET.sub(lambda m: str(secrets[m.group(1)]) if m.group(1) in secrets else m.group(0), value)
+	if isinstance(value, dict):
+		return {k: fill_secrets(v, secrets) for k, v in value.items()}
+	if isinstance(value, list):
+		return [fill_secrets(v, secrets) for v in value]
+	return value
+
+
+def trusted(fd: int) -> bool:
+	"is an open cache file owned by the current user, and writable by no one else: unpickling it runs whatever it holds"
+	if os.name == 'nt':
+		return True
+	st = os.fstat(fd)
+	return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+class ConfigCache:
+	"""
+	Named entries, each holding a compiled (parsed and substituted) configuration together with the key,
+	usually a fingerprint of the input file contents, it was compiled from. An entry is only returned for
+	the same key, so any change to an input file recompiles it. Entries are pickled as they are put, and
+	unpickled on every get, so callers are free to modify what they receive. A readonly cache is never saved.
+	The cache file is written readable by its owner only, and ignored unless only its owner can write it.
+	Secrets should not be cached at all, see secret_placeholders().
+	"""
+	def __init__(self, path: Path, readonly: bool = False):
+		self.path = Path(path)
+		self.readonly = readonly
+		self.entries: Dict[str, Dict[str, Any]] = {}
+		self.changed = False
+		self._lock = Lock()
+		try:
+			with open(self.path, 'rb') as f:
+				if not trusted(f.fileno()):
+					raise PermissionError('the file is not owned by the current user, or writable by others')
+				cached = pickle.load(f)
+			if cached.get('format') == FORMAT:
+				self.entries = cached['entries']
+		except FileNotFoundError:
+			pass
+		except Exception as ex:
+			logger.warning("ignoring unreadable configuration cache %s: %s", self.path, ex)
+
+	def get(self, name: str, key: str) -> Optional[Any]:
+		"the entry compiled from key, or None if there is none"
+		with self._lock:
+			entry = self.entries.get(name)
+		if entry is None or entry['key'] != key:
+			return None
+		return pickle.loads(entry['data'])
+
+	def put(self, name: str, key: str, value: Any) -> None:
+		"remember value as compiled from key"
+		data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+		with self._lock:
+			self.entries[name] = {'key': key, 'data': data}
+			self.changed = True
+
+	def save(self) -> None:
+		"write the cache to disk atomically, if anything was put since it was read; failures are only logged"
+		with self._lock:
+			if not self.changed or self.readonly:
+				return
+			tmp = self.path.with_name(f'.{self.path.name}.{os.getpid()}.tmp')
+			try:
+				if os.path.lexists(tmp):
+					os.remove(tmp)
+				with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o600), 'wb') as f:
+					pickle.dump({'format': FORMAT, 'entries': self.entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+				os.replace(tmp, self.path)
+				self.changed = False
+			except OSError as ex:
+				logger.warning("unable to save configuration cache %s: %s", self.path, ex)
+				try:
+					os.remove(tmp)
+				except OSError:
+					pass
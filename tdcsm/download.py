@@ -0,0 +1,320 @@
+"Concurrent download engine for fileset collateral"
+
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock, get_ident
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple, Union
+from logging import getLogger
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .bundle import LocalResponse, is_remote, local_get
+from .store import ContentStore, file_digest
+
+logger = getLogger(__name__)
+
+# responses worth retrying, anything else (e.g. 404) is final
+RETRY_STATUS = frozenset([408, 429, 500, 502, 503, 504])
+MAX_BACKOFF = 60.0
+
+
+class DownloadError(IOError):
+	"A request that failed with a network error on every attempt"
+	def __init__(self, url: str, attempts: int, reason: Exception):
+		super().__init__(f"{url}: {reason}")
+		self.url = url
+		self.attempts = attempts
+		self.reason = reason
+
+
+@dataclass(frozen=True)
+class DownloadJob:
+	"A single remote file and the local path it is saved to, and optionally the sha256 digest its content must have"
+	url: str
+	savefile: Path
+	sha256: Optional[str] = None
+
+
+@dataclass
+class DownloadResult:
+	"Outcome of a download job"
+	job: DownloadJob
+	status_code: int
+	text: str = ''
+	size: int = 0
+	attempts: int = 1
+	resumed: bool = False
+
+	@property
+	def ok(self) -> bool:
+		"True if the file was retrieved and saved, or the cached copy is still current"
+		return self.status_code in (200, 304)
+
+	@property
+	def not_modified(self) -> bool:
+		"True if the server confirmed the cached copy is still current"
+		return self.status_code == 304
+
+
+def content_entry(content: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Dict[str, Any]:
+	"index entry (validators, size and digest) for downloaded content"
+	return {
+		'etag': etag,
+		'last_modified': last_modified,
+		'size': len(content),
+		'sha256': sha256(content).hexdigest(),
+	}
+
+
+def response_entry(response: Union[requests.Response, LocalResponse]) -> Dict[str, Any]:
+	"index entry (validators, size and digest) for the content of a successful response"
+	return content_entry(response.content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+
+def write_atomic(content: bytes, savefile: Path) -> None:
+	"write content to savefile via a temp file and rename, so savefile is never partially written"
+	savefile.parent.mkdir(parents=True, exist_ok=True)
+	tmp = savefile.with_name(f'.{savefile.name}.{get_ident()}.tmp')
+	tmp.write_bytes(content)
+	os.replace(tmp, savefile)
+
+
+class DownloadIndex:
+	"""
+	Persistent record of downloaded files, keyed by URL. Each entry holds the local path (relative to the
+	index location), ETag, Last-Modified, size and sha256 of the file as it was last downloaded, and its
+	mtime once saved, which allows later downloads to be revalidated with conditional requests. Only a
+	local file that is still intact is revalidated, see intact().
+
+	Every recorded file is also appended to a journal (<index>.journal) as soon as it is saved. The journal
+	is only cleared once a download run completes without failures, so a run that was interrupted or had
+	failures can be resumed: files in the journal that are still intact locally are not requested again.
+	"""
+	def __init__(self, path: Path):
+		self.path = Path(path)
+		self.journalpath = self.path.with_suffix('.journal')
+		self.entries: Dict[str, Dict[str, Any]] = {}
+		self.journaled: Set[str] = set()
+		self._lock = Lock()
+
+		if self.path.exists():
+			try:
+				self.entries = json.loads(self.path.read_text())
+			except ValueError:
+				logger.warning("ignoring unreadable download index: %s", self.path)
+
+		if self.journalpath.exists():
+			with open(self.journalpath) as fh:
+				for line in fh:
+					try:
+						url, entry = json.loads(line)
+					except ValueError:
+						break  # torn last line of an interrupted run
+					self.entries[url] = entry
+					self.journaled.add(url)
+
+	def relpath(self, savefile: Path) -> str:
+		"path of savefile as stored in the index"
+		return Path(os.path.relpath(savefile, self.path.parent)).as_posix()
+
+	def intact(self, job: DownloadJob) -> bool:
+		"""
+		True if the local file of job is still the one recorded: at the recorded path, of the recorded size,
+		and with the recorded mtime or else the recorded sha256, so a file edited in place is never kept
+		"""
+		entry = self.entries.get(job.url)
+		if entry is None or entry.get('path') != self.relpath(job.savefile):
+			return False
+		try:
+			st = job.savefile.stat()
+		except FileNotFoundError:
+			return False
+		if st.st_size != entry.get('size'):
+			return False
+		return st.st_mtime_ns == entry.get('mtime_ns') or (entry.get('sha256') is not None and file_digest(job.savefile) == entry['sha256'])
+
+	def validators(self, job: DownloadJob) -> Dict[str, str]:
+		"conditional request headers for job, empty if there is no intact cached copy"
+		if not self.intact(job):
+			return {}
+
+		entry = self.entries[job.url]
+		headers = {}
+		if entry.get('etag'):
+			headers['If-None-Match'] = entry['etag']
+		if entry.get('last_modified'):
+			headers['If-Modified-Since'] = entry['last_modified']
+		return headers
+
+	def completed(self, job: DownloadJob) -> bool:
+		"True if an unfinished earlier run already saved job, and the local file is still intact"
+		return job.url in self.journaled and self.intact(job)
+
+	def record(self, job: DownloadJob, entry: Dict[str, Any], journal: bool = True) -> None:
+		"record validators, digest and mtime of a saved file, and journal it unless the index is saved right away"
+		entry = {'path': self.relpath(job.savefile), **entry}
+		try:
+			entry['mtime_ns'] = job.savefile.stat().st_mtime_ns
+		except FileNotFoundError:
+			entry.pop('mtime_ns', None)
+		with self._lock:
+			self.entries[job.url] = entry
+			if journal:
+				self.journaled.add(job.url)
+				with open(self.journalpath, 'a') as fh:
+					fh.write(json.dumps([job.url, entry]) + '\n')
+
+	def forget(self, savefile: Path) -> None:
+		"remove all entries pointing to savefile"
+		rel = self.relpath(savefile)
+		with self._lock:
+			self.entries = {u: e for u, e in self.entries.items() if e.get('path') != rel}
+
+	def save(self) -> None:
+		"write the index to disk, atomically"
+		with self._lock:
+			tmp = self.path.with_name(f'.{self.path.name}.tmp')
+			tmp.write_text(json.dumps(self.entries, indent=1, sort_keys=True))
+			os.replace(tmp, self.path)
+
+	def clear_journal(self) -> None:
+		"forget about resumable files, once a download run completed without failures"
+		with self._lock:
+			self.journaled.clear()
+			if self.journalpath.exists():
+				self.journalpath.unlink()
+
+
+class Downloader:
+	"""
+	Download files using a bounded pool of worker threads that share one keep-alive session.
+	- at most max_workers requests are in flight at any time
+	- connections (and TLS sessions) are reused across files from the same host
+	- if an index is supplied, files already downloaded are revalidated with conditional requests
+	  and kept as-is when the server answers 304 Not Modified
+	- if a content store is supplied, files are saved as links to shared blobs, and files another
+	  approot already downloaded are linked from the store and only revalidated
+	- results are yielded in job order, so logs remain deterministic
+	- urls that are not http(s) are read from a local githost: a directory or a fileset bundle
+	- network errors and transient statuses are retried with exponential backoff and jitter, every
+	  request is bounded by timeout seconds, and files are written atomically (temp file plus rename)
+	- a failed file is reported in its result, it never stops the other downloads
+	"""
+	def __init__(self, max_workers: int = 8, index: Optional[DownloadIndex] = None, store: Optional[ContentStore] = None,
+				 retries: int = 3, timeout: Optional[float] = 30.0, backoff: float = 1.0):
+		self.max_workers = max(1, int(max_workers))
+		self.index = index
+		self.store = store
+		self.retries = max(0, int(retries))
+		self.timeout = timeout
+		self.backoff = float(backoff)
+		self.session = requests.Session()
+		adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+		self.session.mount('https://', adapter)
+		self.session.mount('http://', adapter)
+
+	def __enter__(self) -> 'Downloader':
+		return self
+
+	def __exit__(self, *_: object) -> None:
+		self.close()
+
+	def close(self) -> None:
+		"release pooled connections"
+		self.session.close()
+
+	def get(self, url: str, timeout: Optional[float] = None, headers: Optional[Dict[str, str]] = None) -> Union[requests.Response, LocalResponse]:
+		"issue a single GET request using the shared session, or read the url from a local githost"
+		if not is_remote(url):
+			return local_get(url, headers)
+		return self.session.get(url, timeout=timeout or self.timeout, headers=headers)
+
+	def delay(self, attempt: int) -> float:
+		"seconds to wait before retrying after attempt, exponential backoff with full jitter"
+		return random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** (attempt - 1)))
+
+	def request(self, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[Union[requests.Response, LocalResponse], int]:
+		"GET url, retrying network errors and transient statuses, return the last response and the number of attempts"
+		attempt = 0
+		while True:
+			attempt += 1
+			try:
+				response = self.get(url, headers=headers)
+			except (requests.RequestException, OSError) as ex:
+				if attempt > self.retries:
+					raise DownloadError(url, attempt, ex) from ex
+				logger.debug("attempt %d of %s failed: %s", attempt, url, ex)
+			else:
+				if response.status_code not in RETRY_STATUS or attempt > self.retries:
+					return response, attempt
+				logger.debug("attempt %d of %s returned status %d", attempt, url, response.status_code)
+			time.sleep(self.delay(attempt))
+
+	def prime(self, job: DownloadJob) -> Dict[str, Any]:
+		"link content already in the shared store to the job's savefile, return its store entry"
+		entry = self.store.lookup(job.url) if self.store is not None else None
+		if entry is None:
+			return {}
+		self.store.link(entry['sha256'], job.savefile)
+		return entry
+
+	def adopt(self, job: DownloadJob) -> None:
+		"move a current, previously downloaded file into the shared store"
+		entry = self.index.entries[job.url]
+		self.store.put_file(job.savefile, entry.get('sha256'))
+		self.store.link(entry['sha256'], job.savefile)
+		self.store.record(job.url, entry)
+
+	def fetch(self, job: DownloadJob) -> DownloadResult:
+		"download one file and save it to its local path, unless the cached copy is still current"
+		if self.index is not None and self.index.completed(job):
+			return DownloadResult(job, 304, attempts=0, resumed=True)
+
+		headers = self.index.validators(job) if self.index is not None else {}
+		primed = self.prime(job) if not headers else {}
+		if primed:
+			headers = {k: v for k, v in [('If-None-Match', primed.get('etag')), ('If-Modified-Since', primed.get('last_modified'))] if v}
+
+		logger.debug("GET %s %s", job.url, headers)
+		try:
+			response, attempts = self.request(job.url, headers=headers)
+		except DownloadError as ex:
+			return DownloadResult(job, 0, str(ex.reason), attempts=ex.attempts)
+		if response.status_code == 304 and headers:
+			if primed and self.index is not None:
+				self.index.record(job, primed)
+			elif self.index is not None:
+				if self.store is not None and self.store.lookup(job.url) is None:
+					self.adopt(job)
+				self.index.record(job, self.index.entries[job.url])
+			return DownloadResult(job, response.status_code, attempts=attempts)
+		if response.status_code != 200:
+			return DownloadResult(job, response.status_code, response.text, attempts=attempts)
+
+		entry = response_entry(response)
+		if job.sha256 and entry['sha256'] != job.sha256.lower():
+			return DownloadResult(job, 0, f"sha256 mismatch, expected {job.sha256} but received {entry['sha256']}", attempts=attempts)
+		if self.store is not None:
+			self.store.put_bytes(response.content)
+			self.store.link(entry['sha256'], job.savefile)
+			self.store.record(job.url, entry)
+		else:
+			write_atomic(response.content, job.savefile)
+		if self.index is not None:
+			self.index.record(job, entry)
+		return DownloadResult(job, response.status_code, size=len(response.content), attempts=attempts)
+
+	def run(self, jobs: Iterable[DownloadJob]) -> Iterator[DownloadResult]:
+		"download all jobs concurrently, yielding results in the same order as jobs"
+		jobs = list(jobs)
+		if not jobs:
+			return
+		with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs)), thread_name_prefix='tdcsm-download') as pool:
+			yield from pool.map(self.fetch, jobs)
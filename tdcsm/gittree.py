@@ -0,0 +1,141 @@
+"Delta sync of fileset collateral, comparing git blob SHAs from a single tree listing"
+
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional
+from urllib.parse import urlparse
+from logging import getLogger
+
+from .download import Downloader, DownloadError, DownloadIndex, DownloadJob, DownloadResult, content_entry, write_atomic
+from .store import ContentStore
+
+logger = getLogger(__name__)
+
+GITHUB_RAW = 'raw.githubusercontent.com'
+GITHUB_API = 'https://api.github.com'
+
+
+def blob_sha(content: bytes) -> str:
+	"git blob SHA of content, as listed in git trees"
+	return sha1(b'blob %d\0' % len(content) + content).hexdigest()
+
+
+class GitTree:
+	"""
+	Blob SHAs of all files in a git tree, keyed by path, and a reader that returns the content of a blob.
+	Use local_tree() or github_tree() to create one.
+	"""
+	def __init__(self, blobs: Dict[str, str], reader: Callable[[str, str], bytes]):
+		self.blobs = blobs
+		self.reader = reader
+
+	def __len__(self) -> int:
+		return len(self.blobs)
+
+	def read(self, path: str) -> bytes:
+		"content of the blob at path, raises KeyError if path is not in the tree"
+		return self.reader(path, self.blobs[path])
+
+
+def local_tree(repo: Path, ref: str = 'HEAD') -> GitTree:
+	"tree of a local (bare or working) git repository, as listed by git ls-tree"
+	def git(*args: str) -> bytes:
+		return subprocess.run(['git', '--git-dir', str(gitdir), *args], check=True, capture_output=True).stdout
+
+	gitdir = Path(repo).expanduser()
+	if (gitdir / '.git').is_dir():
+		gitdir = gitdir / '.git'
+
+	blobs = {}
+	for line in git('ls-tree', '-r', '-z', '--full-tree', ref).split(b'\0'):
+		if line:
+			meta, path = line.split(b'\t', 1)
+			_, kind, sha = meta.split()
+			if kind == b'blob':
+				blobs[path.decode('utf-8')] = sha.decode('ascii')
+
+	return GitTree(blobs, lambda path, sha: git('cat-file', 'blob', sha))
+
+
+def github_tree(githost: str, downloader: Downloader) -> GitTree:
+	"tree of a GitHub repository, githost must be its raw.githubusercontent.com/<owner>/<repo>/<ref>/ url"
+	parsed = urlparse(githost)
+	parts = [p for p in parsed.path.split('/') if p]
+	if parsed.netloc != GITHUB_RAW or len(parts) != 3:
+		raise ValueError(f"'{githost}' is not a https://{GITHUB_RAW}/<owner>/<repo>/<ref>/ url, set gittree_repo to use a local repository")
+	owner, repo, ref = parts
+
+	url = f'{GITHUB_API}/repos/{owner}/{repo}/git/trees/{ref}?recursive=1'
+	response, _ = downloader.request(url)
+	if response.status_code != 200:
+		raise IOError(f"{url}: status code {response.status_code}")
+	listing = response.json()
+	if listing.get('truncated'):
+		logger.warning("tree listing of %s is truncated, files not listed will be reported as missing", githost)
+
+	def read(path: str, sha: str) -> bytes:
+		response, _ = downloader.request(githost + path)
+		if response.status_code != 200:
+			raise IOError(f"{githost + path}: status code {response.status_code}")
+		return response.content
+
+	return GitTree({e['path']: e['sha'] for e in listing['tree'] if e['type'] == 'blob'}, read)
+
+
+class GitTreeSync:
+	"""
+	Synchronize download jobs with a git tree: files whose blob SHA matches the SHA recorded in the download
+	index are kept without any request, only changed or missing files are read from the tree. Results use
+	the same status codes as Downloader: 304 (unchanged), 200 (fetched), 404 (not in tree), 0 (failed).
+	"""
+	def __init__(self, tree: GitTree, githost: str, index: DownloadIndex, store: Optional[ContentStore] = None, max_workers: int = 8):
+		self.tree = tree
+		self.githost = githost
+		self.index = index
+		self.store = store
+		self.max_workers = max(1, int(max_workers))
+
+	def path(self, job: DownloadJob) -> str:
+		"path of the job's file in the tree"
+		return job.url[len(self.githost):] if job.url.startswith(self.githost) else job.url
+
+	def current(self, job: DownloadJob, sha: str) -> bool:
+		"True if the local file was saved from the blob with the given sha, and is still intact"
+		entry = self.index.entries.get(job.url)
+		return entry is not None and entry.get('git_sha') == sha and self.index.intact(job)
+
+	def fetch(self, job: DownloadJob) -> DownloadResult:
+		"bring one file up to date with the tree"
+		sha = self.tree.blobs.get(self.path(job))
+		if sha is None:
+			return DownloadResult(job, 404, f"{self.path(job)} is not in the tree")
+		if self.current(job, sha):
+			return DownloadResult(job, 304, attempts=0)
+
+		try:
+			content = self.tree.read(self.path(job))
+		except (DownloadError, IOError, subprocess.CalledProcessError) as ex:
+			return DownloadResult(job, 0, str(ex))
+		if blob_sha(content) != sha:
+			return DownloadResult(job, 0, f"blob SHA mismatch, expected {sha} but received {blob_sha(content)}")
+
+		entry = {**content_entry(content), 'git_sha': sha}
+		if job.sha256 and entry['sha256'] != job.sha256.lower():
+			return DownloadResult(job, 0, f"sha256 mismatch, expected {job.sha256} but received {entry['sha256']}")
+		if self.store is not None:
+			self.store.put_bytes(content)
+			self.store.link(entry['sha256'], job.savefile)
+		else:
+			write_atomic(content, job.savefile)
+		self.index.record(job, entry)
+		return DownloadResult(job, 200, size=len(content))
+
+	def run(self, jobs: Iterable[DownloadJob]) -> Iterator[DownloadResult]:
+		"synchronize all jobs, yielding results in the same order as jobs"
+		jobs = list(jobs)
+		if not jobs:
+			return
+		with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs)), thread_name_prefix='tdcsm-gittree') as pool:
+			yield from pool.map(self.fetch, jobs)
@@ -0,0 +1,86 @@
+"Record of the fileset versions and inputs each phase last processed, to skip unchanged filesets"
+
+import json
+import os
+import re
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+PLACEHOLDER = re.compile(r'\{([^{}\s]+)\}')
+
+
+def fingerprint(*parts: Any) -> str:
+	"stable digest of json-able parts, dictionaries are hashed independent of key order"
+	return sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def referenced(texts: Iterable[str], layers: Iterable[Mapping[str, Any]]) -> List[Dict[str, str]]:
+	"""
+	Reduce substitution layers to the values texts actually reference as {name}, including names referenced
+	by those values in turn, so unrelated values (e.g. a date nobody uses) don't invalidate a fingerprint
+	"""
+	layers = [{k: str(v) for k, v in layer.items() if not isinstance(v, (dict, list))} for layer in layers]
+	pending = {m for text in texts for m in PLACEHOLDER.findall(text)}
+	names = set()
+	while pending:
+		name = pending.pop()
+		names.add(name)
+		for layer in layers:
+			if name in layer:
+				pending.update(m for m in PLACEHOLDER.findall(layer[name]) if m not in names)
+	return [{k: v for k, v in layer.items() if k in names} for layer in layers]
+
+
+class VersionLedger:
+	"""
+	Persistent record, per phase (download, prepare) and name (fileset, or system/fileset), of the
+	fileset_version last processed and a fingerprint of everything else the result depends on.
+	"""
+	def __init__(self, path: Path):
+		self.path = Path(path)
+		self.entries: Dict[str, Dict[str, Dict[str, Optional[str]]]] = {}
+		try:
+			self.entries = json.loads(self.path.read_text())
+		except FileNotFoundError:
+			pass
+		except ValueError:
+			logger.warning("ignoring unreadable fileset version ledger: %s", self.path)
+
+	def current(self, phase: str, name: str, version: Optional[str], key: str) -> bool:
+		"True if name was processed by phase at this version and fingerprint, filesets without a version never are"
+		if version is None:
+			return False
+		return self.entries.get(phase, {}).get(name) == {'version': str(version), 'key': key}
+
+	def record(self, phase: str, name: str, version: Optional[str], key: str) -> None:
+		"remember that name was processed by phase at this version and fingerprint"
+		self.entries.setdefault(phase, {})[name] = {'version': None if version is None else str(version), 'key': key}
+
+	def forget(self, phase: str, name: str) -> None:
+		"make name unprocessed for phase"
+		self.entries.get(phase, {}).pop(name, None)
+
+	def keys(self, phase: str, prefix: str, version: Optional[str]) -> Dict[str, str]:
+		"fingerprints of the names under prefix/ processed by phase at this version, by name relative to prefix"
+		if version is None:
+			return {}
+		return {name[len(prefix) + 1:]: entry['key'] for name, entry in self.entries.get(phase, {}).items()
+			if name.startswith(prefix + '/') and entry.get('version') == str(version)}
+
+	def replace(self, phase: str, prefix: str, version: Optional[str], keys: Mapping[str, str]) -> None:
+		"make keys, by name relative to prefix, the only names under prefix/ processed by phase"
+		entries = self.entries.setdefault(phase, {})
+		for name in [n for n in entries if n.startswith(prefix + '/')]:
+			del entries[name]
+		for name, key in keys.items():
+			self.record(phase, f'{prefix}/{name}', version, key)
+
+	def save(self) -> None:
+		"write the ledger to disk, atomically"
+		tmp = self.path.with_name(f'.{self.path.name}.tmp')
+		tmp.write_text(json.dumps(self.entries, indent=1, sort_keys=True))
+		os.replace(tmp, self.path)
@@ -1,8 +1,19 @@
+import threading
+
+from .configcache import fill_secrets
+
+
 class Logger:
+    """Run log of one tdcoa instance.  Messages are kept in memory while bufferlogs is set, and appended
+    to logpath once it is not; every message is also passed to sink (print by default) when printlog is
+    set.  Buffer, path, sink and lock all belong to the instance, so two instances never share log state,
+    and several threads may log to one instance: each message is written whole and in order."""
 
-    def __init__(self):
+    def __init__(self, sink=None):
 
         # log settings
+        self._lock = threading.RLock()
+        self.sink = print if sink is None else sink
         self.logs = []
         self.logspace = 30
         self.bufferlogs = True
@@ -22,7 +33,8 @@ class Logger:
         if warning:
             msg = '%s\nWARNING:\n%s\n%s' % ('-' * logspc, msg, '-' * logspc)
 
-        # prevent secrets from appearing in log:
+        # prevent secrets from appearing in log, nor placeholders of them (as logged compiling the config):
+        msg = fill_secrets(msg, self.secrets)
         for nm, secret in self.secrets.items():
             if secret in msg:
                 msg = msg.replace(secret, '%s%s%s' % (secret[:1], '*' * (len(secret) - 2), secret[-1:]))
@@ -30,30 +42,20 @@ class Logger:
         if header:
             msg = '\n\n%s\n%s\n%s' % ('=' * 40, msg.upper(), '-' * 40)
 
-        if self.bufferlogs:
-            self.logs.append(msg)
-            if self.printlog:
-                print(msg)
+        self.extend([msg])
 
-        else:  # no buffer
-            if len(self.logs) == 0:
-                if self.printlog:
-                    print(msg)
-                # self.__writelog(msg)
-                with open(self.logpath, 'a') as logfile:
-                    logfile.write(msg + '\n')
-
-            else:
-                if self.printlog:
-                    print(msg)
-                for log in self.logs:
-                    # self.__writelog(log)
-                    with open(self.logpath, 'a') as logfile:
-                        logfile.write(log + '\n')
-                    self.logs = []
-                # self.__writelog(msg)
+    def extend(self, msgs):
+        """Writes messages already formatted by log(), e.g. those another instance buffered, in order."""
+        with self._lock:
+            if self.printlog:
+                for msg in msgs:
+                    self.sink(msg)
+            if self.bufferlogs:
+                self.logs.extend(msgs)
+            else:  # no buffer, flush what was buffered along with these messages
+                pending, self.logs = self.logs + list(msgs), []
                 with open(self.logpath, 'a') as logfile:
-                    logfile.write(msg + '\n')
+                    logfile.write(''.join(log + '\n' for log in pending))
 
     @property
     def secrets(self):
@@ -3,7 +3,9 @@
 from typing import Optional, Dict, Any
 from pathlib import Path
 from pydantic import BaseModel
-from yaml import safe_load, dump
+from yaml import dump
+
+from .catalog import load_yaml
 
 
 class SQLFile(BaseModel):
@@ -13,6 +15,7 @@ class SQLFile(BaseModel):
 		extra = "allow"
 
 	gitfile: str
+	sha256: Optional[str]
 
 
 class FileSet(BaseModel):
@@ -68,7 +71,7 @@ class SrcSys(BaseModel):
 def load_filesets(fname: str = 'filesets.yaml', download_dir: Path = Path.cwd() / '1_download') -> Dict[str, FileSet]:
 	"load source systems"
 	with open(download_dir / fname) as f:
-		yaml = safe_load(f)
+		yaml = load_yaml(f)
 
 	return {n: FileSet(**v) for n, v in yaml.items()}
 
@@ -76,7 +79,7 @@ def load_filesets(fname: str = 'filesets.yaml', download_dir: Path = Path.cwd()
 def load_srcsys(fname: str = 'source_systems.yaml', approot: Path = Path.cwd()) -> Dict[str, SrcSys]:
 	"load source systems"
 	with open(approot / fname) as f:
-		yaml = safe_load(f)
+		yaml = load_yaml(f)
 
 	return {n: SrcSys(**v) for n, v in yaml['systems'].items()}
 
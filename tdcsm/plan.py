@@ -0,0 +1,48 @@
+"Download plan, the fileset files required by all active systems, as resolved by the run plan"
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class PlannedFile:
+	"A fileset file and the active systems that require it, sha256 is the publisher's digest if filesets.yaml has one"
+	fileset: str
+	gitfile: str
+	systems: Tuple[str, ...]
+	sha256: Optional[str] = None
+
+	@property
+	def filename(self) -> str:
+		"name of the file once downloaded"
+		return self.gitfile.split('/')[-1]
+
+
+@dataclass
+class DownloadPlan:
+	"""
+	Deduplicated set of (fileset, gitfile) pairs required by active systems, in first-required order.
+	- files: every required file, listed once however many systems share it
+	- unknown: (system, fileset) pairs where the fileset is not defined in filesets.yaml
+	"""
+	files: List[PlannedFile] = field(default_factory=list)
+	unknown: List[Tuple[str, str]] = field(default_factory=list)
+
+	def __iter__(self) -> Iterator[PlannedFile]:
+		return iter(self.files)
+
+	def __len__(self) -> int:
+		return len(self.files)
+
+	def filesets(self) -> List[str]:
+		"names of filesets with at least one required file"
+		return list(dict.fromkeys(f.fileset for f in self.files))
+
+	def by_system(self) -> Dict[str, Dict[str, List[PlannedFile]]]:
+		"files required by each system, by fileset"
+		result: Dict[str, Dict[str, List[PlannedFile]]] = {}
+		for f in self.files:
+			for sysname in f.systems:
+				result.setdefault(sysname, {}).setdefault(f.fileset, []).append(f)
+		return result
+
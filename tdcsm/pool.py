@@ -0,0 +1,204 @@
+"Pool of idle database connections, reused by the jobs of a long-running tdcsm process"
+
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+Key = Tuple[str, str, str, str, str]
+
+
+def default_connect(**components: str) -> Any:
+	"open a new connection with dbutil.connect, imported on first use as it pulls in teradatasql"
+	from .dbutil import connect
+	return connect(**components)
+
+
+def session_database(conn: Any) -> str:
+	"the default database of a new session, reset_session restores it"
+	with conn.cursor() as csr:
+		csr.execute('SELECT DATABASE')
+		return str(csr.fetchone()[0]).strip()
+
+
+def reset_session(conn: Any, database: str) -> None:
+	"""
+	return a session to its state when it connected, as far as jobs change it: drop its volatile tables (e.g.
+	those of temp special commands), and restore its default database and query band. Raises if it can't.
+	"""
+	with conn.cursor() as csr:
+		csr.execute('HELP VOLATILE TABLE')
+		columns = [d[0] for d in csr.description or ()]
+		tables = [str(row[columns.index('Table Name')]).strip() for row in csr.fetchall()] if 'Table Name' in columns else []
+		for table in tables:
+			csr.execute('DROP TABLE "%s"' % table.replace('"', '""'))
+		csr.execute('DATABASE "%s"' % database.replace('"', '""'))
+		csr.execute('SET QUERY_BAND = NONE FOR SESSION')
+
+
+def validate(conn: Any) -> bool:
+	"is a connection that sat idle still usable"
+	try:
+		with conn.cursor() as csr:
+			csr.execute('SELECT 1')
+		return True
+	except Exception as ex:
+		logger.debug("discarding stale connection: %s", ex)
+		return False
+
+
+def close(conn: Any) -> None:
+	"close a connection, ignoring errors"
+	try:
+		conn.close()
+	except Exception as ex:
+		logger.debug("error closing connection: %s", ex)
+
+
+class ConnectionPool:
+	"""
+	Idle connections by host, logmech, username, password and encryption. A session leases connections
+	from the pool, reusing an idle one (validated first if it sat idle longer than validate_after seconds)
+	or connecting anew, and hands all of them back when it ends. A connection handed back is reset first,
+	so no session state (volatile tables, default database) carries over to its next lease: snapshot takes
+	what reset restores when the connection is opened. Connections that can't be reset, or all of them when
+	reset is None, are closed instead, as are those idle longer than idle_timeout seconds or beyond max_idle
+	for the same key.
+	"""
+	def __init__(self, connect: Callable[..., Any] = default_connect, idle_timeout: float = 600, validate_after: float = 60, max_idle: int = 4,
+			snapshot: Callable[[Any], Any] = session_database, reset: Optional[Callable[[Any, Any], None]] = reset_session):
+		self._connect = connect
+		self._snapshot = snapshot
+		self._reset = reset
+		self.idle_timeout = idle_timeout
+		self.validate_after = validate_after
+		self.max_idle = max_idle
+		self._idle: Dict[Key, List[Tuple[float, Any]]] = {}
+		self._initial: Dict[int, Any] = {}  # snapshot of each poolable connection, by id
+		self._lock = Lock()
+
+	@staticmethod
+	def key(host: str = '', logmech: str = '', username: str = '', password: str = '', encryption: str = '') -> Key:
+		"pool key of the connection components"
+		return host, logmech, username, password, encryption
+
+	def acquire(self, **components: str) -> Any:
+		"an idle connection for components, or a new one"
+		key = self.key(**components)
+		self.expire()
+		while True:
+			with self._lock:
+				idle = self._idle.get(key)
+				if not idle:
+					break
+				since, conn = idle.pop()
+			if time.monotonic() - since < self.validate_after or validate(conn):
+				logger.debug("reusing connection to %s as %s", key[0], key[2])
+				return conn
+			self.discard(conn)
+		logger.debug("connecting to %s as %s", key[0], key[2])
+		conn = self._connect(**components)
+		if self._reset is not None:
+			try:
+				initial = self._snapshot(conn)
+			except Exception as ex:
+				logger.debug("connection will not be pooled, its session state could not be taken: %s", ex)
+			else:
+				with self._lock:
+					self._initial[id(conn)] = initial
+		return conn
+
+	def release(self, conn: Any, **components: str) -> None:
+		"return a connection to the pool once its session is reset, or close it"
+		with self._lock:
+			poolable = id(conn) in self._initial
+			initial = self._initial.get(id(conn))
+		if not poolable:
+			close(conn)
+			return
+		try:
+			self._reset(conn, initial)
+		except Exception as ex:
+			logger.debug("discarding connection whose session could not be reset: %s", ex)
+			self.discard(conn)
+			return
+		key = self.key(**components)
+		with self._lock:
+			idle = self._idle.setdefault(key, [])
+			if len(idle) < self.max_idle:
+				idle.append((time.monotonic(), conn))
+				return
+		self.discard(conn)
+
+	def discard(self, conn: Any) -> None:
+		"close a connection, never to be pooled"
+		with self._lock:
+			self._initial.pop(id(conn), None)
+		close(conn)
+
+	def expire(self) -> None:
+		"close connections idle for longer than idle_timeout"
+		cutoff = time.monotonic() - self.idle_timeout
+		expired = []
+		with self._lock:
+			for key, idle in list(self._idle.items()):
+				expired.extend(conn for since, conn in idle if since < cutoff)
+				idle[:] = [(since, conn) for since, conn in idle if since >= cutoff]
+				if not idle:
+					del self._idle[key]
+		for conn in expired:
+			self.discard(conn)
+
+	def close(self) -> None:
+		"close all idle connections"
+		with self._lock:
+			idle, self._idle = self._idle, {}
+		for conn in (c for v in idle.values() for _, c in v):
+			self.discard(conn)
+
+	def __len__(self) -> int:
+		with self._lock:
+			return sum(len(v) for v in self._idle.values())
+
+	def session(self) -> 'Session':
+		"a new session, leasing connections from this pool"
+		return Session(self)
+
+
+class Session:
+	"Connections leased from a pool by one job, a replacement for dbutil.connect that hands them back on close"
+	def __init__(self, pool: ConnectionPool):
+		self.pool = pool
+		self.leased: List[Tuple[Any, Dict[str, str]]] = []
+
+	def __call__(self, **components: str) -> Any:
+		conn = self.pool.acquire(**components)
+		self.leased.append((conn, components))
+		return conn
+
+	def close(self, conn: Optional[Any] = None) -> None:
+		"hand back conn, or all leased connections"
+		kept = []
+		for leased, components in self.leased:
+			if conn is None or leased is conn:
+				self.pool.release(leased, **components)
+			else:
+				kept.append((leased, components))
+		self.leased = kept
+
+	def discard(self) -> None:
+		"close all leased connections instead of handing them back, when a job failed half way"
+		for leased, _ in self.leased:
+			self.pool.discard(leased)
+		self.leased = []
+
+	def __enter__(self) -> 'Session':
+		return self
+
+	def __exit__(self, exc_type: Any, *exc: Any) -> None:
+		if exc_type is None:
+			self.close()
+		else:
+			self.discard()
@@ -0,0 +1,65 @@
+"Stale-while-revalidate refresh of control files, such as filesets.yaml"
+
+from threading import Lock
+from typing import Any, Callable, List, Optional
+from logging import getLogger
+
+from .download import Downloader, DownloadIndex, DownloadJob, response_entry, write_atomic
+
+logger = getLogger(__name__)
+
+
+class Event:
+	"Thread-safe publish/subscribe event, callbacks run on the thread that emits the event"
+	def __init__(self, name: str):
+		self.name = name
+		self._callbacks: List[Callable[..., Any]] = []
+		self._lock = Lock()
+
+	def subscribe(self, callback: Callable[..., Any]) -> Callable[..., Any]:
+		"call callback on every emit, returns callback so this can be used as a decorator"
+		with self._lock:
+			self._callbacks.append(callback)
+		return callback
+
+	def unsubscribe(self, callback: Callable[..., Any]) -> None:
+		"stop calling callback"
+		with self._lock:
+			self._callbacks.remove(callback)
+
+	def emit(self, *args: Any, **kwargs: Any) -> None:
+		"call all subscribed callbacks, a failing callback doesn't affect the others"
+		with self._lock:
+			callbacks = list(self._callbacks)
+		for callback in callbacks:
+			try:
+				callback(*args, **kwargs)
+			except Exception:
+				logger.exception("'%s' event callback failed", self.name)
+
+
+def refresh_file(downloader: Downloader, job: DownloadJob, index: Optional[DownloadIndex] = None,
+				 validate: Optional[Callable[[bytes], None]] = None) -> bool:
+	"""
+	Revalidate a local file against its url, and atomically replace it if the content changed.
+	validate may raise an exception to reject new content, in which case the local file is kept.
+	Returns True if the file was replaced, raises DownloadError or IOError if it could not be refreshed.
+	"""
+	headers = index.validators(job) if index is not None else {}
+	response, _ = downloader.request(job.url, headers=headers)
+	if response.status_code == 304 and headers:
+		return False
+	if response.status_code != 200:
+		raise IOError(f"{job.url}: status code {response.status_code}")
+
+	if validate is not None:
+		validate(response.content)
+	if job.savefile.exists() and job.savefile.read_bytes() == response.content:
+		changed = False
+	else:
+		write_atomic(response.content, job.savefile)
+		changed = True
+	if index is not None:
+		index.record(job, response_entry(response), journal=False)
+		index.save()
+	return changed
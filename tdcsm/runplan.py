@@ -0,0 +1,137 @@
+"Immutable run plan: the work units of all active systems and filesets, planned once and shared by every phase"
+
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple
+from logging import getLogger
+
+from pydantic import ValidationError
+
+from .catalog import file_matches
+from .model import FileSet, SrcSys
+from .plan import DownloadPlan, PlannedFile
+
+logger = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class WorkUnit:
+	"""
+	One file of a fileset, for one active system that has the fileset active.
+	- matches: the file's dbsversion and collection filters match the system
+	"""
+	system: str
+	fileset: str
+	file: str
+	gitfile: str
+	sha256: Optional[str]
+	matches: bool
+
+	@property
+	def filename(self) -> str:
+		"name of the file once downloaded"
+		return self.gitfile.split('/')[-1]
+
+
+@dataclass(frozen=True)
+class RunPlan:
+	"""
+	Work units of all active systems and filesets, with the activity of every defined system and fileset:
+	- systems, filesets: every defined system and fileset, and whether it is active
+	- selected: (system, fileset) pairs an active system has active
+	- unknown: (system, fileset) pairs where the fileset is not defined in filesets.yaml
+	- invalid: (name, error) of systems and filesets whose definition does not validate, these are inactive
+	"""
+	units: Tuple[WorkUnit, ...] = ()
+	systems: Mapping[str, bool] = field(default_factory=lambda: MappingProxyType({}))
+	filesets: Mapping[str, bool] = field(default_factory=lambda: MappingProxyType({}))
+	selected: FrozenSet[Tuple[str, str]] = frozenset()
+	unknown: Tuple[Tuple[str, str], ...] = ()
+	invalid: Tuple[Tuple[str, str], ...] = ()
+
+	def __len__(self) -> int:
+		return len(self.units)
+
+	def active(self, system: str, fileset: Optional[str] = None) -> bool:
+		"True if system is defined and active, and if given, the fileset is defined, active, and active for system"
+		if not self.systems.get(system, False):
+			return False
+		return fileset is None or (self.filesets.get(fileset, False) and (system, fileset) in self.selected)
+
+	def work(self, system: Optional[str] = None, fileset: Optional[str] = None, matching: bool = True) -> Tuple[WorkUnit, ...]:
+		"work units, optionally of one system and/or fileset, by default only those matching the system's filters"
+		return tuple(u for u in self.units if (system is None or u.system == system)
+			and (fileset is None or u.fileset == fileset) and (u.matches or not matching))
+
+	def download_plan(self) -> DownloadPlan:
+		"files required by the matching work units, each listed once however many systems share it"
+		required: Dict[Tuple[str, str], List[str]] = {}
+		digests: Dict[Tuple[str, str], Optional[str]] = {}
+		for u in self.units:
+			if u.matches:
+				required.setdefault((u.fileset, u.gitfile), []).append(u.system)
+				digests[(u.fileset, u.gitfile)] = u.sha256
+		files = [PlannedFile(setname, gitfile, tuple(sysnames), digests[(setname, gitfile)]) for (setname, gitfile), sysnames in required.items()]
+		return DownloadPlan(files, list(self.unknown))
+
+
+def make_run_plan(
+	systems: Mapping[str, Mapping[str, Any]],
+	filesets: Mapping[str, Mapping[str, Any]],
+) -> RunPlan:
+	"""
+	Validate systems and filesets (as loaded from source_systems.yaml and filesets.yaml) with their pydantic
+	models, and plan the work units of every active system and fileset.
+	"""
+	invalid: List[Tuple[str, str]] = []
+
+	models: Dict[str, FileSet] = {}
+	for setname, raw in filesets.items():
+		try:
+			models[setname] = FileSet(**{'files': {}, **raw})
+		except ValidationError as ex:
+			invalid.append((setname, str(ex)))
+
+	units: List[WorkUnit] = []
+	system_flags: Dict[str, bool] = {}
+	selected, unknown = set(), []
+
+	for sysname, raw in systems.items():
+		refs = {k: {'active': True, **v} for k, v in (raw.get('filesets') or {}).items()}
+		try:
+			srcsys = SrcSys(**{**raw, 'filesets': refs})
+		except ValidationError as ex:
+			invalid.append((sysname, str(ex)))
+			system_flags[sysname] = False
+			continue
+		system_flags[sysname] = srcsys.active
+		if not srcsys.active:
+			continue
+
+		for setname, ref in srcsys.filesets.items():
+			if not ref.active:
+				continue
+			selected.add((sysname, setname))
+			fileset = models.get(setname)
+			if fileset is None:
+				if setname not in filesets:
+					unknown.append((sysname, setname))
+				continue
+			if not fileset.active:
+				continue
+
+			for filekey, file_dict in filesets[setname].get('files', {}).items():
+				units.append(WorkUnit(
+					sysname, setname, filekey, file_dict['gitfile'], file_dict.get('sha256'),
+					file_matches(file_dict, srcsys.dbsversion, srcsys.collection)))
+
+	plan = RunPlan(
+		tuple(units),
+		MappingProxyType(system_flags),
+		MappingProxyType({setname: fileset.active for setname, fileset in models.items()}),
+		frozenset(selected),
+		tuple(unknown),
+		tuple(invalid),
+	)
+	logger.debug("planned %d work units for %d active systems", len(plan.units), sum(system_flags.values()))
+	return plan
@@ -0,0 +1,250 @@
+"Long-running tdcsm server running jobs for thin clients, with imports, configurations and database sessions kept warm"
+
+import hmac
+import json
+import os
+import signal
+import socket
+import socketserver
+from pathlib import Path
+from secrets import token_hex
+from threading import Lock, Thread, current_thread, main_thread
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
+from logging import getLogger
+
+from .pool import ConnectionPool
+from .watch import FileWatcher
+
+logger = getLogger(__name__)
+
+Address = Union[str, Tuple[str, int]]
+
+# job actions, in the order they run, and the tdcoa phase running each
+ACTIONS = {
+	'download': 'download_files',
+	'verify': 'verify_downloads',
+	'prepare': 'prepare_sql',
+	'execute': 'execute_run',
+	'upload': 'upload_to_transcend',
+}
+
+
+def run_actions(coa: Any, actions: Sequence[str], jobs: int = 1) -> None:
+	"run the phases of actions in order, preparing filesets in jobs worker processes"
+	for action, phase in ACTIONS.items():
+		if action in actions:
+			if action == 'prepare':
+				getattr(coa, phase)(jobs=jobs)
+			else:
+				getattr(coa, phase)()
+
+
+def default_address() -> Address:
+	"""
+	a unix socket in the user's home, only the user can connect to; a localhost port where there are no unix
+	sockets, which only takes jobs carrying the token in the user's home
+	"""
+	if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+		return str(Path.home() / '.tdcsm' / 'serve.sock')
+	return '127.0.0.1', 8741
+
+
+def token_path() -> Path:
+	"the file a server listening on a TCP port keeps its token in, readable by the user only"
+	return Path.home() / '.tdcsm' / 'serve.token'
+
+
+def write_token() -> str:
+	"a new random token, saved to token_path with permissions for the user only"
+	token = token_hex(32)
+	path = token_path()
+	path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+	path.unlink(missing_ok=True)
+	fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+	with os.fdopen(fd, 'w') as fh:
+		fh.write(token)
+	return token
+
+
+def parse_address(text: str) -> Address:
+	"HOST:PORT for a TCP address, anything else is the path of a unix socket"
+	host, sep, port = text.rpartition(':')
+	if sep and port.isdigit():
+		return host, int(port)
+	return text
+
+
+def connect(address: Optional[Address] = None) -> socket.socket:
+	"connect to a running server, raises OSError if there is none"
+	address = address or default_address()
+	sock = socket.socket(socket.AF_UNIX if isinstance(address, str) else socket.AF_INET, socket.SOCK_STREAM)
+	try:
+		sock.connect(address)
+	except OSError:
+		sock.close()
+		raise
+	return sock
+
+
+def submit(sock: socket.socket, job: Dict[str, Any], out: Callable[[str], None] = print) -> bool:
+	"send a job over a connection to the server, passing its run log to out, True if it succeeded"
+	if sock.family != getattr(socket, 'AF_UNIX', None):
+		try:
+			job = {**job, 'token': token_path().read_text().strip()}
+		except OSError:
+			pass  # the server refuses the job
+	with sock, sock.makefile('rb') as replies:
+		sock.sendall(json.dumps(job).encode('utf-8') + b'\n')
+		for line in replies:
+			reply = json.loads(line)
+			if 'log' in reply:
+				out(reply['log'])
+			elif 'error' in reply:
+				logger.error("job failed: %s", reply['error'])
+				return False
+			elif reply.get('done'):
+				return True
+	logger.error("server closed the connection before the job ended")
+	return False
+
+
+class App:
+	"A tdcoa instance kept between jobs, the lock its jobs hold, and a watcher for edits to its configuration files"
+	def __init__(self, coa: Any):
+		self.coa = coa
+		self.lock = Lock()
+		self.watcher = FileWatcher(coa.config_files())
+
+
+class Jobs:
+	"""
+	Runs jobs, each a dict with an approot, the actions to run, and optionally the secrets file, the
+	systems and filesets to narrow the run to, and the number of processes preparing filesets. One tdcoa
+	instance is kept per approot and secrets file; jobs for the same approot run one at a time, jobs for
+	different approots concurrently. Configuration files edited between jobs are reloaded, and database
+	connections are leased from a shared pool.
+	"""
+	def __init__(self, pool: Optional[ConnectionPool] = None):
+		self.pool = pool or ConnectionPool()
+		self.apps: Dict[Tuple[str, str], App] = {}
+		self._lock = Lock()
+
+	def app(self, approot: str, secrets: str) -> App:
+		"the kept instance for approot and secrets, created on first use"
+		key = (os.path.realpath(approot), secrets)
+		with self._lock:
+			if key not in self.apps:
+				from .tdcoa import tdcoa
+				self.apps[key] = App(tdcoa(key[0], secrets=secrets, printlog=False))
+			return self.apps[key]
+
+	def run(self, job: Dict[str, Any], log: Callable[[str], None]) -> None:
+		"run the actions of job, passing its run log messages to log"
+		actions = job.get('actions') or []
+		unknown = [a for a in actions if a not in ACTIONS]
+		if unknown:
+			raise ValueError(f"unknown actions: {', '.join(unknown)}")
+
+		secrets = job.get('secrets') or 'secrets.yaml'
+		app = self.app(job['approot'], secrets)
+		with app.lock:
+			coa = app.coa
+			changed = app.watcher.changed()
+			if changed:
+				coa.reload_changed(changed, keep_selection=False)
+			coa.utils.sink, coa.utils.printlog = log, True
+			try:
+				with self.pool.session() as session:
+					coa.utils.connector = session
+					with coa.selection(job.get('systems'), job.get('filesets')):
+						run_actions(coa, actions, job.get('jobs') or 1)
+			except Exception:
+				# the instance may be half way through a phase, the next job starts from a fresh one
+				with self._lock:
+					self.apps.pop((os.path.realpath(job['approot']), secrets), None)
+				raise
+			finally:
+				coa.utils.connector = None
+				coa.utils.sink, coa.utils.printlog = print, False
+
+
+class Handler(socketserver.StreamRequestHandler):
+	"Reads one job per connection, replies with a JSON line per run log message and one for the outcome"
+	def handle(self) -> None:
+		connected = True
+
+		def reply(**message: Any) -> None:
+			nonlocal connected
+			if connected:
+				try:
+					self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+					self.wfile.flush()
+				except OSError:
+					connected = False  # the client went away, the job still runs to its end
+
+		try:
+			job = json.loads(self.rfile.readline())
+			token = getattr(self.server, 'token', None)
+			if token is not None and not hmac.compare_digest(str(job.pop('token', '')), token):
+				logger.warning("refused a job without the server token")
+				reply(error="PermissionError: the job does not carry this server's token")
+				return
+			logger.info("job started: %s %s", job.get('approot'), ' '.join(job.get('actions') or []))
+			self.server.jobs.run(job, lambda msg: reply(log=msg))
+		except Exception as ex:
+			logger.exception("job failed")
+			reply(error=f"{type(ex).__name__}: {ex}")
+		else:
+			logger.info("job ended: %s", job.get('approot'))
+			reply(done=True)
+
+
+class TCPServer(socketserver.ThreadingTCPServer):
+	"Any local user can connect to a port: jobs must carry token, see write_token"
+	daemon_threads = True
+	allow_reuse_address = True
+	token: Optional[str] = None
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+	class UnixServer(socketserver.ThreadingUnixStreamServer):
+		daemon_threads = True
+
+
+def serve(address: Optional[Address] = None, pool: Optional[ConnectionPool] = None) -> None:
+	"run jobs sent to address until interrupted or terminated"
+	address = address or default_address()
+	if isinstance(address, str):
+		try:
+			connect(address).close()
+		except OSError:
+			Path(address).unlink(missing_ok=True)  # left behind by a server that did not shut down
+		else:
+			raise SystemExit(f"a server is already running on {address}")
+		Path(address).parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+		umask = os.umask(0o177)  # the socket is created for the user only, not just chmod-ed after
+		try:
+			server = UnixServer(address, Handler)
+		finally:
+			os.umask(umask)
+		os.chmod(address, 0o600)
+	else:
+		server = TCPServer(address, Handler)
+		server.token = write_token()
+
+	from . import tdcoa  # noqa: F401, imported once, ahead of the first job
+	server.jobs = Jobs(pool)
+	if current_thread() is main_thread():
+		signal.signal(signal.SIGTERM, lambda *_: Thread(target=server.shutdown).start())
+	logger.info("serving jobs on %s", address)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		server.jobs.pool.close()
+		if isinstance(address, str):
+			Path(address).unlink(missing_ok=True)
+		else:
+			token_path().unlink(missing_ok=True)
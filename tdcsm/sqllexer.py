@@ -0,0 +1,132 @@
+"Streaming SQL lexer splitting text into statements on ';' outside of quotes and comments, and parser of their special commands"
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# the tokens a ';' can hide in, and ';' itself: everything else is copied as is
+TOKENS = re.compile(r"""
+	'[^']*(?:''[^']*)*'?    # string literal, '' is a quote within it
+	|"[^"]*"?               # quoted name
+	|--[^\n]*               # line comment
+	|/\*.*?(?:\*/|\Z)       # block comment, /*{{name:value}}*/ special commands among them
+	|;                      # end of statement
+""", re.VERBOSE | re.DOTALL)
+
+CMDSTART = '/*{{'
+CMDEND = '}}*/'
+
+# a /*{{name:value}}*/ special command, up to the first }}*/ after its start, and its name:value text
+COMMAND = re.compile(r'/\*\{\{(.*?)\}\}\*/', re.DOTALL)
+
+Command = Tuple[str, str]
+Span = Tuple[int, int]
+
+
+@dataclass(frozen=True)
+class Statement:
+	"""
+	A statement of a SQL text, without the ';' ending it, where it starts in the text, its special commands as
+	(name, value), and where each of them starts and ends in the statement text
+	"""
+	text: str
+	start: int
+	commands: Tuple[Command, ...]
+	spans: Tuple[Span, ...] = field(default=(), repr=False)
+
+	def special_commands(self, replace_with: str = '', keys_to_skip: Iterable[str] = ()) -> 'SpecialCommands':
+		"the special commands of the statement, as special_commands() has them, from where the lexer found them"
+		return parse_commands(self.text, [(span, cmd) for span, cmd in zip(self.spans, self.commands)], replace_with, keys_to_skip)
+
+
+@dataclass(frozen=True)
+class SpecialCommand:
+	"A special command of a statement: its name, value and text, where it starts and ends, and if it is skipped by name"
+	name: str
+	value: str
+	skipped: bool
+	text: str
+	start: int
+	end: int
+
+
+@dataclass(frozen=True)
+class SpecialCommands:
+	"""
+	The special commands of a statement, each distinct command text once, in order, and the sql with the
+	commands not skipped replaced. A name found more than once has the value of its last command.
+	"""
+	found: Tuple[SpecialCommand, ...]
+	sql: str
+
+	@property
+	def commands(self) -> Dict[str, str]:
+		"value by name of the commands not skipped, in the order their names were first found"
+		return {cmd.name: cmd.value for cmd in self.found if not cmd.skipped}
+
+
+def command(text: str) -> Command:
+	"name and value of a /*{{name:value}}*/ special command, the value empty unless there is exactly one ':'"
+	parts = text.replace(CMDSTART, '').replace(CMDEND, '').split(':')
+	return parts[0].strip(), parts[1].strip() if len(parts) == 2 else ''
+
+
+def special_commands(sql: str, replace_with: str = '', keys_to_skip: Iterable[str] = ()) -> SpecialCommands:
+	"""
+	the /*{{name:value}}*/ special commands of sql, in one pass. Commands not skipped by name are replaced by
+	'/* replace_with */', its {cmdname}, {cmdkey} and {cmdvalue} filled in, or removed if replace_with is empty;
+	where a name is found more than once, only the copies of its last command text are.
+	"""
+	return parse_commands(sql, [(m.span(), command(m.group())) for m in COMMAND.finditer(sql)], replace_with, keys_to_skip)
+
+
+def parse_commands(sql: str, matches: Iterable[Tuple[Span, Command]], replace_with: str = '', keys_to_skip: Iterable[str] = ()) -> SpecialCommands:
+	"the SpecialCommands of sql, from where its special commands start and end, and their name and value, in order"
+	skip = set(keys_to_skip)
+	matches = list(matches)
+	found: Dict[str, SpecialCommand] = {}
+	last: Dict[str, SpecialCommand] = {}
+	for (start, end), (name, value) in matches:
+		if sql[start:end] not in found:
+			found[sql[start:end]] = last[name] = SpecialCommand(name, value, name in skip, sql[start:end], start, end)
+
+	parts, pos = [], 0
+	for (start, end), (name, value) in matches:
+		cmd = last[name]
+		if not cmd.skipped and sql[start:end] == cmd.text:
+			parts.append(sql[pos:start])
+			if replace_with:
+				parts.append('/* %s */' % replace_with.replace('{cmdname}', name).replace('{cmdkey}', name).replace('{cmdvalue}', value))
+			pos = end
+	parts.append(sql[pos:])
+	return SpecialCommands(tuple(found.values()), ''.join(parts))
+
+
+def statements(text: str) -> Iterator[Statement]:
+	"""
+	the statements of text in one pass, like text.split(';') but for ';' in string literals, quoted names
+	and comments: unterminated ones run to the end of the text. The last statement is what follows the
+	last ';', usually only whitespace.
+	"""
+	start = 0
+	commands: List[Command] = []
+	spans: List[Span] = []
+	for m in TOKENS.finditer(text):
+		token = m.group()
+		if token == ';':
+			yield Statement(text[start:m.start()], start, tuple(commands), tuple(spans))
+			start, commands, spans = m.end(), [], []
+		elif token.startswith(CMDSTART) and token.endswith(CMDEND) and len(token) >= len(CMDSTART) + len(CMDEND):
+			commands.append(command(token))
+			spans.append((m.start() - start, m.end() - start))
+	yield Statement(text[start:], start, tuple(commands), tuple(spans))
+
+
+def split_sql(text: str) -> List[str]:
+	"the text of each statement of text, a drop-in replacement for text.split(';')"
+	return [st.text for st in statements(text)]
+
+
+def first_statement(text: str) -> str:
+	"the text of the first statement, lexing no further than its end"
+	return next(statements(text)).text
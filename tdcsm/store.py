@@ -0,0 +1,129 @@
+"Content-addressed file store, shared by all approots on a machine"
+
+import json
+import os
+import shutil
+import stat
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock, get_ident
+from typing import Any, Dict, Optional
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+READONLY = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+
+def file_digest(path: Path, bufsize: int = 1024 * 1024) -> str:
+	"return sha256 hex digest of a file's content"
+	h = sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(bufsize), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+class ContentStore:
+	"""
+	Store file content once, under its sha256 digest (<root>/<sha256>), and hard-link it into approot folders.
+	- falls back to a plain copy where hard-links are not possible (e.g., different volumes)
+	- blobs are never modified in place, files linked into an approot must be replaced (written to a new
+	  file and renamed over, or removed first), never rewritten: a write through a link would change the
+	  file in every approot sharing its blob. Blobs are made read-only so such a write fails instead,
+	  except on windows, where read-only files can't be replaced or removed
+	- an index of URL validators (<root>/index.json) lets a fresh approot revalidate a URL already
+	  downloaded by another approot, instead of transferring it again
+	"""
+	def __init__(self, root: Path):
+		self.root = Path(root).expanduser()
+		self.root.mkdir(parents=True, exist_ok=True)
+		self.indexpath = self.root / 'index.json'
+		self.entries: Dict[str, Dict[str, Any]] = self._read_index()
+		self._lock = Lock()
+
+	def _read_index(self) -> Dict[str, Dict[str, Any]]:
+		try:
+			return json.loads(self.indexpath.read_text())
+		except (FileNotFoundError, ValueError):
+			return {}
+
+	def blob(self, digest: str) -> Path:
+		"path of the blob for digest"
+		return self.root / digest
+
+	def __contains__(self, digest: str) -> bool:
+		return self.blob(digest).exists()
+
+	def _tmpname(self) -> Path:
+		"unique temporary file name inside the store, renamed into place once complete"
+		return self.root / f'.tmp-{os.getpid()}-{get_ident()}'
+
+	def _write(self, dst: Path, content: bytes, readonly: bool = False) -> None:
+		"atomically write content to dst, read-only if asked"
+		tmp = self._tmpname()
+		tmp.write_bytes(content)
+		if readonly:
+			self._seal(tmp)
+		os.replace(tmp, dst)
+
+	@staticmethod
+	def _seal(path: Path) -> None:
+		"make a blob read-only, so writes through its links fail"
+		if os.name != 'nt':
+			os.chmod(path, READONLY)
+
+	def put_bytes(self, content: bytes) -> str:
+		"add content to the store, return its digest"
+		digest = sha256(content).hexdigest()
+		if digest not in self:
+			self._write(self.blob(digest), content, readonly=True)
+		return digest
+
+	def put_file(self, path: Path, digest: Optional[str] = None) -> str:
+		"add a file's content to the store, return its digest"
+		digest = digest or file_digest(path)
+		if digest not in self:
+			tmp = self._tmpname()
+			shutil.copyfile(path, tmp)
+			self._seal(tmp)
+			os.replace(tmp, self.blob(digest))
+		return digest
+
+	def discard(self, digest: str) -> None:
+		"remove the blob for digest if its content no longer matches the digest"
+		if digest in self and file_digest(self.blob(digest)) != digest:
+			logger.warning("discarding damaged blob %s", digest)
+			self.blob(digest).unlink()
+
+	def link(self, digest: str, dst: Path) -> None:
+		"make dst a hard-link to (or writable copy of) the blob for digest, replacing any existing dst"
+		dst = Path(dst)
+		dst.parent.mkdir(parents=True, exist_ok=True)
+		tmp = dst.with_name(f'.{dst.name}.tmp')
+		if tmp.exists():
+			tmp.unlink()
+		try:
+			os.link(self.blob(digest), tmp)
+		except OSError:
+			shutil.copyfile(self.blob(digest), tmp)
+		os.replace(tmp, dst)
+
+	def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+		"validators recorded for url, if its content is still in the store"
+		entry = self.entries.get(url)
+		if entry is not None and entry.get('sha256') in self:
+			return entry
+		return None
+
+	def record(self, url: str, entry: Dict[str, Any]) -> None:
+		"remember validators and digest for url"
+		with self._lock:
+			self.entries[url] = {k: entry.get(k) for k in ('etag', 'last_modified', 'size', 'sha256')}
+
+	def save(self) -> None:
+		"merge index entries into the on-disk index, other approots may have added entries meanwhile"
+		with self._lock:
+			entries = {**self._read_index(), **self.entries}
+			self._write(self.indexpath, json.dumps(entries, indent=1, sort_keys=True).encode())
+			self.entries = entries
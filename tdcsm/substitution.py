@@ -0,0 +1,69 @@
+"Single-pass substitution of {name} tokens, from layers of values merged into one scope"
+
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+TOKEN = re.compile(r'\{([^{}]*)\}')
+
+Position = Tuple[int, int]
+MISSING = object()
+
+
+class Scope:
+	"""
+	Values of {name} tokens from layers in precedence order, each a name for the audit log, a dictionary
+	and the keys of it to skip. The layers are merged once, so text is then rewritten in a single pass over
+	its tokens. This is equivalent to replacing the tokens layer by layer, highest precedence first, and
+	key by key within a layer: a token takes its value from the first layer, and key, defining it, and the
+	tokens within that value are replaced by the keys and layers that come after it.
+	"""
+	def __init__(self, layers: Sequence[Tuple[str, Mapping[Any, Any], Iterable[Any]]] = ()):
+		merged = []
+		self.index: Dict[str, List[Tuple[int, int, str]]] = {}
+		for i, (name, values, skip) in enumerate(layers):
+			skip = set(skip)
+			values = {str(k): str(v) for k, v in values.items() if k not in skip}
+			for j, (k, v) in enumerate(values.items()):
+				self.index.setdefault(k, []).append((i, j, v))
+			merged.append((name, values))
+		self.layers: Tuple[Tuple[str, Dict[str, str]], ...] = tuple(merged)
+		self._resolved: Dict[Tuple[str, Position], Optional[Tuple[str, FrozenSet[Position]]]] = {}
+
+	def insert(self, position: int, name: str, values: Mapping[Any, Any], skip: Iterable[Any] = ()) -> 'Scope':
+		"a scope with one more layer, at position in the precedence order"
+		layers = [(n, v, ()) for n, v in self.layers]
+		layers.insert(position, (name, values, skip))
+		return Scope(layers)
+
+	def resolve(self, name: str, start: Position = (0, 0)) -> Optional[Tuple[str, FrozenSet[Position]]]:
+		"value of the {name} token, from the first layer and key at or after start, and the positions of the values used"
+		cached = self._resolved.get((name, start), MISSING)
+		if cached is not MISSING:
+			return cached
+		result = None
+		for i, j, v in self.index.get(name, ()):
+			if (i, j) >= start:
+				used = {(i, j)}
+				if '{' in v:
+					v, inner = self._expand(v, (i, j + 1))
+					used |= inner
+				result = v, frozenset(used)
+				break
+		self._resolved[(name, start)] = result
+		return result
+
+	def _expand(self, text: str, start: Position) -> Tuple[str, Set[Position]]:
+		used: Set[Position] = set()
+
+		def value(m: 're.Match[str]') -> str:
+			resolved = self.resolve(m.group(1), start)
+			if resolved is None:
+				return m.group(0)
+			used.update(resolved[1])
+			return resolved[0]
+
+		return TOKEN.sub(value, text), used
+
+	def substitute(self, text: str) -> Tuple[str, Set[Position]]:
+		"text with its tokens replaced, and the (layer, key) positions of the values used"
+		return self._expand(str(text), (0, 0))
@@ -2,15 +2,18 @@ import datetime as dt
 import errno
 import json
 import os
-import ntpath
 import re
 import shutil
 import pandas as pd
 import requests
-import yaml
 import csv
 import sys
 import subprocess
+import threading
+import hashlib
+import functools
+import contextlib
+import concurrent.futures
 from teradatasql import OperationalError
 from .dbutil import df_to_sql, sql_to_df
 import webbrowser
@@ -19,45 +22,106 @@ import webbrowser
 import tdcsm
 from pathlib import Path
 from .utils import Utils  # includes Logger class
+from .download import Downloader, DownloadIndex, DownloadJob
+from .store import ContentStore, file_digest
+from .refresh import Event, refresh_file
+from .verify import verify
+from .gittree import GitTreeSync, github_tree, local_tree
+from .ledger import VersionLedger, fingerprint, referenced
+from .configcache import ConfigCache, fill_secrets, secret_placeholders
+from .catalog import FilesetCatalog, load_yaml
+from .runplan import make_run_plan
+from .watch import diff
+from .substitution import TOKEN, Scope
+from .template import TemplateCache
+from .sqllexer import COMMAND, split_sql, statements
+
+
+# special commands prepare_sql replaces by a placeholder, and those it leaves for the run phases
+SPECIAL_COMMAND_PLACEHOLDER = '{{replaceMe:{cmdname}}}'
+RUN_PHASE_COMMANDS = ('save', 'load', 'call', 'vis', 'pptx')
 
 
 # todo create docstring for all methods
 
 
+class _Config:
+    """Configuration value of a tdcoa instance, loaded on first access if the instance is lazy."""
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if self.name not in obj.__dict__:
+            obj.load_config(**obj._config_args)
+        return obj.__dict__[self.name]
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.name] = value
+
+
+def needs_workspace(method):
+    """Decorator for phases that write to the approot, so a lazy instance prepares its workspace first, and
+    no phase runs while a background refresh of filesets.yaml may still swap in new filesets."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.prepare_workspace()
+        self.wait_for_filesets()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
 class tdcoa:
+    """Collects, runs and uploads the COA filesets of the source systems of one approot.
+
+    Thread safety: all state (configuration dictionaries, paths, the run plan, the run log) belongs to
+    the instance; class attributes only hold immutable defaults.  Instances for different approots can
+    therefore run their phases concurrently, from threads or from asyncio executors, in one process.
+    An instance itself is not meant to run two phases at the same time, drive it from one thread at a
+    time; its run log alone may be written from any thread.  Two instances sharing one approot share
+    its files, and must not run phases concurrently either."""
 
     # paths
     approot = '.'
     configpath = ''
     secretpath = ''
     systemspath = ''
-    filesetpath = ''
     outputpath = ''
     version = "0.4.1.6"
     skip_dbs = False    # skip ALL dbs connections / executions
     manual_run = False  # skip dbs executions in execute_run() but not upload_to_transcend()
                         # also skips /*{{save:}}*/ special command
 
-    # dictionaries
-    secrets = {}
-    filesets = {}
-    files = {}
-    systems = {}
-    folders = {}
-    substitutions = {}
-    transcend = {}
-    settings = {}
-
-    def __init__(self, approot='.', printlog=True, config='config.yaml', secrets='secrets.yaml', filesets='filesets.yaml', systems='source_systems.yaml', refresh_defaults=False, skip_dbs=False):
+    # dictionaries, loaded by reload_config() or on first access
+    secrets = _Config()
+    filesets = _Config()
+    systems = _Config()
+    folders = _Config()
+    substitutions = _Config()
+    transcend = _Config()
+    settings = _Config()
+    catalog = _Config()
+    filesetpath = _Config()
+    bteq_delim = _Config()
+    bteq_prefix = _Config()
+
+    def __init__(self, approot='.', printlog=True, config='config.yaml', secrets='secrets.yaml', filesets='filesets.yaml', systems='source_systems.yaml', refresh_defaults=False, skip_dbs=False, lazy=False, readonly=False, logsink=None):
+        """Loads the configuration from approot, creates missing folders and files, opens the run log and
+        refreshes filesets.yaml from github.  With lazy=True the configuration is only loaded when first
+        accessed, and the rest is deferred until a phase needs it, see open().  Run log messages are
+        printed, unless printlog is False, or passed to logsink (a callable taking one string) instead."""
         self.bufferlog = True
         self.printlog = printlog
+        self.outputpath = ''
         self.approot = os.path.join('.', approot)
         self.configpath = os.path.join(self.approot, config)
         self.secretpath = os.path.join(self.approot, secrets)
         self.systemspath = os.path.join(self.approot, systems)
         self.refresh_defaults = refresh_defaults
 
-        self.utils = Utils(self.version)  # utilities class. inherits Logger class
+        self.utils = Utils(self.version, sink=logsink)  # utilities class. inherits Logger class
+        self.utils.printlog = printlog
 
         self.utils.log('tdcoa started', header=True)
         self.utils.log('time', str(dt.datetime.now()))
@@ -70,16 +134,44 @@ class tdcoa:
         self.unique_id = dt.datetime.now().strftime("%m%d%Y%H%M")  # unique id to append to table
         self.motd_url = 'file://' + os.path.abspath(os.path.join(self.approot, 'motd.html'))
 
+        # raised from a background thread, when a refreshed filesets.yaml was swapped in
+        self.filesets_updated = Event('filesets updated')
+        self._filesets_refresh = None
+        self._filesets_lock = threading.RLock()  # held while systems and filesets are swapped or their selection changed
+        self._run_plan = None
+        self._templates = TemplateCache(SPECIAL_COMMAND_PLACEHOLDER, RUN_PHASE_COMMANDS)  # compiled .coa.sql files
+
+        self.lazy = lazy or readonly
+        self.readonly = readonly
+        self._config_args = dict(skip_dbs=skip_dbs)
+        self._pending_files = {}  # default files a lazy instance writes once its workspace is prepared
+        self._workspace = False
+
         # filesets.yaml is validated at download time
-        self.reload_config(skip_dbs=skip_dbs)
+        if not self.lazy:
+            self.reload_config(skip_dbs=skip_dbs)
+
+    @classmethod
+    def open(cls, approot='.', readonly=False, **kwargs):
+        """Returns a lazily constructed instance: the configuration is read on first access, and folders,
+        default files, the run log and the filesets.yaml refresh wait until a phase needs them.  A readonly
+        instance never writes to approot, its phases raise PermissionError instead.
 
-    def add_filesets_to_systems(self):
-        # read in fileset.yaml file to dictionary:
+        Examples:
+          from tdcsm.tdcoa import tdcoa
+          coa = tdcoa.open('customerABC', readonly=True)
+          [name for name, fs in coa.systems['SysA']['filesets'].items() if fs['active'] == 'True']"""
+        return cls(approot, lazy=True, readonly=readonly, **kwargs)
+
+    def add_filesets_to_systems(self, systems=None, filesets=None):
+        # add filesets missing from self.systems, or the systems given, as inactive:
+        systems = self.systems if systems is None else systems
+        filesets = self.filesets if filesets is None else filesets
         self.utils.log('adding all filesets to all systems (in memory, not disk)')
-        for sysname, sysobject in self.systems.items():  # iterate systems object...
+        for sysname, sysobject in systems.items():  # iterate systems object...
             i = 0
             if 'filesets' not in sysobject or type(sysobject['filesets']) != dict: sysobject['filesets']={}
-            for fsname, fsobject in self.filesets.items(): # iterate fileset master yaml...
+            for fsname, fsobject in filesets.items(): # iterate fileset master yaml...
                 if fsname not in sysobject['filesets']:
                     sysobject['filesets'][fsname] = {'active':False}  # add if missing
                     i+=1
@@ -113,6 +205,15 @@ class tdcoa:
           from tdcsm.tdcoa import tdcoa
           coa = tdcoa( config='configABC.yaml', secrets='passwords.yaml')
         """
+        self.load_config(config, secrets, systems, refresh_defaults, skip_dbs)
+        self._workspace = False
+        if not self.lazy:
+            self.prepare_workspace(skip_git)
+
+    def load_config(self, config='', secrets='', systems='', refresh_defaults=False, skip_dbs=False):
+        """Loads the configuration YAML files, without the side effects of reload_config(): missing default
+        files are only written, and folders created, by prepare_workspace().  Filesets are loaded from the
+        local filesets.yaml, if there is one yet."""
         # dictionaries
         self.secrets = {}
         self.filesets = {}
@@ -148,12 +249,13 @@ class tdcoa:
             elif startfile == 'source_systems.yaml': startfile_dst = systemspath
             else: startfile_dst = os.path.join(self.approot, startfile)
 
-            # remove files if "refresh defaults" is requested via __init__ param
-            if self.refresh_defaults and os.path.isfile(startfile_dst) and startfiles != 'secrets.yaml':
+            # remove files if "refresh defaults" is requested via __init__ param (replaced later, if lazy)
+            refresh = self.refresh_defaults and os.path.isfile(startfile_dst) and startfiles != 'secrets.yaml'
+            if refresh and not self.lazy:
                 os.remove(startfile_dst)
 
             # if file is missing:
-            if not os.path.isfile(startfile_dst):
+            if refresh or not os.path.isfile(startfile_dst):
                 self.utils.log(' MISSING FILE', startfile)
                 # check if the file is in the 0_override folder... if so, use that:
                 if os.path.isfile(startfile_ovr):
@@ -171,74 +273,113 @@ class tdcoa:
                     if startfile == 'config.yaml': startfilecontent = self.yaml_config()
                     if startfile == 'source_systems.yaml': startfilecontent = self.yaml_systems()
                     self.utils.log('   Adding from internal string (should not happen)')
-                with open(startfile_dst, 'w') as f2:
-                    f2.write(startfilecontent)
-
-        # load secrets.yaml
-        with open(secretpath, 'r') as fh:
-            secretstr = fh.read()
-        self.secrets = yaml.load(secretstr, Loader=yaml.FullLoader)['secrets']
+                if self.lazy:
+                    self._pending_files[startfile_dst] = startfilecontent
+                else:
+                    with open(startfile_dst, 'w') as f2:
+                        f2.write(startfilecontent)
+
+        # load secrets.yaml, config.yaml and source_systems.yaml, compiled unless a cached compilation
+        # of the same file contents exists.  The cached compilation holds placeholders for the secrets, so
+        # it depends on their names only, and the secret values are put in once it is loaded
+        secretstr = self.read_config_file(secretpath)
+        configstr = self.read_config_file(configpath)
+        systemsstr = self.read_config_file(systemspath)
+        self.secrets = load_yaml(secretstr)['secrets']
         self.utils.secrets = self.secrets  # update secrets attribute in logger
+        self.config_cache = ConfigCache(Path(self.approot, '.config_cache.pickle'), readonly=self.lazy)
+        cachekey = fingerprint(self.version, sorted(self.secrets), configstr, systemsstr, bool(skip_dbs))
+        compiled = self.config_cache.get('config', cachekey)
+        if compiled is None:
+            compiled = self.compile_config(self.secrets, configstr, systemsstr, skip_dbs)
+            self.config_cache.put('config', cachekey, compiled)
+            self.config_cache.save()
+        else:
+            self.utils.log('using compiled configuration', 'unchanged since last load')
+        compiled = fill_secrets(compiled, self.secrets)
+        self.substitutions = compiled['substitutions']
+        self._system_substitutions = dict(self.substitutions)  # as used for source_systems.yaml, before date values
+        self.transcend = compiled['transcend']
+        self.folders = compiled['folders']
+        self.settings = compiled['settings']
+        systems = compiled['systems']
 
-        # load config.yaml
-        with open(configpath, 'r') as fh:
-            configstr = fh.read()
-        configyaml = yaml.load(configstr, Loader=yaml.FullLoader)
-        configstr = self.utils.substitute(configstr, self.secrets, 'secrets')
-        configstr = self.utils.substitute(configstr, configyaml['substitutions'], 'config:substitutions')
-        configstr = self.utils.substitute(configstr, configyaml['folders'], 'config:folders')
-        configstr = self.utils.substitute(configstr, configyaml['settings'], 'config:settings')
-        configstr = self.utils.substitute(configstr, configyaml['transcend'], 'config:transcend')
-        configyaml = yaml.load(configstr, Loader=yaml.FullLoader)
+        if self.utils.validate_boolean(self.settings['skip_dbs'],'bool'):
+            self.utils.log('SKIP_DBS == TRUE, emulating all database connections', warning=True)
 
-        # load substitutions
-        self.utils.log('loading dictionary', 'substitutions')
-        self.substitutions = configyaml['substitutions']
-        with open(systemspath, 'r') as fh:
-            systemsstr = fh.read()
-        systemsstr = self.utils.substitute(systemsstr, self.secrets, 'secrets')
-        systemsstr = self.utils.substitute(systemsstr, self.substitutions, 'systems:substitutions')
-        systemsyaml = yaml.load(systemsstr, Loader=yaml.FullLoader)
+        # setup filesets.yaml
+        if 'localfilesets' not in self.settings:
+            self.settings['localfilesets'] = os.path.join(self.folders['download'], 'filesets.yaml')
+        self.filesetpath = os.path.join(self.approot, self.settings['localfilesets'])
 
-        # check and set Transcend connection information
-        self.utils.log('loading dictionary', 'transcend')
-        self.transcend = configyaml['transcend']
-        self.utils.check_setting(self.transcend,
-                           required_item_list=['username', 'password', 'host', 'logmech', 'db_coa', 'db_region', 'db_stg'],
-                           defaults=['{td_quicklook}', '{td_password}', 'tdprdcop3.td.teradata.com', 'TD2',
-                                     'adlste_coa', 'adlste_westcomm', 'adlste_coa_stg'])
-        self.transcend['connectionstring'] = 'teradatasql://%s:%s@%s/?logmech=%s' % (
-            self.transcend['username'],
-            self.transcend['password'],
-            self.transcend['host'],
-            self.transcend['logmech'])
+        # load filesets dictionary (active only), prepare_workspace() downloads filesets.yaml if missing
+        self.utils.log('loading dictionary', 'filesets (active only)')
+        if os.path.isfile(self.filesetpath):
+            self.filesets.update(self.read_filesets())
+        self.catalog = FilesetCatalog(self.filesets)
 
-        # check and set required Folders
-        self.utils.log('loading dictionary', 'folders')
-        self.folders = configyaml['folders']
-        self.utils.check_setting(self.folders, required_item_list=['download', 'sql', 'run', 'output', 'override'],
-                           defaults=['1_download', '2_sql_store', '3_ready_to_run', '4_output', '0_override'])
+        # load systems (no longer active only)
+        self.utils.log('loading system dictionaries')
+        for sysname, sysobject in systems.items():
+            self.systems[sysname] = sysobject
+            self.utils.log('LOADING SYSTEM', sysname)
 
-        # check and set required Settings
-        self.utils.log('loading dictionary', 'settings')
-        self.settings = configyaml['settings']
-        if skip_dbs: self.settings['skip_dbs'] = 'True'
-        self.utils.check_setting(self.settings,
-                           required_item_list=['githost', 'gitfileset', 'gitmotd', 'localfilesets',
-                                               'run_non_fileset_folders', 'gui_show_dev_filesets',
-                                                'skip_dbs'],
-                           defaults=['https://raw.githubusercontent.com/tdcoa/sql/master/',
-                                     'filesets.yaml',
-                                     'motd.txt',
-                                     '{download}/filesets.yaml',
-                                     'True',
-                                     'False',
-                                     'python','False'])
+        # add filesets to systems, in memory only:
+        self.add_filesets_to_systems()
 
-        if self.utils.validate_boolean(self.settings['skip_dbs'],'bool'):
-            self.utils.log('SKIP_DBS == TRUE, emulating all database connections', warning=True)
+        # not sure this is ever explicitly re-set
+        self.configpath = configpath
+        self.secretpath = secretpath
+        self.systemspath = systemspath
+
+        self.bteq_delim = '|~|'
+        bp=[]
+        bp.append('---------------------------------------------------------------------')
+        bp.append('--- add credentials below, all else should run & export automatically')
+        bp.append('.SET MAXERROR 1;')
+        bp.append('.SET SESSION TRANSACTION BTET;')
+        bp.append('.logmech TD2; --- example options: NTLM, KRB5, LDAP, TD2')
+        bp.append('.LOGON host/username,password;')
+        bp.append('.TITLEDASHES off;')
+        bp.append(".SEPARATOR '%s';" %self.bteq_delim)
+        bp.append(".SET NULL AS '';")
+        bp.append('.WIDTH 32000;')
+        bp.append('.RETLIMIT * *;')
+        bp.append('.SHOW CONTROLS;')
+        bp.append('---------------------------------------------------------------------')
+        self.bteq_prefix = '\n'.join(bp)
+
+        self.substitutions['YYYYMMDD'] = dt.datetime.today().strftime('%Y%m%d')
+        self.substitutions['YYYYMM'] = dt.datetime.today().strftime('%Y%m')
+
+        self.utils.log('done!')
+        self.utils.log('time', str(dt.datetime.now()))
 
-        self.filesetpath = self.settings['localfilesets']
+    def read_config_file(self, path):
+        """Returns the content of a configuration file, or of the default it is about to be created from."""
+        if path in self._pending_files:
+            return self._pending_files[path]
+        with open(path, 'r') as fh:
+            return fh.read()
+
+    def prepare_workspace(self, skip_git=False):
+        """Writes missing default files, creates missing folders, opens the run log in the "run" folder and
+        refreshes filesets.yaml from github.  reload_config() does so right away, a lazy instance once the
+        first phase runs.  Raises PermissionError for an instance opened readonly."""
+        if self._workspace:
+            return
+        if self.readonly:
+            raise PermissionError('tdcoa was opened readonly for %s' % self.approot)
+        if 'settings' not in self.__dict__:
+            self.load_config(**self._config_args)
+
+        for path, content in self._pending_files.items():
+            self.utils.log('writing default file', path)
+            with open(path, 'w') as fh:
+                fh.write(content)
+        self._pending_files = {}
+        self.config_cache.readonly = False
+        self.config_cache.save()
 
         # create missing folders
         for nm, subfo in self.folders.items():
@@ -254,11 +395,6 @@ class tdcoa:
         self.utils.bufferlogs = False
         self.utils.log('unbuffering log to "run" folder')
 
-        # setup filesets.yaml
-        if 'localfilesets' not in self.settings:
-            self.settings['localfilesets'] = os.path.join(self.folders['download'], 'filesets.yaml')
-        self.filesetpath = os.path.join(self.approot, self.settings['localfilesets'])
-
         githost = self.settings['githost']
         if githost[-1:] != '/':
             githost = githost + '/'
@@ -273,22 +409,16 @@ class tdcoa:
             self.utils.log('setting found in config.yaml', 'skip_git: "True"')
 
         # skip git download if requested
+        missing = not os.path.isfile(self.filesetpath)
         if skip_git:
             self.utils.log('filesets.yaml download skipped, using cached local copy', warning=True)
+        elif not missing:
+            # stale-while-revalidate: continue with the cached copy, and swap in any update once it arrives
+            self.utils.log('using cached filesets.yaml, refreshing in the background')
+            self.refresh_filesets(giturl)
         else:
-            try:
-                filecontent = requests.get(giturl).content.decode('utf-8')
-                savepath = os.path.join(self.approot, self.settings['localfilesets'])
-                self.utils.log('saving filesets.yaml', savepath)
-                with open(savepath, 'w') as fh:
-                    fh.write(filecontent)
-                    self.utils.log('filesets.yaml saved')
-            except Exception as ex:
-                self.utils.log('filesets.yaml could not be downloaded, using cached local copy', warning=True)
-                # self.utils.log('Error: %s' %str(ex), indent=2)
-
-        # load filesets dictionary (active only)
-        self.utils.log('loading dictionary', 'filesets (active only)')
+            self.refresh_filesets(giturl, wait=True)
+
         if not os.path.isfile(self.filesetpath):
             self.utils.log('the filesets.yaml file is not found at the expected location: \n\t%s\n' %self.filesetpath, error=True)
             self.utils.log('this might be caused by a network disallowing downloads from GitHub.com, or being offline entirely')
@@ -301,31 +431,180 @@ class tdcoa:
             self.utils.log('  5) plan to manually refresh the filesets.yaml file periodically\n\n')
             self.utils.log('Finally Note: all other fileset collateral is likewise downloaded from github, so you are likely to hit similar errors during the Download phase.\n\n')
 
+        elif missing:
+            # filesets.yaml was only just downloaded
+            self.filesets.update(self.read_filesets())
+            self.catalog = FilesetCatalog(self.filesets)
+            self.add_filesets_to_systems()
+
+        self._workspace = True
+
+    def config_files(self):
+        """Returns the paths of the configuration files by name: config, secrets, systems and filesets."""
+        return {'config': self.configpath, 'secrets': self.secretpath, 'systems': self.systemspath,
+                'filesets': self.filesetpath}
+
+    def reload_changed(self, changed, skip_dbs=False, keep_selection=True):
+        """Reloads only the configuration files named in changed (config, secrets, systems, filesets), for
+        instance as reported by a FileWatcher on config_files().  A change to config or secrets, which can
+        affect every other value, reloads everything except the filesets refresh from github; a change to
+        systems or filesets only reparses that file.  With keep_selection, the active flags of systems and
+        their filesets are kept as they are in memory, and new systems and filesets start inactive.
+
+        Returns the DictDiff of the systems and of the filesets dictionaries, by name."""
+        self.utils.log('reload_changed started', ', '.join(sorted(changed)), header=True)
+        old_systems, old_filesets = self.systems, self.filesets
+        selection = self.get_selection()
+
+        if 'config' in changed or 'secrets' in changed:
+            self.reload_config(skip_dbs=skip_dbs, skip_git=True)
         else:
-            with open(self.filesetpath, 'r') as fh:
-                filesetstr = fh.read()
-            filesetyaml = yaml.load(filesetstr, Loader=yaml.FullLoader)
-            if not filesetyaml:
-                msg = 'filesets.yaml appears empty, please make sure it contains valid yaml configuration.\n'
-                msg = msg + 'when in doubt: delete the existing filesets.yaml file from the "download" folder,\n'
-                msg = msg + 'and run the process again.  When missing, it will create a default file of\n'
-                msg = msg + 'the correct format.  When executing the "download_sql" command, the program\n'
-                msg = msg + 'will also re-download the latest filesets.yaml from github.'
-                self.utils.log(msg, error=True)
-                raise IOError(msg)
-            for setname, setobject in filesetyaml.items():
-                if str(setobject['active']).strip().lower() == 'true':
-                    self.filesets.update({setname: setobject})
+            if 'systems' in changed:
+                with open(self.systemspath, 'r') as fh:
+                    systemsstr = fh.read()
+                self.systems = self.compile_systems(systemsstr, self.secrets, self._system_substitutions)
+            if 'filesets' in changed and os.path.isfile(self.filesetpath):
+                self.filesets = self.read_filesets()
+                self.catalog = FilesetCatalog(self.filesets)
+            if self.systems is not old_systems or self.filesets is not old_filesets:
+                self.add_filesets_to_systems()
+
+        if keep_selection:
+            self.set_selection(selection)
+
+        # compared after the selection is restored, so only changes to the files themselves show
+        diffs = {'systems': diff(old_systems, self.systems), 'filesets': diff(old_filesets, self.filesets)}
+        for name, d in diffs.items():
+            self.utils.log('%s added' % name, ', '.join(sorted(d.added)) or 'none')
+            self.utils.log('%s removed' % name, ', '.join(sorted(d.removed)) or 'none')
+            self.utils.log('%s changed' % name, ', '.join(sorted(d.changed)) or 'none')
+        return diffs
+
+    def get_selection(self):
+        """Returns the active flags of all systems and of their filesets, as {system: (active, {fileset: active})}."""
+        return {sysname: (sysobject.get('active'), {k: v.get('active') for k, v in sysobject.get('filesets', {}).items()})
+                for sysname, sysobject in self.systems.items()}
+
+    def set_selection(self, selection):
+        """Sets the active flags of systems and their filesets as returned by get_selection(), systems
+        and filesets missing from selection are made inactive."""
+        with self._filesets_lock:
+            for sysname, sysobject in self.systems.items():
+                active, filesets = selection.get(sysname, ('False', {}))
+                sysobject['active'] = active
+                for setname, setobject in sysobject.get('filesets', {}).items():
+                    setobject['active'] = filesets.get(setname, 'False')
+
+    @contextlib.contextmanager
+    def selection(self, systems=None, filesets=None):
+        """Narrows the phases run inside the with block to the named systems and filesets, of those that
+        are active; None keeps all of them.  The active flags are restored when the block ends.  Raises
+        ValueError for names that are not defined.
 
-        # load systems (no longer active only)
-        self.utils.log('loading system dictionaries')
-        for sysname, sysobject in systemsyaml['systems'].items():
-            # if self.utils.dict_active(sysobject, sysname): #<--- no more, really messed up lots of UI work before
-            self.systems[sysname] = sysobject
-            self.utils.log('LOADING SYSTEM', sysname)
+        Examples:
+          with coa.selection(systems=['SysA'], filesets=['dbql_core']):
+              coa.prepare_sql()"""
+        unknown = sorted(set(systems or []) - set(self.systems)) + sorted(set(filesets or []) - set(self.filesets))
+        if unknown:
+            raise ValueError('unknown systems or filesets: %s' % ', '.join(unknown))
+        saved = self.get_selection()
+        try:
+            with self._filesets_lock:
+                for sysname, sysobject in self.systems.items():
+                    if systems is not None and sysname not in systems:
+                        sysobject['active'] = 'False'
+                    for setname, setobject in sysobject.get('filesets', {}).items():
+                        if filesets is not None and setname not in filesets:
+                            setobject['active'] = 'False'
+            self.utils.log('selected systems', ', '.join(systems) if systems is not None else 'all active')
+            self.utils.log('selected filesets', ', '.join(filesets) if filesets is not None else 'all active')
+            yield self
+        finally:
+            self.set_selection(saved)
+
+    def compile_config(self, secrets, configstr, systemsstr, skip_dbs=False):
+        """Substitutes and parses the content of config.yaml and source_systems.yaml, and completes missing
+        settings with their defaults.  Returns the resulting substitutions, transcend, folders, settings and
+        systems dictionaries, ready to be cached: secrets are substituted as placeholders, which fill_secrets()
+        replaces by their values."""
+        secrets = secret_placeholders(secrets)
+
+        # load config.yaml
+        configyaml = load_yaml(configstr)
+        configstr = self.utils.substitute_scope(configstr, Scope([
+            ('secrets', secrets, []),
+            ('config:substitutions', configyaml['substitutions'], []),
+            ('config:folders', configyaml['folders'], []),
+            ('config:settings', configyaml['settings'], []),
+            ('config:transcend', configyaml['transcend'], [])]))
+        configyaml = load_yaml(configstr)
+
+        # load substitutions
+        self.utils.log('loading dictionary', 'substitutions')
+        substitutions = configyaml['substitutions']
+        systems = self.compile_systems(systemsstr, secrets, substitutions)
 
+        # check and set Transcend connection information
+        self.utils.log('loading dictionary', 'transcend')
+        transcend = configyaml['transcend']
+        self.utils.check_setting(transcend,
+                           required_item_list=['username', 'password', 'host', 'logmech', 'db_coa', 'db_region', 'db_stg'],
+                           defaults=['{td_quicklook}', '{td_password}', 'tdprdcop3.td.teradata.com', 'TD2',
+                                     'adlste_coa', 'adlste_westcomm', 'adlste_coa_stg'])
+        transcend['connectionstring'] = 'teradatasql://%s:%s@%s/?logmech=%s' % (
+            transcend['username'],
+            transcend['password'],
+            transcend['host'],
+            transcend['logmech'])
+
+        # check and set required Folders
+        self.utils.log('loading dictionary', 'folders')
+        folders = configyaml['folders']
+        self.utils.check_setting(folders, required_item_list=['download', 'sql', 'run', 'output', 'override'],
+                           defaults=['1_download', '2_sql_store', '3_ready_to_run', '4_output', '0_override'])
+
+        # check and set required Settings
+        self.utils.log('loading dictionary', 'settings')
+        settings = configyaml['settings']
+        if skip_dbs: settings['skip_dbs'] = 'True'
+        self.utils.check_setting(settings,
+                           required_item_list=['githost', 'gitfileset', 'gitmotd', 'localfilesets',
+                                               'run_non_fileset_folders', 'gui_show_dev_filesets',
+                                                'skip_dbs', 'max_download_workers', 'cas_store',
+                                                'download_retries', 'download_timeout', 'download_backoff',
+                                                'filesets_refresh_timeout', 'sync_mode', 'gittree_repo',
+                                                'skip_unchanged_filesets'],
+                           defaults=['https://raw.githubusercontent.com/tdcoa/sql/master/',
+                                     'filesets.yaml',
+                                     'motd.txt',
+                                     '{download}/filesets.yaml',
+                                     'True',
+                                     'False',
+                                     'False',
+                                     '8',
+                                     '',
+                                     '3',
+                                     '30',
+                                     '1.0',
+                                     '5',
+                                     'http',
+                                     '',
+                                     'False'])
+
+        return {'substitutions': substitutions, 'transcend': transcend,
+                'folders': folders, 'settings': settings, 'systems': systems}
+
+    def compile_systems(self, systemsstr, secrets, substitutions):
+        """Parses and substitutes the content of source_systems.yaml, and completes missing system settings
+        with their defaults.  Returns the systems dictionary."""
+        systemsstr = self.utils.substitute_scope(systemsstr, Scope([
+            ('secrets', secrets, []),
+            ('systems:substitutions', substitutions, [])]))
+        systems = load_yaml(systemsstr)['systems']
+        for sysname, sysobject in systems.items():
+            # if self.utils.dict_active(sysobject, sysname): #<--- no more, really messed up lots of UI work before
             # todo add default dbsversion and collection
-            self.utils.check_setting(self.systems[sysname],
+            self.utils.check_setting(sysobject,
                                required_item_list=['active', 'siteid', 'use', 'host',
                                                    'username', 'password',
                                                    'logmech', 'driver', 'encryption','dbsversion','collection',
@@ -343,38 +622,96 @@ class tdcoa:
                                                                           sysobject['password'],
                                                                           sysobject['host'],
                                                                           logmech)
-
-        # add filesets to systems, in memory only:
-        self.add_filesets_to_systems()
-
-        # not sure this is ever explicitly re-set
-        self.configpath = configpath
-        self.secretpath = secretpath
-        self.systemspath = systemspath
-
-        self.bteq_delim = '|~|'
-        bp=[]
-        bp.append('---------------------------------------------------------------------')
-        bp.append('--- add credentials below, all else should run & export automatically')
-        bp.append('.SET MAXERROR 1;')
-        bp.append('.SET SESSION TRANSACTION BTET;')
-        bp.append('.logmech TD2; --- example options: NTLM, KRB5, LDAP, TD2')
-        bp.append('.LOGON host/username,password;')
-        bp.append('.TITLEDASHES off;')
-        bp.append(".SEPARATOR '%s';" %self.bteq_delim)
-        bp.append(".SET NULL AS '';")
-        bp.append('.WIDTH 32000;')
-        bp.append('.RETLIMIT * *;')
-        bp.append('.SHOW CONTROLS;')
-        bp.append('---------------------------------------------------------------------')
-        self.bteq_prefix = '\n'.join(bp)
-
-        self.substitutions['YYYYMMDD'] = dt.datetime.today().strftime('%Y%m%d')
-        self.substitutions['YYYYMM'] = dt.datetime.today().strftime('%Y%m')
-
-        self.utils.log('done!')
-        self.utils.log('time', str(dt.datetime.now()))
-
+        return systems
+
+    def read_filesets(self):
+        """Returns the active filesets defined in the local filesets.yaml."""
+        with open(self.filesetpath, 'r') as fh:
+            filesetstr = fh.read()
+        cachekey = fingerprint(filesetstr)
+        filesets = self.config_cache.get('filesets', cachekey)
+        if filesets is not None:
+            return filesets
+        filesetyaml = load_yaml(filesetstr)
+        if not filesetyaml:
+            msg = 'filesets.yaml appears empty, please make sure it contains valid yaml configuration.\n'
+            msg = msg + 'when in doubt: delete the existing filesets.yaml file from the "download" folder,\n'
+            msg = msg + 'and run the process again.  When missing, it will create a default file of\n'
+            msg = msg + 'the correct format.  When executing the "download_sql" command, the program\n'
+            msg = msg + 'will also re-download the latest filesets.yaml from github.'
+            self.utils.log(msg, error=True)
+            raise IOError(msg)
+        filesets = {}
+        for setname, setobject in filesetyaml.items():
+            if str(setobject['active']).strip().lower() == 'true':
+                filesets[setname] = setobject
+        self.config_cache.put('filesets', cachekey, filesets)
+        self.config_cache.save()
+        return filesets
+
+    def refresh_filesets(self, giturl, wait=False):
+        """Revalidates the local filesets.yaml against giturl in a background thread, with a short timeout.
+        A changed filesets.yaml is saved atomically, swapped into self.filesets and announced through the
+        filesets_updated event.  With wait=True, returns once the refresh is done; phases always wait for it."""
+        if self._filesets_refresh is None or not self._filesets_refresh.is_alive():
+            self._filesets_refresh = threading.Thread(target=self._refresh_filesets, args=(giturl, wait),
+                                                      name='tdcsm-filesets-refresh', daemon=True)
+            self._filesets_refresh.start()
+        if wait:
+            self.wait_for_filesets()
+
+    def wait_for_filesets(self):
+        """Waits for a background refresh of filesets.yaml, if one is in progress."""
+        if self._filesets_refresh is not None and self._filesets_refresh is not threading.current_thread():
+            self._filesets_refresh.join()
+
+    def _refresh_filesets(self, giturl, initial=False):
+        job = DownloadJob(giturl, Path(self.filesetpath))
+        # without a cached copy, filesets.yaml is required: use the regular retries and timeout
+        options = {} if initial else dict(retries=0, timeout=float(self.settings['filesets_refresh_timeout']))
+        try:
+            with self.downloader(**options) as downloader:
+                changed = refresh_file(downloader, job, self.download_index(), validate=self._validate_filesets)
+        except Exception as ex:
+            self.utils.log('filesets.yaml could not be refreshed, using cached local copy (%s)' % str(ex), warning=True)
+            return
+        if not changed:
+            self.utils.log('filesets.yaml is up to date')
+            return
+        self.utils.log('filesets.yaml saved', self.filesetpath)
+
+        if not initial:
+            # swap in the new definitions, the cached copy was loaded by reload_config meanwhile: new
+            # dictionaries are built aside, so readers of self.systems never see them half updated, and the
+            # systems are copied under the lock, so their current selection carries over
+            filesets = self.read_filesets()
+            catalog = FilesetCatalog(filesets)
+            with self._filesets_lock:
+                systems = {sysname: dict(sysobject, filesets=dict(sysobject['filesets']) if isinstance(sysobject.get('filesets'), dict) else {})
+                           for sysname, sysobject in self.systems.items()}
+                self.add_filesets_to_systems(systems, filesets)
+                self.filesets, self.catalog, self.systems = filesets, catalog, systems
+            self.utils.log('filesets updated', '%i active filesets' % len(self.filesets))
+            self.filesets_updated.emit(self)
+
+    @staticmethod
+    def _validate_filesets(content):
+        if not load_yaml(content):
+            raise IOError('downloaded filesets.yaml is empty')
+
+    def fileset_ledger(self):
+        """Returns the ledger of fileset versions last downloaded and prepared, which lives next to filesets.yaml."""
+        return VersionLedger(Path(os.path.dirname(self.filesetpath), 'fileset_versions.json'))
+
+    def incremental(self):
+        """True if filesets whose fileset_version and inputs are unchanged may skip download and prepare."""
+        return str(self.settings['skip_unchanged_filesets']).strip().lower() == 'true'
+
+    def download_index(self):
+        """Returns the download cache index, which lives next to filesets.yaml."""
+        return DownloadIndex(Path(os.path.dirname(self.filesetpath), 'download_index.json'))
+
+    @needs_workspace
     def download_files(self, motd=True):
         self.utils.log('download_files started', header=True)
         self.utils.log('time', str(dt.datetime.now()))
@@ -383,6 +720,19 @@ class tdcoa:
             githost = githost + '/'
         self.utils.log('githost', githost)
 
+        max_workers = int(self.settings['max_download_workers'])
+        self.utils.log('max download workers', str(max_workers))
+        self.utils.log('retries per file', self.settings['download_retries'])
+        self.utils.log('request timeout (seconds)', self.settings['download_timeout'])
+
+        # download cache index is used to revalidate previously downloaded files
+        index = self.download_index()
+        self.utils.log('download cache index', str(index.path))
+        store = self.content_store()
+        downloader = self.downloader(max_workers, index=index, store=store)
+        if index.journaled:
+            self.utils.log('resuming unfinished download, %i files already completed' % len(index.journaled))
+
         filesetcontent = ''
 
         # download any control files first (motd.html, etc.)
@@ -390,99 +740,239 @@ class tdcoa:
         giturl = githost + self.settings['gitmotd']
         self.utils.log('downloading "motd.html" from github')
         self.utils.log('  requesting url', giturl)
-        filecontent = requests.get(giturl).text
-        with open(os.path.join(self.approot, 'motd.html'), 'w') as fh:
-            fh.write(filecontent)
+        result = downloader.fetch(DownloadJob(giturl, Path(self.approot, 'motd.html')))
+        if result.not_modified:
+            self.utils.log('  motd.html not modified, keeping cached copy')
+        elif not result.ok:
+            self.utils.log('motd.html could not be downloaded, status code', str(result.status_code), warning=True)
 
         # open motd.html in browser
         self.motd_url = 'file://' + os.path.abspath(os.path.join(self.approot, 'motd.html'))
         if motd: webbrowser.open(self.motd_url)
 
-        # delete all pre-existing download folders
-        # Commented the below code, in order to make the script download only if the files doesn't exist
-        self.utils.recursively_delete_subfolders(os.path.join(self.approot, self.folders['download']))
-
         # set proper githost for filesets
+        repohost = githost
         githost = githost + 'filesets/'
 
-        # iterate all active systems.filesets:
-        for sysname, sysobject in self.systems.items():
-            if self.utils.dict_active(sysobject, sysname, also_contains_key='filesets'):  # must be ACTIVE (this test pre-dated systems.active change)
-                self.utils.log('\nINTERROGATING SYSTEM', sysname)
-
-                # get all filesets as defined in each system:
-                for sys_setname, sys_setobject in sysobject['filesets'].items():
-                    if self.utils.dict_active(sys_setobject, sys_setname):
-                        self.utils.log('  found fileset', sys_setname)
-                        self.utils.log('  cross-referencing with filesets.yaml...')
-
-                        # cross-reference to filesets in filesets.yaml
-                        if sys_setname in self.filesets:
-                            setname = sys_setname
-                            setobject = self.filesets[setname]
-
-                            if self.utils.dict_active(setobject, setname, also_contains_key='files'):
-                                self.utils.log('  FILE SET FOUND', setname + ' [' + str(len(setobject['files'])) + ']')
-                                savepath = os.path.join(self.approot, self.folders['download'], setname)
-                                if not os.path.exists(savepath):
-                                    os.mkdir(savepath)
-
-                                # download each file in the fileset
-                                for file_key, file_dict in setobject['files'].items():
-                                    self.utils.log('   ' + ('-' * 50))
-                                    self.utils.log('   ' + file_key)
-
-                                    # check for matching dbversion
-                                    dbversion_match = True
-                                    if 'dbsversion' in file_dict.keys():
-                                        if sysobject['dbsversion'] in file_dict['dbsversion']:
-                                            dbversion_match = True
-                                        else:
-                                            dbversion_match = False
-
-                                    # check for matching collection
-                                    collection_match = True
-                                    if 'collection' in file_dict.keys():
-                                        if sysobject['collection'] in file_dict['collection']:
-                                            collection_match = True
-                                        else:
-                                            collection_match = False
-
-                                    # only download file if dbsversion and collection match
-
-                                    savefile = os.path.join(savepath, file_dict['gitfile'].split('/')[-1])  # save path
-                                    # Skip download if file already exists
-                                    file_exists = os.path.exists(savefile)
-                                    print(str(savefile))
-                                    if file_exists == True:
-                                        self.utils.log('  File %s already exists in the download folder, so skipping download' % str(file_dict['gitfile'].split('/')[-1]))
-                                        continue
-                                    if dbversion_match and collection_match:
-                                        self.utils.log('   downloading file', file_dict['gitfile'])
-                                        giturl = githost + file_dict['gitfile']
-                                        self.utils.log('    %s' % giturl)
-                                        response = requests.get(giturl)
-                                        if response.status_code == 200:
-                                            filecontent = response.content
-                                            self.utils.log('    saving file to', savefile)
-                                            with open(savefile, 'wb') as fh:
-                                                fh.write(filecontent)
-                                        else:
-                                            self.utils.log('Status Code: ' + str(
-                                                response.status_code) + '\nText: ' + response.text, error=True)
-                                            exit()
-
-                                    else:
-                                        self.utils.log('   diff dbsversion or collection, skipping')
-
-                                self.utils.log('   ' + ('-' * 50) + '\n')
-
-                        else:  # not found
-                            self.utils.log(' not found in filesets.yaml', sys_setname)
+        # plan all files required by active systems, each shared file is listed (and downloaded) once
+        plan = self.download_plan()
+
+        # collect all files to download, keyed by save path
+        jobs = {}
+        jobsets = {}  # fileset name of each job, by Path as DownloadJob.savefile (which drops a leading ./)
+        setfiles = {}  # planned (gitfile, sha256) of each fileset
+        savepaths = set()
+        for planned in plan:
+            savepath = os.path.join(self.approot, self.folders['download'], planned.fileset)
+            if savepath not in savepaths:
+                self.utils.log('\nFILE SET', planned.fileset)
+                if not os.path.exists(savepath):
+                    os.mkdir(savepath)
+                savepaths.add(savepath)
+
+            savefile = os.path.join(savepath, planned.filename)  # save path
+            if savefile in jobs:
+                self.utils.log('  File %s already queued for download, so skipping' % planned.filename)
+                continue
+            giturl = githost + planned.gitfile
+            self.utils.log('   %s' % giturl, 'required by %i system(s)' % len(planned.systems))
+            jobs[savefile] = DownloadJob(giturl, Path(savefile), planned.sha256)
+            jobsets[Path(savefile)] = planned.fileset
+            setfiles.setdefault(planned.fileset, []).append((planned.gitfile, planned.sha256))
+
+        # filesets whose version and planned files are unchanged since their last complete download are skipped
+        ledger = self.fileset_ledger()
+        setkeys = {setname: (self.filesets[setname].get('fileset_version'), fingerprint(sorted(files)))
+                   for setname, files in setfiles.items()}
+        unchanged = set()
+        if self.incremental():
+            for setname, (version, key) in setkeys.items():
+                if ledger.current('download', setname, version, key) and \
+                        all(os.path.isfile(f) for f, n in jobsets.items() if n == setname):
+                    self.utils.log('fileset %s version %s unchanged, skipping' % (setname, version))
+                    unchanged.add(setname)
+
+        # remove files no longer required by any active system (replaces purging the download folder)
+        for savepath in sorted(savepaths):
+            for downloaded_file in sorted(os.listdir(savepath)):
+                savefile = os.path.join(savepath, downloaded_file)
+                if os.path.isfile(savefile) and savefile not in jobs:
+                    self.utils.log('  removing stale file', savefile)
+                    os.remove(savefile)
+                    index.forget(Path(savefile))
+
+        # download all queued files concurrently, logging results in queued order
+        runjobs = [job for savefile, job in jobs.items() if jobsets[Path(savefile)] not in unchanged]
+        self.utils.log('\ndownloading %i files using up to %i workers' % (len(runjobs), max_workers))
+        downloaded = not_modified = resumed = transferred = retried = 0
+        failures = []
+        with downloader:
+            engine = downloader
+            if self.settings['sync_mode'].strip().lower() == 'gittree':
+                engine = self.gittree_sync(repohost, downloader, index, store, max_workers) or downloader
+            for result in engine.run(runjobs):
+                if result.attempts > 1:
+                    retried += 1
+                if result.resumed:
+                    self.utils.log('    completed by previous run, keeping', str(result.job.savefile))
+                    resumed += 1
+                elif result.not_modified:
+                    self.utils.log('    not modified, keeping', str(result.job.savefile))
+                    not_modified += 1
+                elif result.ok:
+                    self.utils.log('    saving file to', str(result.job.savefile))
+                    downloaded += 1
+                    transferred += result.size
+                else:
+                    self.utils.log('    download failed after %i attempts' % result.attempts, result.job.url, warning=True)
+                    failures.append(result)
+        index.save()
+        if store is not None: store.save()
+
+        failedsets = {jobsets[Path(result.job.savefile)] for result in failures}
+        for setname, (version, key) in setkeys.items():
+            if setname in failedsets:
+                ledger.forget('download', setname)
+            else:
+                ledger.record('download', setname, version, key)
+        ledger.save()
+
+        if unchanged: self.utils.log('filesets unchanged', str(len(unchanged)))
+        self.utils.log('files downloaded', str(downloaded))
+        self.utils.log('files not modified', str(not_modified))
+        if resumed: self.utils.log('files resumed', str(resumed))
+        self.utils.log('files retried', str(retried))
+        self.utils.log('bytes transferred', str(transferred))
+
+        if failures:
+            msg = '%i of %i files could not be downloaded:\n' % (len(failures), len(runjobs))
+            for result in failures:
+                reason = ('status code %i' % result.status_code) if result.status_code else result.text
+                msg += '  %s (%s)\n' % (result.job.url, reason)
+            msg += 'files downloaded so far are kept, run the download again to resume with the failed files'
+            self.utils.log(msg, error=True)
+        else:
+            index.clear_journal()
 
         self.utils.log('\ndone!')
         self.utils.log('time', str(dt.datetime.now()))
 
+    @needs_workspace
+    def verify_downloads(self, refetch=True):
+        """Verifies files in the download folder against the sha256 published in filesets.yaml or, for files
+        without one, the sha256 recorded when the file was downloaded.  Files are hashed in parallel, and
+        mismatched or missing files are downloaded again if refetch is True.  Returns the list of files
+        that (still) do not match."""
+        self.utils.log('verify_downloads started', header=True)
+        self.utils.log('time', str(dt.datetime.now()))
+        githost = self.settings['githost']
+        if githost[-1:] != '/':
+            githost = githost + '/'
+        githost = githost + 'filesets/'
+
+        max_workers = int(self.settings['max_download_workers'])
+        index = self.download_index()
+        jobs, expected = {}, {}
+        unverifiable = 0
+        for planned in self.download_plan():
+            savefile = Path(self.approot, self.folders['download'], planned.fileset, planned.filename)
+            if savefile in jobs:
+                continue
+            job = DownloadJob(githost + planned.gitfile, savefile, planned.sha256)
+            digest = planned.sha256 or index.entries.get(job.url, {}).get('sha256')
+            if digest is None:
+                unverifiable += 1
+                continue
+            jobs[savefile], expected[savefile] = job, digest
+
+        self.utils.log('verifying %i files using up to %i workers' % (len(jobs), max_workers))
+        if unverifiable:
+            self.utils.log('files without a known sha256, not verified', str(unverifiable))
+        mismatched = []
+        for result in verify(expected.items(), max_workers):
+            if not result.ok:
+                self.utils.log('  %s' % ('missing' if result.actual is None else 'sha256 mismatch'), str(result.path), warning=True)
+                mismatched.append(result.path)
+        self.utils.log('files verified', str(len(expected) - len(mismatched)))
+        self.utils.log('files mismatched', str(len(mismatched)))
+
+        if mismatched and refetch:
+            self.utils.log('\ndownloading %i mismatched files again' % len(mismatched))
+            store = self.content_store()
+            for path in mismatched:
+                index.forget(path)  # request the whole file, not a revalidation
+                if store is not None:
+                    store.discard(expected[path])  # a damaged file may be a link to a (then equally damaged) blob
+            failed = []
+            with self.downloader(max_workers, index=index, store=store) as downloader:
+                for result in downloader.run(jobs[p] for p in mismatched):
+                    if result.ok:
+                        self.utils.log('    saving file to', str(result.job.savefile))
+                    else:
+                        reason = ('status code %i' % result.status_code) if result.status_code else result.text
+                        self.utils.log('    download failed', '%s (%s)' % (result.job.url, reason), warning=True)
+                        failed.append(result.job.savefile)
+            index.save()
+            mismatched = failed
+
+        if mismatched:
+            self.utils.log('%i files do not match their expected sha256' % len(mismatched), error=True)
+        self.utils.log('\ndone!')
+        self.utils.log('time', str(dt.datetime.now()))
+        return mismatched
+
+    def run_plan(self):
+        """Returns the RunPlan of all active systems and filesets, which every phase consumes.  The plan is
+        rebuilt only if systems or filesets changed since it was last built."""
+        key = fingerprint(self.systems, self.filesets)
+        if self._run_plan is None or self._run_plan[0] != key:
+            plan = make_run_plan(self.systems, self.filesets)
+            for name, error in plan.invalid:
+                self.utils.log('invalid definition of %s, treated as inactive' % name, error, warning=True)
+            self.utils.log('run plan', '%i work units' % len(plan))
+            self._run_plan = (key, plan)
+        return self._run_plan[1]
+
+    def download_plan(self):
+        """Returns the deduplicated DownloadPlan of fileset files required by all active systems."""
+        plan = self.run_plan().download_plan()
+        for sysname, setname in plan.unknown:
+            self.utils.log(' fileset of system %s not found in filesets.yaml' % sysname, setname)
+        self.utils.log('download plan', '%i files in %i filesets' % (len(plan), len(plan.filesets())))
+        return plan
+
+    def gittree_sync(self, githost, downloader, index, store=None, max_workers=8):
+        """Returns a GitTreeSync for the git tree given by the gittree_repo setting (a local repository)
+        or, if that is empty, for the GitHub repository githost points to.  Returns None, so files are
+        downloaded one by one instead, if the tree can't be listed."""
+        repo = str(self.settings['gittree_repo']).strip()
+        self.utils.log('sync mode', 'gittree (%s)' % (repo or 'GitHub api'))
+        try:
+            tree = local_tree(Path(repo)) if repo else github_tree(githost, downloader)
+        except Exception as ex:
+            self.utils.log('git tree could not be listed, downloading files individually (%s)' % str(ex), warning=True)
+            return None
+        self.utils.log('git tree entries', str(len(tree)))
+        return GitTreeSync(tree, githost, index, store, max_workers)
+
+    def downloader(self, max_workers=1, **kwargs):
+        """Returns a Downloader configured with the retry, timeout and backoff settings."""
+        options = dict(retries=int(self.settings['download_retries']),
+                       timeout=float(self.settings['download_timeout']),
+                       backoff=float(self.settings['download_backoff']))
+        options.update(kwargs)
+        return Downloader(max_workers, **options)
+
+    def content_store(self):
+        """Returns the shared content-addressed store if the cas_store setting names one, otherwise None.
+        Files are then hard-linked from the store into the download and sql folders instead of copied."""
+        if str(self.settings.get('cas_store', '')).strip() == '':
+            return None
+        store = ContentStore(Path(self.settings['cas_store']))
+        self.utils.log('content store', str(store.root))
+        return store
+
+    @needs_workspace
     def copy_download_to_sql(self, overwrite=False):
         self.utils.log('copy_download_to_sql started', header=True)
         self.utils.log('copy files from download folder (by fileset) to sql folder (by system)')
@@ -492,48 +982,38 @@ class tdcoa:
 
         self.utils.recursively_delete_subfolders(sqlpath)
 
-        for sysname, sysobject in self.systems.items():
-            if self.utils.dict_active(sysobject, also_contains_key='filesets'):  # must be ACTIVE (this test pre-dated systems.active change)
-                self.utils.log('processing system', sysname)  # just shuffled log inside of active test
-                for setname, setobject in sysobject['filesets'].items():
-                    self.utils.log('processing fileset', setname)
-                    if self.utils.dict_active(setobject):
-
-                        # define paths:
-                        srcpath = os.path.join(self.approot, self.folders['download'], setname)
-                        dstpath = os.path.join(self.approot, self.folders['sql'], sysname)
-                        dstpath = os.path.join(dstpath, setname)
-                        if not os.path.exists(dstpath):
-                            os.makedirs(dstpath)
-
-                        # purge existing, and copy over
-                        if overwrite:
-                            self.utils.recursive_delete(dstpath)
-
-                        # loop through downloaded files and copy them to sql_store folder
-                        # only copy if dbsversion and collection match
-                        for downloaded_file in os.listdir(srcpath):
-                            dbsversion_match = True
-                            collection_match = True
-
-                            # match downloaded file to fileset object so that we can compare collection & dbsversion
-                            # note: fileset may not always have dbsversion or collection listed. always copy if thats true
-                            for file_object, file_values in self.filesets['customer_data_space']['files'].items():
-                                if downloaded_file == file_values['gitfile'].split('/')[-1]:
-                                    if 'dbsversion' in file_values:
-                                        if sysobject['dbsversion'] not in file_values['dbsversion']:
-                                            dbsversion_match = False  # non-matching dbsversion: dont copy
-
-                                    if 'collection' in file_values:
-                                        if sysobject['collection'] not in file_values['collection']:
-                                            collection_match = False  # non-matching collection: dont copy
-
-                                    break
-
-                            # only copy if dbsversion and collection match (if given)
-                            # todo add logging regarding which files are being skipped / copied
-                            if dbsversion_match and collection_match:
-                                shutil.copyfile(os.path.join(srcpath, downloaded_file), os.path.join(dstpath, downloaded_file))
+        store = self.content_store()
+        digests = {}  # file digests, so each downloaded file is hashed once regardless of system count
+
+        plan = self.download_plan()
+        for sysname, sysfiles in plan.by_system().items():
+            self.utils.log('processing system', sysname)
+            for setname, planned_files in sysfiles.items():
+                self.utils.log('processing fileset', setname)
+
+                # define paths:
+                srcpath = os.path.join(self.approot, self.folders['download'], setname)
+                dstpath = os.path.join(self.approot, self.folders['sql'], sysname)
+                dstpath = os.path.join(dstpath, setname)
+                if not os.path.exists(dstpath):
+                    os.makedirs(dstpath)
+
+                # purge existing, and copy over
+                if overwrite:
+                    self.utils.recursive_delete(dstpath)
+
+                # copy the planned files, i.e. those matching the system's dbsversion and collection
+                for planned in planned_files:
+                    srcfile = os.path.join(srcpath, planned.filename)
+                    if not os.path.isfile(srcfile):
+                        self.utils.log('  file not downloaded, skipping', srcfile, warning=True)
+                        continue
+                    if store is None:
+                        shutil.copyfile(srcfile, os.path.join(dstpath, planned.filename))
+                    else:
+                        if srcfile not in digests:
+                            digests[srcfile] = store.put_file(Path(srcfile))
+                        store.link(digests[srcfile], Path(dstpath, planned.filename))
 
         self.utils.log('\ndone!')
         self.utils.log('time', str(dt.datetime.now()))
@@ -603,13 +1083,16 @@ class tdcoa:
         for dstpath, srcpath in copyops.items():
             self.utils.log(' source:  %s' % srcpath)
             self.utils.log(' target:  %s' % dstpath)
+            if os.path.isfile(dstpath):
+                os.remove(dstpath)  # target may be a link into the shared content store, never write through it
             shutil.copyfile(srcpath, dstpath)
 
         if reloadconfig:
             self.reload_config()
         self.utils.log('\napply override complete!')
 
-    def prepare_sql(self, sqlfolder='', override_folder=''):
+    @needs_workspace
+    def prepare_sql(self, sqlfolder='', override_folder='', jobs=1):
         self.copy_download_to_sql()  # moved from end of download_files() to here
 
         self.utils.log('prepare_sql started', header=True)
@@ -623,17 +1106,24 @@ class tdcoa:
 
         self.apply_override(target_folder=sqlfolder, override_folder=override_folder)
 
-        # clear pre-existing subfolders in "run" directory (file sets)
-        self.utils.log('empty run folder entirely')
-        self.utils.recursively_delete_subfolders(os.path.join(self.approot, self.folders['run']))
+        # clear pre-existing subfolders in "run" directory (file sets), unless unchanged filesets are kept
+        ledger = self.fileset_ledger()
+        prepared = set()  # run folders prepared or kept by this run
+        units = []  # filesets to prepare, as found
+        if self.incremental():
+            self.utils.log('keeping prepared filesets whose version and inputs are unchanged')
+        else:
+            self.utils.log('empty run folder entirely')
+            self.utils.recursively_delete_subfolders(os.path.join(self.approot, self.folders['run']))
 
         # iterate all system level folders in "sql" folder...
+        plan = self.run_plan()
         for sysfolder in os.listdir(os.path.join(self.approot, self.folders['sql'])):
             if os.path.isdir(os.path.join(self.approot, self.folders['sql'])):
                 self.utils.log('\n' + '-' * self.utils.logspace)
                 self.utils.log('SYSTEM FOLDER FOUND', sysfolder)
 
-                if sysfolder not in self.systems or self.utils.dict_active(self.systems[sysfolder]) is False:  # must be ACTIVE (this test pre-dated systems.active change)
+                if not plan.active(sysfolder):  # must be ACTIVE (this test pre-dated systems.active change)
                     self.utils.log('folder not defined as an active system, skipping...')
 
                 else:
@@ -657,12 +1147,12 @@ class tdcoa:
 
                             else:  # setfolder in self.filesets
                                 self.utils.log('  folder MATCHES a defined fileset name', setfolder)
-                                if not self.utils.dict_active(self.systems[sysfolder]['filesets'][setfolder]):
+                                if (sysfolder, setfolder) not in plan.selected:
                                     self.utils.log(
                                         "  however the system's fileset-override is marked as in-active, skipping...")
                                     _continue = False
 
-                                elif not self.utils.dict_active(self.filesets[setfolder]):
+                                elif not plan.filesets.get(setfolder, False):
                                     self.utils.log('  however fileset itself is marked as in-active, skipping...')
                                     _continue = False
 
@@ -681,176 +1171,320 @@ class tdcoa:
                                     self.utils.log('  creating system folder', runpath)
                                     os.mkdir(runpath)
                                 runpath = os.path.join(self.approot, self.folders['run'], sysfolder, setfolder)
-                                if not os.path.isdir(runpath):
-                                    self.utils.log('  creating fileset folder', runpath)
-                                    os.mkdir(runpath)
-
-                                self.utils.recursive_copy(sqlpath, runpath, replace_existing=True)
-
-                                # iterate all .coa.sql files in the fileset subfolder...
-                                for runfile in os.listdir(runpath):
-                                    runfilepath = os.path.join(runpath, runfile)
-                                    if os.path.isfile(runfilepath) and runfile[-8:] == '.coa.sql':
-
-                                        # if .coa.sql file, read into memory
-                                        self.utils.log('\n  PROCESSING COA.SQL FILE', runfile)
-                                        with open(runfilepath, 'r') as fh:
-                                            runfiletext = fh.read()
-                                            self.utils.log('  characters in file', str(len(runfiletext)))
-
-                                        # SUBSTITUTE values for:  system-fileset override [source_systems.yaml --> filesets]
-                                        if setfolder in self.systems[sysfolder]['filesets']:   # sysfolder is only ACTIVE systems per line 642(ish) above
-                                            sub_dict = self.systems[sysfolder]['filesets'][setfolder]
-                                            if self.utils.dict_active(sub_dict, 'system-fileset overrides'):
-                                                runfiletext = self.utils.substitute(runfiletext, sub_dict,
-                                                                              subname='system-fileset overrides (highest priority)')
-
-                                        # SUBSTITUTE values for: system-defaults [source_systems.yaml]
-                                        sub_dict = self.systems[sysfolder]   # sysfolder is only ACTIVE systems per line 642(ish) above
-                                        if self.utils.dict_active(sub_dict, 'system defaults'):
-                                            runfiletext = self.utils.substitute(runfiletext, sub_dict, skipkeys=['filesets'],
-                                                                          subname='system defaults')
-
-                                        # SUBSTITUTE values for: overall application defaults (never inactive) [config.yaml substitutions]
-                                        self.utils.log('  always use dictionary')
-                                        runfiletext = self.utils.substitute(runfiletext, self.substitutions,
-                                                                      subname='overall app defaults (config.substitutions)')
-
-                                        # SUBSTITUTE values for: TRANSCEND (mostly for db_coa and db_region)
-                                        runfiletext = self.utils.substitute(runfiletext, self.transcend,
-                                                                      subname='overall transcend database defaults (db_coa and db_region)',
-                                                                      skipkeys=['host', 'username', 'password',
-                                                                                'logmech'])
-
-                                        # SUBSTITUTE values for: individual file subs [fileset.yaml --> files]
-                                        if setfolder in self.filesets:
-                                            sub_dict = {}
-                                            for file_key, file_dict in self.filesets[setfolder]['files'].items():
-                                                if ntpath.basename(file_dict['gitfile']) == runfile:
-                                                    sub_dict = file_dict
-                                                    break
-
-                                            if sub_dict:
-                                                runfiletext = self.utils.substitute(runfiletext, sub_dict,
-                                                                                    skipkeys=['collection',
-                                                                                              'dbsversion', 'gitfile'],
-                                                                                    subname='file substitutions')
-
-                                        # SUBSTITUTE values for: fileset defaults [fileset.yaml substitutions]
-                                        if setfolder in self.filesets:
-                                            sub_dict = self.filesets[setfolder]
-                                            if self.utils.dict_active(sub_dict, 'fileset defaults'):
-                                                runfiletext = self.utils.substitute(runfiletext, sub_dict, skipkeys=['files'],
-                                                                              subname='fileset defaults (lowest priority)')
-
-                                        # split sql file into many sql statements
-                                        sqls_raw = runfiletext.split(';')
-                                        self.utils.log('  sql statements in file', str(len(sqls_raw) - 1))
-                                        sqls_done = []
-                                        i = 0
-
-                                        # loop thru individual sql statements within file
-                                        for sql_raw in sqls_raw:
-
-                                            # light formatting...
-                                            sql = self.utils.format_sql(sql_raw)
-
-                                            if sql != '':
-                                                i += 1
-                                                self.utils.log('  SQL %i' % i, '%s...' % sql[:50].replace('\n', ' '))
-
-                                                # Get SPECIAL COMMANDS
-                                                cmds = self.utils.get_special_commands(sql, '{{replaceMe:{cmdname}}}',
-                                                                                 keys_to_skip=['save', 'load', 'call', 'vis', 'pptx'])
-                                                sql = cmds['sql']  # sql stripped of commands (now in dict)
-                                                del cmds['sql']
-
-                                                self.utils.log('  processing special commands')
-                                                for cmdname, cmdvalue in cmds.items():
-
-                                                    # --> FILE <--: replace with local sql file
-                                                    if str(cmdname[:4]).lower() == 'file':
-                                                        self.utils.log('   replace variable with a local sql file')
-
-                                                        if not os.path.isfile(os.path.join(runpath, cmdvalue)):
-                                                            self.utils.log('custom file missing',
-                                                                     os.path.join(runpath, cmdvalue), warning=True)
-                                                            self.utils.log(
-                                                                '   This may be by design, consult CSM for details.')
-                                                            # raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), os.path.join(runpath, cmdvalue))
-                                                        else:
-                                                            self.utils.log('   specified file found', cmdvalue)
-                                                            with open(os.path.join(runpath, cmdvalue), 'r') as fh:
-                                                                tempsql = fh.read()
-                                                            sqls_done.append('/* BEGIN file insert: %s */ \n%s' % (
-                                                                cmdvalue, tempsql))
-                                                            sql = sql.replace('{{replaceMe:%s}}' % cmdname,
-                                                                              'END file insert: %s' % cmdvalue, 1)
-
-                                                    # --> TEMP <--: load temp file from .csv
-                                                    if str(cmdname[:4]).lower() == 'temp':
-                                                        self.utils.log('   create temp (volatile) table from .csv')
-
-                                                        if not os.path.isfile(os.path.join(runpath, cmdvalue)):
-                                                            self.utils.log('csv file missing!!!',
-                                                                     os.path.join(runpath, cmdvalue), error=True)
-                                                            raise FileNotFoundError(errno.ENOENT,
-                                                                                    os.strerror(errno.ENOENT),
-                                                                                    os.path.join(runpath, cmdvalue))
-                                                        else:
-                                                            self.utils.log('   csv file found', cmdvalue)
-                                                            tempsql = self.utils.sql_create_temp_from_csv(
-                                                                os.path.join(runpath, cmdvalue))
-                                                            sqls_done.append(tempsql)
-                                                            sql = sql.replace('{{replaceMe:%s}}' % cmdname,
-                                                                              'above volatile table create script for %s' % cmdvalue,
-                                                                              1)
-
-                                                    # --> LOOP <--: loop thru csv and generate one sql per csv row, with substitutions
-                                                    if str(cmdname[:4]).lower() == 'loop':
-                                                        self.utils.log('   loop sql once per row in .csv, with substitutions')
-
-                                                        # can we find the file?
-                                                        if not os.path.isfile(os.path.join(runpath, cmdvalue)):
-                                                            self.utils.log('csv file missing!!!',
-                                                                     os.path.join(runpath, cmdvalue), warning=True)
-                                                        else:
-                                                            self.utils.log('   file found!')
-                                                            df = pd.read_csv(os.path.join(runpath, cmdvalue))
-                                                            self.utils.log('   rows in file', str(len(df)))
-
-                                                            # perform csv substitutions
-                                                            self.utils.log(
-                                                                '   perform csv file substitutions (find: {column_name}, replace: row value)')
-                                                            for index, row in df.iterrows():
-                                                                tempsql = sql
-                                                                for col in df.columns:
-                                                                    col = col.strip()
-                                                                    tempsql = tempsql.replace(str('{%s}' % col),
-                                                                                              str(row[col]).strip())
-                                                                tempsql = tempsql.replace('{{replaceMe:%s}}' % cmdname,
-                                                                                          ' csv row %i out of %i ' % (
-                                                                                              index + 1, len(df)))
-                                                                self.utils.log('   sql generated from row data',
-                                                                         'character length = %i' % len(tempsql))
-                                                                sqls_done.append(tempsql)
-                                                            sql = ''  # don't append original sql again - it is only a template
-
-                                                    # --> others, append special command back to the SQL for processing in the run phase
-                                                    # if str(cmdname[:4]).lower() in ['save','load','call']:
-                                                    #    sql = sql.replace('/* {{replaceMe:%s}} */' %cmdname,'/*{{%s:%s}}*/' %(cmdname, cmdvalue), 1)
-
-                                            # after all special commands, append the original sql
-                                            sqls_done.append(sql)
-
-                                        # write out new finalized file content:
-                                        self.utils.log('  writing out final sql')
-                                        with open(runfilepath, 'w') as fh:
-                                            fh.write('\n\n'.join(sqls_done))
+                                prepared.add(runpath)
+
+                                # skip filesets prepared before at the same version, with the same inputs
+                                version, key = self.prepare_key(sysfolder, setfolder, sqlpath)
+                                if self.incremental() and os.path.isdir(runpath) and \
+                                        ledger.current('prepare', '%s/%s' % (sysfolder, setfolder), version, key):
+                                    self.utils.log('  fileset version %s and inputs unchanged, keeping' % version, runpath)
+                                    continue
+
+                                # substitution scope of the fileset, precedence highest first; the file
+                                # substitutions of each .coa.sql file are inserted at filepos
+                                layers = []
+                                if (sysfolder, setfolder) in plan.selected:  # system-fileset override [source_systems.yaml --> filesets]
+                                    layers.append(('system-fileset overrides (highest priority)', self.systems[sysfolder]['filesets'][setfolder], []))
+                                # system-defaults [source_systems.yaml], sysfolder is only ACTIVE systems, per the run plan
+                                layers.append(('system defaults', self.systems[sysfolder], ['filesets']))
+                                # overall application defaults (never inactive) [config.yaml substitutions]
+                                layers.append(('overall app defaults (config.substitutions)', self.substitutions, []))
+                                # TRANSCEND (mostly for db_coa and db_region)
+                                layers.append(('overall transcend database defaults (db_coa and db_region)', self.transcend,
+                                               ['host', 'username', 'password', 'logmech']))
+                                filepos = len(layers)
+                                if plan.filesets.get(setfolder, False):  # fileset defaults [fileset.yaml substitutions]
+                                    layers.append(('fileset defaults (lowest priority)', self.filesets[setfolder], ['files']))
+
+                                # outputs prepared before from the same inputs are kept, see output_keys()
+                                previous = {}
+                                if self.incremental():
+                                    previous = ledger.keys('prepare files', '%s/%s' % (sysfolder, setfolder), version)
+                                units.append((sysfolder, setfolder, sqlpath, runpath, Scope(layers), filepos, previous, version, key))
+
+        # prepare the filesets found, in this process or in a pool of worker processes
+        for unit, keys in self.prepare_filesets(units, jobs):
+            sysfolder, setfolder, version, key = unit[0], unit[1], unit[-2], unit[-1]
+            ledger.record('prepare', '%s/%s' % (sysfolder, setfolder), version, key)
+            ledger.replace('prepare files', '%s/%s' % (sysfolder, setfolder), version, keys)
+
+        # remove run folders of filesets no longer prepared
+        if self.incremental():
+            runroot = os.path.join(self.approot, self.folders['run'])
+            for sysfolder in os.listdir(runroot):
+                syspath = os.path.join(runroot, sysfolder)
+                if os.path.isdir(syspath):
+                    for setfolder in os.listdir(syspath):
+                        if os.path.join(syspath, setfolder) not in prepared and os.path.isdir(os.path.join(syspath, setfolder)):
+                            self.utils.log('removing stale run folder', os.path.join(syspath, setfolder))
+                            self.utils.recursive_delete(os.path.join(syspath, setfolder))
+                            ledger.forget('prepare', '%s/%s' % (sysfolder, setfolder))
+                            ledger.replace('prepare files', '%s/%s' % (sysfolder, setfolder), None, {})
+                    if not os.listdir(syspath):
+                        os.rmdir(syspath)
+        ledger.save()
 
         self.utils.log('done!')
         self.utils.log('time', str(dt.datetime.now()))
 
+    def prepare_fileset(self, sysfolder, setfolder, sqlpath, runpath, scope, filepos, previous=None):
+        """Prepares the run folder of one system/fileset: copies its sql folder to runpath, then substitutes
+        the values of scope into each .coa.sql file (with the file substitutions inserted at filepos), and
+        expands their special commands.  Outputs whose fingerprint is in previous, the fingerprints of the
+        last prepare by file name, are kept as they are.  Returns the fingerprints of all outputs, see
+        output_keys().  Called by prepare_sql(), possibly in a worker process."""
+        self.utils.log('\n  PREPARING FILESET', '%s/%s' % (sysfolder, setfolder))
+        keys = self.output_keys(setfolder, sqlpath, scope, filepos)
+        kept = {runfile for runfile, key in keys.items()
+                if (previous or {}).get(runfile) == key and os.path.isfile(os.path.join(runpath, runfile))}
+        if kept:
+            # refresh everything in the fileset folder but the outputs kept
+            self.utils.log('  updating fileset folder', runpath)
+            for itm in os.listdir(runpath):
+                if itm not in kept:
+                    if os.path.isdir(os.path.join(runpath, itm)):
+                        self.utils.recursive_delete(os.path.join(runpath, itm))
+                    else:
+                        os.remove(os.path.join(runpath, itm))
+            self.utils.recursive_copy(sqlpath, runpath, replace_existing=False)
+        else:
+            if os.path.isdir(runpath):
+                self.utils.recursive_delete(runpath)
+            self.utils.log('  creating fileset folder', runpath)
+            os.mkdir(runpath)
+
+            self.utils.recursive_copy(sqlpath, runpath, replace_existing=True)
+
+        # iterate all .coa.sql files in the fileset subfolder...
+        for runfile in os.listdir(runpath):
+            runfilepath = os.path.join(runpath, runfile)
+            if runfile in kept:
+                self.utils.log('\n  KEEPING COA.SQL FILE', runfile)
+                self.utils.log('  inputs unchanged since last prepared')
+
+            elif os.path.isfile(runfilepath) and runfile[-8:] == '.coa.sql':
+
+                # if .coa.sql file, read into memory
+                self.utils.log('\n  PROCESSING COA.SQL FILE', runfile)
+                with open(runfilepath, 'r') as fh:
+                    runfiletext = fh.read()
+                    self.utils.log('  characters in file', str(len(runfiletext)))
+
+                # SUBSTITUTE values of all layers, with individual file subs [fileset.yaml --> files]
+                filescope = self.file_scope(setfolder, runfile, scope, filepos)
+                sqls_done = []
+
+                # loop thru individual sql statements within file, substituted and with
+                # their special commands (sql stripped of commands, now in dict)
+                for sql, cmds in self.sql_statements(runfiletext, filescope):
+
+                    if sql != '':
+                        self.utils.log('  processing special commands')
+                        for cmdname, cmdvalue in cmds.items():
+
+                            # --> FILE <--: replace with local sql file
+                            if str(cmdname[:4]).lower() == 'file':
+                                self.utils.log('   replace variable with a local sql file')
+
+                                if not os.path.isfile(os.path.join(runpath, cmdvalue)):
+                                    self.utils.log('custom file missing',
+                                             os.path.join(runpath, cmdvalue), warning=True)
+                                    self.utils.log(
+                                        '   This may be by design, consult CSM for details.')
+                                    # raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), os.path.join(runpath, cmdvalue))
+                                else:
+                                    self.utils.log('   specified file found', cmdvalue)
+                                    with open(os.path.join(runpath, cmdvalue), 'r') as fh:
+                                        tempsql = fh.read()
+                                    sqls_done.append('/* BEGIN file insert: %s */ \n%s' % (
+                                        cmdvalue, tempsql))
+                                    sql = sql.replace('{{replaceMe:%s}}' % cmdname,
+                                                      'END file insert: %s' % cmdvalue, 1)
+
+                            # --> TEMP <--: load temp file from .csv
+                            if str(cmdname[:4]).lower() == 'temp':
+                                self.utils.log('   create temp (volatile) table from .csv')
+
+                                if not os.path.isfile(os.path.join(runpath, cmdvalue)):
+                                    self.utils.log('csv file missing!!!',
+                                             os.path.join(runpath, cmdvalue), error=True)
+                                    raise FileNotFoundError(errno.ENOENT,
+                                                            os.strerror(errno.ENOENT),
+                                                            os.path.join(runpath, cmdvalue))
+                                else:
+                                    self.utils.log('   csv file found', cmdvalue)
+                                    tempsql = self.utils.sql_create_temp_from_csv(
+                                        os.path.join(runpath, cmdvalue))
+                                    sqls_done.append(tempsql)
+                                    sql = sql.replace('{{replaceMe:%s}}' % cmdname,
+                                                      'above volatile table create script for %s' % cmdvalue,
+                                                      1)
+
+                            # --> LOOP <--: loop thru csv and generate one sql per csv row, with substitutions
+                            if str(cmdname[:4]).lower() == 'loop':
+                                self.utils.log('   loop sql once per row in .csv, with substitutions')
+
+                                # can we find the file?
+                                if not os.path.isfile(os.path.join(runpath, cmdvalue)):
+                                    self.utils.log('csv file missing!!!',
+                                             os.path.join(runpath, cmdvalue), warning=True)
+                                else:
+                                    self.utils.log('   file found!')
+                                    df = pd.read_csv(os.path.join(runpath, cmdvalue))
+                                    self.utils.log('   rows in file', str(len(df)))
+
+                                    # perform csv substitutions
+                                    self.utils.log(
+                                        '   perform csv file substitutions (find: {column_name}, replace: row value)')
+                                    for index, row in df.iterrows():
+                                        tempsql = sql
+                                        for col in df.columns:
+                                            col = col.strip()
+                                            tempsql = tempsql.replace(str('{%s}' % col),
+                                                                      str(row[col]).strip())
+                                        tempsql = tempsql.replace('{{replaceMe:%s}}' % cmdname,
+                                                                  ' csv row %i out of %i ' % (
+                                                                      index + 1, len(df)))
+                                        self.utils.log('   sql generated from row data',
+                                                 'character length = %i' % len(tempsql))
+                                        sqls_done.append(tempsql)
+                                    sql = ''  # don't append original sql again - it is only a template
+
+                            # --> others, append special command back to the SQL for processing in the run phase
+                            # if str(cmdname[:4]).lower() in ['save','load','call']:
+                            #    sql = sql.replace('/* {{replaceMe:%s}} */' %cmdname,'/*{{%s:%s}}*/' %(cmdname, cmdvalue), 1)
+
+                    # after all special commands, append the original sql
+                    sqls_done.append(sql)
+
+                # write out new finalized file content:
+                self.utils.log('  writing out final sql')
+                with open(runfilepath, 'w') as fh:
+                    fh.write('\n\n'.join(sqls_done))
+        return keys
+
+    def file_scope(self, setfolder, runfile, scope, filepos):
+        """Returns scope with the file substitutions of runfile [fileset.yaml --> files] inserted at filepos."""
+        sub_dict = self.catalog.file(setfolder, runfile) if setfolder in self.filesets else None
+        if not sub_dict:
+            return scope
+        return scope.insert(filepos, 'file substitutions', sub_dict, ['collection', 'dbsversion', 'gitfile', 'sha256'])
+
+    def output_keys(self, setfolder, sqlpath, scope, filepos):
+        """Returns the fingerprint of each .coa.sql file of sqlpath, by name, over everything its prepared
+        output depends on: the file content, the values its {name} tokens resolve to, the content of the
+        files its file, temp and loop special commands read, and the tdcoa version."""
+        keys = {}
+        for runfile in sorted(os.listdir(sqlpath)):
+            filepath = os.path.join(sqlpath, runfile)
+            if os.path.isfile(filepath) and runfile[-8:] == '.coa.sql':
+                with open(filepath, 'r') as fh:
+                    text = fh.read()
+                filescope = self.file_scope(setfolder, runfile, scope, filepos)
+                values = {}
+                for name in TOKEN.findall(text):
+                    resolved = filescope.resolve(name)
+                    values[name] = None if resolved is None else resolved[0]
+                collateral = {}
+                for command in COMMAND.findall(text):
+                    cmdlst = filescope.substitute(command)[0].split(':')
+                    cmdvalue = cmdlst[1].strip() if len(cmdlst) == 2 else ''
+                    if cmdlst[0].strip()[:4].lower() in ('file', 'temp', 'loop'):
+                        collpath = os.path.join(sqlpath, cmdvalue)
+                        collateral[cmdvalue] = file_digest(Path(collpath)) if os.path.isfile(collpath) else None
+                keys[runfile] = fingerprint(self.version, hashlib.sha256(text.encode('utf-8')).hexdigest(), values, collateral)
+        return keys
+
+    def prepare_filesets(self, units, jobs=1):
+        """Prepares each unit found by prepare_sql(), yielding it once prepared, with the fingerprints of its
+        outputs, in the order found.  With jobs above 1, units are prepared in that many worker processes,
+        each buffering its run log, which is appended here a unit at a time in the same order, so run log
+        and run folder match a serial run."""
+        if jobs <= 1 or len(units) <= 1:
+            for unit in units:
+                yield unit, self.prepare_fileset(*unit[:7])
+            return
+
+        with concurrent.futures.ProcessPoolExecutor(
+                min(jobs, len(units)), initializer=_start_prepare_worker,
+                initargs=(self.utils.secrets, self.utils.show_full_sql, self.filesets)) as pool:
+            futures = [pool.submit(_prepare_in_worker, unit[:7]) for unit in units]
+            for unit, future in zip(units, futures):
+                keys, logs, error = future.result()
+                self.utils.extend(logs)
+                if error is not None:
+                    for pending in futures:
+                        pending.cancel()
+                    raise error
+                yield unit, keys
+
+    @classmethod
+    def prepare_worker(cls, secrets, show_full_sql, filesets):
+        """Returns an instance holding only what prepare_fileset() needs, for a worker process of
+        prepare_filesets(): no configuration is loaded, and its run log is only buffered."""
+        self = cls.__new__(cls)
+        self.utils = Utils(self.version)
+        self.utils.printlog = False
+        self.utils.secrets = secrets
+        self.utils.show_full_sql = show_full_sql
+        self.filesets = filesets
+        self.catalog = FilesetCatalog(filesets)
+        self._templates = TemplateCache(SPECIAL_COMMAND_PLACEHOLDER, RUN_PHASE_COMMANDS)
+        return self
+
+    def sql_statements(self, runfiletext, scope):
+        """Yields the statements of a .coa.sql file, substituted from scope and formatted, with the special
+        commands of each as (sql, {command: value}), the commands in sql replaced by placeholders.  Each
+        file content is compiled only once, and rendered per system, unless its values would change how the
+        file parses; then the substituted file is parsed as a whole."""
+        rendered = self._templates.get(runfiletext)
+        rendered = rendered and rendered.render(scope)
+        if rendered is None:
+            runfiletext = self.utils.substitute_scope(runfiletext, scope)
+            parsed = [(self.utils.format_sql(sql_raw), None, (), None) for sql_raw in split_sql(runfiletext)]
+        else:
+            self.utils.log_substitutions(scope, rendered.used)
+            parsed = rendered.statements
+
+        self.utils.log('  sql statements in file', str(len(parsed) - 1))
+        i = 0
+        for text, sql, found, cmds in parsed:
+            if text == '':
+                yield '', {}
+                continue
+            i += 1
+            self.utils.log('  SQL %i' % i, '%s...' % text[:50].replace('\n', ' '))
+            if sql is None:  # parsed only now, as substituted
+                cmds = self.utils.get_special_commands(text, SPECIAL_COMMAND_PLACEHOLDER, keys_to_skip=RUN_PHASE_COMMANDS)
+                sql = cmds.pop('sql')
+            else:
+                self.utils.log('  parsing for special sql commands')
+                self.utils.log_special_commands(found)
+                cmds = dict(cmds)
+            yield sql, cmds
+
+    def prepare_key(self, sysname, setname, sqlpath):
+        """Returns the fileset_version and a fingerprint of all prepare_sql inputs of one system/fileset:
+        the content of its sql store files, and the substitution values those files (transitively) reference."""
+        fileset = self.filesets.get(setname, {})
+        digests, texts = {}, []
+        for name in sorted(os.listdir(sqlpath)):
+            if os.path.isfile(os.path.join(sqlpath, name)):
+                with open(os.path.join(sqlpath, name), 'rb') as fh:
+                    content = fh.read()
+                digests[name] = hashlib.sha256(content).hexdigest()
+                if name[-8:] == '.coa.sql':
+                    texts.append(content.decode('utf-8', errors='replace'))
+        system = self.systems[sysname]
+        layers = [system['filesets'].get(setname, {}),
+                  {k: v for k, v in system.items() if k != 'filesets'},
+                  self.substitutions,
+                  {k: v for k, v in self.transcend.items() if k not in ['host', 'username', 'password', 'logmech']},
+                  {k: v for k, v in fileset.items() if k != 'files'}]
+        layers += [f for f in fileset.get('files', {}).values()]
+        return fileset.get('fileset_version'), fingerprint(digests, referenced(texts, layers))
+
+    @needs_workspace
     def archive_prepared_sql(self, name=''):
         """Manually archives (moves) all folders / files in the 'run' folder, where
         prepared sql is stored after the prepare_sql() function.  This includes the
@@ -906,6 +1540,7 @@ class tdcoa:
 
         return outputpath
 
+    @needs_workspace
     def execute_run(self, name=''):
         self.utils.log('execute_run started', header=True)
         self.utils.log('time', str(dt.datetime.now()))
@@ -927,12 +1562,13 @@ class tdcoa:
         self.utils.log('last-run output', outputpath)
 
         # loop through systems
+        plan = self.run_plan()
         for sysname in os.listdir(runpath):
             sysfolder = os.path.join(runpath, sysname)
             if os.path.isdir(sysfolder):
 
                 # iterate system folders  -- must exist in source_systems.yaml!
-                if sysname not in self.systems or self.utils.dict_active(self.systems[sysname]) == False:  # ADDED to ensure ACTIVE systems only
+                if not plan.active(sysname):  # ADDED to ensure ACTIVE systems only
                     self.utils.log('SYSTEM NOT FOUND IN SOURCE_SYSTEMS.YAML', sysname, warning=True)
 
                 else:
@@ -998,7 +1634,8 @@ class tdcoa:
                                             sqls = coasqlfilehdlr.read()  # all sql statements in a sql file
 
                                         sqlcnt = 0
-                                        for sql in sqls.split(';'):  # loop thru the individual sql statements
+                                        for statement in statements(sqls):  # loop thru the individual sql statements
+                                            sql = statement.text
                                             sqlcnt += 1
 
                                             if sql.strip() == '':
@@ -1008,7 +1645,7 @@ class tdcoa:
                                                 self.utils.log('\n---- SQL #%i' % sqlcnt)
 
                                                 # pull out any embedded SQLcommands:
-                                                sqlcmd = self.utils.get_special_commands(sql)
+                                                sqlcmd = self.utils.get_special_commands(statement)
                                                 sql = sqlcmd.pop('sql', '')
 
 
@@ -1121,6 +1758,7 @@ class tdcoa:
         runlogdst = os.path.join(outputpath, 'runlog.txt')
         if os.path.isfile(runlogsrc): shutil.move(runlogsrc, runlogdst)
 
+    @needs_workspace
     def collect_data(self, name=''):
         self.utils.log('collect_data started', header=True)
         self.utils.log('time', str(dt.datetime.now()))
@@ -1212,7 +1850,8 @@ class tdcoa:
                                             sqls = coasqlfilehdlr.read()  # all sql statements in a sql file
 
                                         sqlcnt = 0
-                                        for sql in sqls.split(';'):  # loop thru the individual sql statements
+                                        for statement in statements(sqls):  # loop thru the individual sql statements
+                                            sql = statement.text
                                             sqlcnt += 1
 
                                             if sql.strip() == '':
@@ -1222,7 +1861,7 @@ class tdcoa:
                                                 self.utils.log('\n---- SQL #%i' % sqlcnt)
 
                                                 # pull out any embedded SQLcommands:
-                                                sqlcmd = self.utils.get_special_commands(sql)
+                                                sqlcmd = self.utils.get_special_commands(statement)
                                                 sql = sqlcmd.pop('sql', '')
 
 
@@ -1313,6 +1952,7 @@ class tdcoa:
         runlogdst = os.path.join(outputpath, 'runlog.txt')
         shutil.move(runlogsrc, runlogdst)
 
+    @needs_workspace
     def process_data(self, _outputpath=''):
         self.utils.log('process_data started', header=True)
         self.utils.log('time', str(dt.datetime.now()))
@@ -1416,7 +2056,8 @@ class tdcoa:
                                             sqls = coasqlfilehdlr.read()  # all sql statements in a sql file
 
                                         sqlcnt = 0
-                                        for sql in sqls.split(';'):  # loop thru the individual sql statements
+                                        for statement in statements(sqls):  # loop thru the individual sql statements
+                                            sql = statement.text
                                             sqlcnt += 1
 
                                             if sql.strip() == '':
@@ -1426,7 +2067,7 @@ class tdcoa:
                                                 self.utils.log('\n---- SQL #%i' % sqlcnt)
 
                                                 # pull out any embedded SQLcommands:
-                                                sqlcmd = self.utils.get_special_commands(sql)
+                                                sqlcmd = self.utils.get_special_commands(statement)
                                                 sql = sqlcmd.pop('sql', '')
 
 
@@ -1470,6 +2111,7 @@ class tdcoa:
         self.utils.log('\ndone!')
         self.utils.log('time', str(dt.datetime.now()))
 
+    @needs_workspace
     def process_manual_files(self,_outputpath=''):
         # This function assumes that the manual csv files are placed in the latest output folder
         self.utils.log('process_manual_files started', header=True)
@@ -1540,6 +2182,7 @@ class tdcoa:
         os.rename(os.path.join(runpath,'runlog.txt'),os.path.join(runpath,'prepare_sql_runlog.txt'))
         shutil.move(os.path.join(runpath,'prepare_sql_runlog.txt'), outputpath)
 
+    @needs_workspace
     def make_customer_files(self, name=''):
         self.utils.log('make_customer_files started', header=True)
         self.utils.log('time', str(dt.datetime.now()))
@@ -1565,12 +2208,13 @@ class tdcoa:
             manifest.write('{"entries":[ ')
 
         # loop through systems
+        plan = self.run_plan()
         for sysname in os.listdir(runpath):
             sysfolder = os.path.join(runpath, sysname)
             if os.path.isdir(sysfolder):
 
                 # iterate system folders  -- must exist in config.yaml!
-                if sysname not in self.systems or self.utils.dict_active(self.systems[sysname]) == False:  # ADDED to ensure ACTIVE systems only :
+                if not plan.active(sysname):  # ADDED to ensure ACTIVE systems only :
                     self.utils.log('SYSTEM NOT FOUND IN CONFIG.YAML', sysname, warning=True)
 
                 else:
@@ -1625,7 +2269,8 @@ class tdcoa:
                                             sqls = coasqlfilehdlr.read()  # all sql statements in a sql file
 
                                         sqlcnt = 0
-                                        for sql in sqls.split(';'):  # loop thru the individual sql statements
+                                        for statement in statements(sqls):  # loop thru the individual sql statements
+                                            sql = statement.text
                                             sqlcnt += 1
 
                                             if sql.strip() == '':
@@ -1635,7 +2280,7 @@ class tdcoa:
                                                 self.utils.log('\n---- SQL #%i' % sqlcnt)
 
                                                 # pull out any embedded SQLcommands:
-                                                sqlcmd = self.utils.get_special_commands(sql)
+                                                sqlcmd = self.utils.get_special_commands(statement)
 
 
                                                 if len(sqlcmd) == 0:
@@ -1711,6 +2356,7 @@ class tdcoa:
         shutil.move(runlogsrc, runlogdst)
         self.utils.log('make_customer_files Completed', header=True)
 
+    @needs_workspace
     def upload_to_transcend(self, _outputpath=''):
         self.utils.bufferlogs = True
         self.utils.log('upload_to_transcend started', header=True)
@@ -1943,6 +2589,15 @@ class tdcoa:
         tmp.append('  run_non_fileset_folders: "True"')
         tmp.append('  skip_dbs:   "False"')
         tmp.append('  write_to_perm: "True"')
+        tmp.append('  max_download_workers: "8"')
+        tmp.append('  cas_store: ""')
+        tmp.append('  download_retries: "3"')
+        tmp.append('  download_timeout: "30"')
+        tmp.append('  download_backoff: "1.0"')
+        tmp.append('  filesets_refresh_timeout: "5"')
+        tmp.append('  sync_mode: "http"')
+        tmp.append('  gittree_repo: ""')
+        tmp.append('  skip_unchanged_filesets: "False"')
         return '\n'.join(tmp)
 
     def yaml_systems(self):
@@ -1967,6 +2622,7 @@ class tdcoa:
 
 # ------------- everything below here is new /
 # ------------- trying to reduce repetitive "file iteration" code
+    @needs_workspace
     def make_customer_files2(self, name=''):
         self.utils.log('generating manual customer files', header=True)
         info = os.path.join(self.approot, self.folders['run'])
@@ -1976,6 +2632,7 @@ class tdcoa:
         self.iterate_coa('move run files to output', info, outfo, {'move_files': self.coafile_move})  # default is all files, sqlfile=False
         self.iterate_coa('combine .coa files',      outfo, outfo, {'combine_files': self.coafile_combine},    file_filter_regex="\.coa\.(bteq|sql)$")
 
+    @needs_workspace
     def process_return_data2(self, folderpath):
         self.utils.log('processing completed run files: %s' %folderpath, header=True)
         info = outfo = folderpath
@@ -2049,18 +2706,19 @@ class tdcoa:
                     elif sqlfile:
                         with open(srcpath, 'r') as fh:
                             sqls_text = fh.read()
-                        sqls = sqls_text.split(";")
+                        sqls = list(statements(sqls_text))
                         self.utils.log('sql file contains %i statements' %len(sqls), indent=ind)
                         trunk['sql'] = {}
                         trunk['index'] = 0
                         trunk['phase'] = 'execute'
 
                         # iterate sqls
-                        for sql in sqls:
+                        for statement in sqls:
+                            sql = statement.text
                             trunk['index'] +=1
                             self.utils.log('processing sql #%i' %trunk['index'], indent=6)
                             ind=8
-                            trunk['special_commands'] = self.utils.get_special_commands(sql, indent=ind)
+                            trunk['special_commands'] = self.utils.get_special_commands(statement, indent=ind)
                             trunk['sql']['original'] = sql
                             trunk['sql']['formatted'] = self.utils.format_sql(sql)
                             trunk['sql']['special_command_out'] = trunk['special_commands']['sql']
@@ -2326,3 +2984,23 @@ class tdcoa:
     def coasql_call(self, trunk):
         self.utils.log('subfunction called', trunk['function_name'], indent=trunk['log_indent'])
         return trunk
+
+
+_prepare_worker = None  # tdcoa.prepare_worker() instance of a worker process
+
+
+def _start_prepare_worker(secrets, show_full_sql, filesets):
+    global _prepare_worker
+    _prepare_worker = tdcoa.prepare_worker(secrets, show_full_sql, filesets)
+
+
+def _prepare_in_worker(unit):
+    """Prepares a unit in a worker process, returns the fingerprints of its outputs, its run log messages
+    and the exception it raised, if any."""
+    keys, error = {}, None
+    try:
+        keys = _prepare_worker.prepare_fileset(*unit)
+    except Exception as ex:
+        error = ex
+    logs, _prepare_worker.utils.logs = _prepare_worker.utils.logs, []
+    return keys, logs, error
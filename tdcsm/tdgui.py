@@ -1,11 +1,13 @@
 import subprocess, platform, os, copy #, yaml
 import sys
+import queue
 from datetime import datetime
 from tkinter import *
 from tkinter.ttk import *
 from PIL import Image
 from PIL import ImageTk
 from .tdcoa import tdcoa
+from .watch import FileWatcher
 import tdcsm
 
 class coa():
@@ -13,8 +15,6 @@ class coa():
     version = "0.4.1.6"
     debug = False
 
-    entryvars = {}
-    defaults = {}
     #appsize = '800x500' # width x height
     appwidth = 750
     appheight = 550
@@ -33,6 +33,8 @@ class coa():
 
     def __init__(self, approot='', secrets='', **kwargs):
         print('GUI for TDCOA started')
+        self.entryvars = {}
+        self.defaults = {}
         #self.version = str(datetime.now()).replace('-','').replace(':','').split('.')[0].replace(' ','.')
         if approot != '': self.defaults['approot'] = approot
         if secrets != '': self.defaults['secrets'] = secrets
@@ -407,12 +409,18 @@ class coa():
         return self.validate_boolean(self.coa.settings['skip_dbs'],'bool')
 
     def reload_Tx2(self, treetext='not set', leftlist=[], rightlist=[], exclude=[]):
+        # only rows that appear, disappear or move are touched, so unchanged rows keep their state
         intrs = {str('tv_%s_left' %treetext):leftlist, str('tv_%s_right' %treetext):rightlist}
         for nm, lst in intrs.items():
-            self.entryvars[nm].delete(*self.entryvars[nm].get_children())
-            for itm in lst:
-                if itm not in exclude:
-                    self.entryvars[nm].insert('','end',text=str(itm))
+            tv = self.entryvars[nm]
+            wanted = [str(itm) for itm in lst if itm not in exclude]
+            rows = {tv.item(iid, 'text'): iid for iid in tv.get_children()}
+            tv.delete(*[iid for text, iid in rows.items() if text not in wanted])
+            for pos, text in enumerate(wanted):
+                if text in rows:
+                    tv.move(rows[text], '', pos)
+                else:
+                    tv.insert('', pos, text=text)
 
     def upload_get_lastrun_folder (self, lastrunfile='.last_run_output_path.txt'):
         print("updating 'Output Folder' textbox...")
@@ -513,6 +521,20 @@ class coa():
         self.button_click('reload_config')
         return True
 
+    def poll_coa_events(self):
+        try:
+            while True:
+                self.button_click(self.coa_events.get_nowait())
+        except queue.Empty:
+            pass
+        self.app.after(500, self.poll_coa_events)
+
+    def poll_config_files(self):
+        changed = self.watcher.changed()
+        if changed:
+            self.button_click('config_changed', changed=sorted(changed))
+        self.app.after(1000, self.poll_config_files)
+
     def button_click(self, name='', **kwargs):
         print('button clicked',  name)
         argstr = ''
@@ -541,6 +563,15 @@ class coa():
                 self.upload_get_lastrun_folder(lastrunfile='')
                 self.button_click('tv_systems_left') # this 'click' will refresh both left and right treeviews
                 self.button_click('tv_filesets_left')
+                self.watcher = FileWatcher(self.coa.config_files())  # paths may have changed
+                self.print_complete(name)
+            elif name == 'config_changed':
+                # reparse only the changed files, and refresh only the treeviews whose content changed
+                diffs = self.coa.reload_changed(kwargs['changed'], skip_dbs=self.skip_dbs())
+                if diffs['systems'].added or diffs['systems'].removed:
+                    self.button_click('tv_systems_left')
+                if diffs['filesets'] or diffs['systems'].added or diffs['systems'].removed:
+                    self.button_click('tv_filesets_left')
                 self.print_complete(name)
             elif name == 'approot':
                 approot = kwargs['entrytext'].replace(r':\U',r':\\U')
@@ -606,9 +637,12 @@ class coa():
                 elif self.show_hidden_filesets:
                     exclude = []
                 else:
-                    exclude = self.split_dict(self.coa.filesets, 'show_in_gui', default='True' )['False'].keys()
+                    exclude = self.coa.catalog.hidden
                 self.reload_Tx2('filesets', leftlist = d['True'].keys(), rightlist = d['False'].keys(), exclude=exclude)
                 #self.reload_Tx2('filesets_assisted', leftlist = d['True'].keys(), rightlist = d['False'].keys(), exclude=exclude)
+            elif name == 'filesets_updated':
+                print('filesets.yaml was updated in the background, refreshing filesets')
+                self.button_click('tv_filesets_left')
             elif name == 'skip_dbs_toggle':
                 self.coa.settings['skip_dbs'] = bool(kwargs['state'] == 1)
             elif name == 'skip_git_toggle':
@@ -809,6 +843,11 @@ class coa():
 
         self.coa = tdcoa(approot = self.entryvar('approot'))
         self.version = self.coa.version
+
+        # coa events are raised on background threads, queue them up for the tk main loop
+        self.coa_events = queue.Queue()
+        self.coa.filesets_updated.subscribe(lambda coa: self.coa_events.put('filesets_updated'))
+        app.after(500, self.poll_coa_events)
         self.entryvars['secrets'].set(self.first_file_that_exists(self.coa.settings['secrets'], os.path.join(self.entryvar('approot'),"secrets.yaml")))
         self.coa.reload_config(skip_git = True, secrets=self.entryvar('secrets'))
         self.entryvars['bteq_delim'].set(value=self.coa.bteq_delim)
@@ -817,6 +856,10 @@ class coa():
         self.coa.deactivate_all()
         self.upload_get_lastrun_folder()
 
+        # reload configuration files edited while the gui is open, as they are saved
+        self.watcher = FileWatcher(self.coa.config_files())
+        app.after(1000, self.poll_config_files)
+
         # these 'clicks' will refresh both left and right treeviews
         self.button_click('tv_systems_left')
         self.button_click('tv_filesets_left')
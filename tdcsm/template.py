@@ -0,0 +1,151 @@
+"Compiled .coa.sql templates: parsed once into statements, special commands and {name} slots, rendered per system"
+
+import re
+from dataclasses import dataclass
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple, Union
+
+from .sqllexer import SpecialCommand, special_commands, split_sql
+from .substitution import TOKEN, Position, Scope
+from .utils import Utils
+
+# marks slot number n as SENTINEL n SENTINEL while a template is parsed, a character from the unicode private
+# use area: neither whitespace, nor part of the statement or special command syntax
+SENTINEL = '\ue000'
+SLOT = re.compile(f'{SENTINEL}(\\d+){SENTINEL}')
+
+Segments = Tuple[Union[str, int], ...]
+
+
+def segments(text: str) -> Segments:
+	"text split into literal strings and slot numbers"
+	parts = SLOT.split(text)
+	return tuple(int(p) if n % 2 else p for n, p in enumerate(parts) if p or n % 2)
+
+
+def inert(value: str, resolved: bool) -> bool:
+	"""
+	can value fill a slot without changing how the statement it is in splits, formats or parses: no statement
+	delimiter, newline or comment, quotes that leave the lexer in the state they found it, no comment or special
+	command delimiter it could form with its neighbours, and no edge whitespace to strip. An unresolved slot
+	keeps its {name}, which only forms a command delimiter when braced.
+	"""
+	if not value or value != value.strip() or ';' in value or '\n' in value or '/*' in value or '*/' in value or '--' in value:
+		return False
+	if value[0] in '*/-' or value[-1] in '*/-' or not balanced(value):
+		return False
+	return not resolved or ('{' not in value and '}' not in value)
+
+
+def balanced(value: str) -> bool:
+	"do the quotes in value end as they started, whether value is outside quotes or within either kind"
+	for start in ('', "'", '"'):
+		state = start
+		for c in value:
+			if c in '\'"' and state in ('', c):
+				state = c if state == '' else ''
+		if state != start:
+			return False
+	return True
+
+
+@dataclass(frozen=True)
+class Statement:
+	"""
+	A formatted statement, its special commands (their positions are in the compiled text), and its sql with
+	them replaced, or None to parse it once rendered
+	"""
+	text: Segments
+	sql: Optional[Segments]
+	found: Tuple[SpecialCommand, ...]
+	commands: Tuple[Tuple[str, str], ...]
+
+
+@dataclass(frozen=True)
+class Rendered:
+	"A template rendered from a scope: its statements as (text, sql, found, commands), and the positions of the values used"
+	statements: Tuple[Tuple[str, Optional[str], Tuple[SpecialCommand, ...], Dict[str, str]], ...]
+	used: FrozenSet[Position]
+
+
+@dataclass(frozen=True)
+class Template:
+	"""
+	A .coa.sql file split into statements by the sql lexer, each formatted with Utils.format_sql and parsed for
+	special commands, with its {name} tokens as numbered slots. Statements whose special commands contain slots
+	are only parsed once rendered, as their values decide the command. Braced tokens, next to another brace as in
+	/*{{name:value}}*/, are part of the special command syntax and left as text, unless they have a value.
+	"""
+	slots: Tuple[str, ...]
+	braced: FrozenSet[str]
+	statements: Tuple[Statement, ...]
+
+	def render(self, scope: Scope) -> Optional[Rendered]:
+		"the statements with their slots filled from scope, None if a value could change how the file parses"
+		if any(scope.resolve(name) is not None for name in self.braced):
+			return None
+		values, used = [], set()
+		for name in self.slots:
+			resolved = scope.resolve(name)
+			value = '{%s}' % name if resolved is None else resolved[0]
+			if not inert(value, resolved is not None):
+				return None
+			if resolved is not None:
+				used |= resolved[1]
+			values.append(value)
+
+		def join(segs: Segments) -> str:
+			return ''.join(values[s] if isinstance(s, int) else s for s in segs)
+
+		return Rendered(tuple(
+			(join(st.text), None if st.sql is None else join(st.sql), st.found, dict(st.commands)) for st in self.statements),
+			frozenset(used))
+
+
+def compile_template(text: str, replace_with: str = '', keys_to_skip: Sequence[str] = ()) -> Optional[Template]:
+	"parse the text of a .coa.sql file, None if it cannot be compiled"
+	if SENTINEL in text:
+		return None
+	slots: List[str] = []
+	braced = set()
+
+	def slot(m: 're.Match[str]') -> str:
+		start, end = m.span()
+		if text[start - 1:start] == '{' or text[end:end + 1] == '}':
+			braced.add(m.group(1))
+			return m.group(0)
+		slots.append(m.group(1))
+		return f'{SENTINEL}{len(slots) - 1}{SENTINEL}'
+
+	statements = []
+	for raw in split_sql(TOKEN.sub(slot, text)):
+		sql = Utils.format_sql(raw)
+		if sql == '':
+			statements.append(Statement((), (), (), ()))
+			continue
+		parsed = special_commands(sql, replace_with, keys_to_skip)
+		if any(SENTINEL in cmd.text for cmd in parsed.found):
+			statements.append(Statement(segments(sql), None, (), ()))
+		else:
+			statements.append(Statement(segments(sql), segments(parsed.sql), parsed.found, tuple(parsed.commands.items())))
+	return Template(tuple(slots), frozenset(braced), tuple(statements))
+
+
+class TemplateCache:
+	"Compiled templates by the sha256 of their text, so a .coa.sql file used by many systems is parsed once"
+	def __init__(self, replace_with: str = '', keys_to_skip: Sequence[str] = ()):
+		self.replace_with = replace_with
+		self.keys_to_skip = tuple(keys_to_skip)
+		self.templates: Dict[str, Optional[Template]] = {}
+		self._lock = Lock()
+
+	def get(self, text: str) -> Optional[Template]:
+		"the compiled template of text"
+		key = sha256(text.encode('utf-8')).hexdigest()
+		with self._lock:
+			if key in self.templates:
+				return self.templates[key]
+		template = compile_template(text, self.replace_with, self.keys_to_skip)
+		with self._lock:
+			return self.templates.setdefault(key, template)
@@ -0,0 +1,44 @@
+"Parallel integrity verification of downloaded files"
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+from logging import getLogger
+
+from .store import file_digest
+
+logger = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class VerifyResult:
+	"Outcome of checking one file against its expected sha256 digest"
+	path: Path
+	expected: str
+	actual: Optional[str]
+
+	@property
+	def ok(self) -> bool:
+		"True if the file exists and its content matches the expected digest"
+		return self.actual is not None and self.actual.lower() == self.expected.lower()
+
+
+def check(path: Path, expected: str) -> VerifyResult:
+	"hash one file and compare it with the expected digest, a missing file never matches"
+	try:
+		return VerifyResult(path, expected, file_digest(path))
+	except FileNotFoundError:
+		return VerifyResult(path, expected, None)
+
+
+def verify(files: Iterable[Tuple[Path, str]], max_workers: int = 8) -> Iterator[VerifyResult]:
+	"""
+	Hash (path, expected sha256) pairs using a pool of threads, yielding results in the same order.
+	hashlib releases the GIL while hashing, so hashing scales with workers until limited by disk speed.
+	"""
+	files = list(files)
+	if not files:
+		return
+	with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files))), thread_name_prefix='tdcsm-verify') as pool:
+		yield from pool.map(lambda f: check(*f), files)
@@ -0,0 +1,73 @@
+"Watching configuration files for changes, and diffing the dictionaries they load into"
+
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Mapping, Optional, Set, Tuple
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DictDiff:
+	"Names added to, removed from, or with a changed value in a dictionary"
+	added: FrozenSet[str] = frozenset()
+	removed: FrozenSet[str] = frozenset()
+	changed: FrozenSet[str] = frozenset()
+
+	def __bool__(self) -> bool:
+		return bool(self.added or self.removed or self.changed)
+
+
+def diff(old: Mapping[str, Any], new: Mapping[str, Any]) -> DictDiff:
+	"compare two dictionaries by name"
+	return DictDiff(
+		frozenset(k for k in new if k not in old),
+		frozenset(k for k in old if k not in new),
+		frozenset(k for k in new if k in old and new[k] != old[k]),
+	)
+
+
+class FileWatcher:
+	"""
+	Detects which of a set of named files changed since they were last checked. Files are only read when
+	their size or modification time changed, and only reported when their content changed as well, so
+	saving a file without changes, or touching it, is not a change. A file that appears or disappears is.
+	"""
+	def __init__(self, paths: Mapping[str, Path]):
+		self.paths = {name: Path(path) for name, path in paths.items()}
+		self.state: Dict[str, Tuple[Optional[Tuple[int, int]], Optional[str]]] = {name: self.probe(path) for name, path in self.paths.items()}
+
+	@staticmethod
+	def stamp(path: Path) -> Optional[Tuple[int, int]]:
+		"modification time and size of path, None if it does not exist"
+		try:
+			st = path.stat()
+		except OSError:
+			return None
+		return st.st_mtime_ns, st.st_size
+
+	def probe(self, path: Path) -> Tuple[Optional[Tuple[int, int]], Optional[str]]:
+		"stamp and content digest of path"
+		stamp = self.stamp(path)
+		if stamp is None:
+			return None, None
+		try:
+			return stamp, sha256(path.read_bytes()).hexdigest()
+		except OSError:
+			return None, None
+
+	def changed(self) -> Set[str]:
+		"names of the files whose content changed since the last call (or since the watcher was created)"
+		result = set()
+		for name, path in self.paths.items():
+			stamp, digest = self.state[name]
+			if self.stamp(path) == stamp:
+				continue
+			self.state[name] = self.probe(path)
+			if self.state[name][1] != digest:
+				result.add(name)
+		if result:
+			logger.debug("changed: %s", ', '.join(sorted(result)))
+		return result
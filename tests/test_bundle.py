@@ -0,0 +1,39 @@
+"test cases for offline fileset bundles"
+from pathlib import Path
+import yaml
+from tdcsm.bundle import pack_bundle
+from tdcsm.download import Downloader, DownloadIndex, DownloadJob
+
+
+def make_githost(root: Path) -> Path:
+	"create a local githost tree with one fileset"
+	(root / "filesets" / "demo").mkdir(parents=True)
+	(root / "motd.html").write_text("<html>hello</html>")
+	(root / "filesets" / "filesets.yaml").write_text(yaml.safe_dump({
+		"demo": {"active": "True", "fileset_version": "1.0", "files": {
+			"one": {"gitfile": "demo/one.coa.sql"},
+			"two": {"gitfile": "demo/two.coa.sql"},
+			"gone": {"gitfile": "demo/gone.coa.sql"},
+		}},
+	}))
+	(root / "filesets" / "demo" / "one.coa.sql").write_text("select 1;")
+	(root / "filesets" / "demo" / "two.coa.sql").write_text("select 2;")
+	return root
+
+
+def test_bundle_roundtrip(tmp_path: Path) -> None:
+	"assert a bundle packed from a file:// githost serves the same files, and supports revalidation"
+	githost = make_githost(tmp_path / "git").as_uri()
+	bundle = tmp_path / "coa-bundle.zip"
+
+	missing = pack_bundle(githost, bundle)
+	assert missing == ["filesets/demo/gone.coa.sql"]
+
+	index = DownloadIndex(tmp_path / "download_index.json")
+	jobs = [DownloadJob(f"{bundle}/filesets/demo/{n}.coa.sql", tmp_path / "dl" / f"{n}.coa.sql") for n in ["one", "two", "gone"]]
+	with Downloader(index=index) as d:
+		assert [r.status_code for r in d.run(jobs)] == [200, 200, 404]
+		assert [r.status_code for r in d.run(jobs[:2])] == [304, 304]
+		assert d.get(f"{bundle}/motd.html").text == "<html>hello</html>"
+
+	assert [j.savefile.read_text() for j in jobs[:2]] == ["select 1;", "select 2;"]
@@ -0,0 +1,36 @@
+"test cases for the filesets catalog"
+from tdcsm.catalog import FilesetCatalog, load_yaml
+
+FILESETS = load_yaml("""
+demo:
+  active: "True"
+  fileset_version: "1.0"
+  files:
+    all: {gitfile: demo/all.coa.sql, some_value: "1"}
+    pdcr: {gitfile: demo/pdcr.coa.sql, collection: pdcr}
+    v17: {gitfile: demo/v17.coa.sql, dbsversion: ["17.10", "17.20"]}
+dev:
+  active: "True"
+  show_in_gui: "False"
+  files:
+    x: {gitfile: dev/x.coa.sql}
+""")
+
+
+def test_catalog() -> None:
+	"assert file lookups by basename and by dbsversion/collection, and hidden filesets"
+	catalog = FilesetCatalog(FILESETS)
+
+	assert "demo" in catalog and "missing" not in catalog
+	assert catalog.file("demo", "all.coa.sql")["some_value"] == "1"
+	assert catalog.file("demo", "x.coa.sql") is None
+	assert catalog.file("missing", "all.coa.sql") is None
+	assert list(catalog.files("demo")) == ["all", "pdcr", "v17"]
+	assert catalog.hidden == {"dev"}
+
+	def matching(*args: str) -> list:
+		return [f["gitfile"] for f in catalog.matching("demo", *args)]
+
+	assert matching("16.20", "pdcr") == ["demo/all.coa.sql", "demo/pdcr.coa.sql"]
+	assert matching("17.20", "dbc") == ["demo/all.coa.sql", "demo/v17.coa.sql"]
+	assert catalog.matching("missing", "16.20", "pdcr") == []
@@ -0,0 +1,33 @@
+"test cases for the read-only command line fast path"
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from tdcsm.cli import main
+main(['--approot', sys.argv[1], 'status'])
+print('elapsed', time.perf_counter() - start)
+assert not {'tdcsm.tdcoa', 'tdcsm.tdgui', 'pandas', 'teradatasql'} & set(sys.modules), 'heavy modules imported'
+"""
+
+
+def test_status(tmp_path: Path, record_property) -> None:
+	"assert status reports active systems and ledger versions without ever importing tdcoa"
+	(tmp_path / "config.yaml").write_text("folders: {download: dl}\nsettings: {localfilesets: '{download}/filesets.yaml'}\n")
+	(tmp_path / "source_systems.yaml").write_text("""systems:
+  SysA: {active: 'True', siteid: s, host: h, username: u, password: p, logmech: TD2, filesets: {demo: {active: 'True'}}}
+  SysB: {active: 'False', siteid: s, host: h, username: u, password: p, logmech: TD2, filesets: {demo: {active: 'True'}}}
+""")
+	(tmp_path / "dl").mkdir()
+	(tmp_path / "dl" / "filesets.yaml").write_text("demo: {active: 'True', fileset_version: '1.0', files: {}}\n")
+	(tmp_path / "dl" / "fileset_versions.json").write_text(json.dumps({"download": {"demo": {"version": "1.0", "key": "k"}}}))
+
+	for _ in range(2):  # second run reads the filesets from the cache
+		out = subprocess.run([sys.executable, "-c", SCRIPT, str(tmp_path)], capture_output=True, text=True, check=True).stdout
+		assert "SysA    demo     1.0        1.0         -" in out
+		assert "SysB" not in out and "1 of 2 systems enabled" in out
+		assert (tmp_path / ".config_cache.pickle").exists()
+	record_property("status_seconds", float(out.split()[-1]))
@@ -0,0 +1,162 @@
+"test cases for the fileset download engine"
+import json
+import os
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+from typing import Any, Iterator, Set
+import pytest
+import tdcsm
+from tdcsm.download import Downloader, DownloadIndex, DownloadJob
+from tdcsm.tdcoa import tdcoa
+from test_bundle import make_githost
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+	"static file handler that doesn't log to stderr"
+	def log_message(self, *_: Any) -> None:
+		pass
+
+
+@pytest.fixture
+def githost(tmp_path: Path) -> Iterator[str]:
+	"serve a directory of fileset files over http, return its base url"
+	srcdir = tmp_path / "git"
+	(srcdir / "demo").mkdir(parents=True)
+	for n in range(5):
+		(srcdir / "demo" / f"file{n}.coa.sql").write_text(f"select {n};")
+
+	server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(srcdir)))
+	Thread(target=server.serve_forever, daemon=True).start()
+	yield f"http://127.0.0.1:{server.server_port}/"
+	server.shutdown()
+
+
+def test_download_all(githost: str, tmp_path: Path) -> None:
+	"assert all files are downloaded and results are in job order"
+	jobs = [DownloadJob(f"{githost}demo/file{n}.coa.sql", tmp_path / "dl" / f"file{n}.coa.sql") for n in range(5)]
+
+	with Downloader(max_workers=3) as d:
+		results = list(d.run(jobs))
+
+	assert [r.job for r in results] == jobs
+	assert all(r.ok for r in results)
+	assert [j.savefile.read_text() for j in jobs] == [f"select {n};" for n in range(5)]
+
+
+def test_download_missing(githost: str, tmp_path: Path) -> None:
+	"assert a missing file is reported, not saved"
+	job = DownloadJob(f"{githost}demo/missing.coa.sql", tmp_path / "missing.coa.sql")
+
+	with Downloader() as d:
+		result = d.fetch(job)
+
+	assert not result.ok and result.status_code == 404
+	assert not job.savefile.exists()
+
+
+def test_download_revalidate(githost: str, tmp_path: Path) -> None:
+	"assert unchanged files are revalidated rather than downloaded again"
+	index = DownloadIndex(tmp_path / "download_index.json")
+	jobs = [DownloadJob(f"{githost}demo/file{n}.coa.sql", tmp_path / f"file{n}.coa.sql") for n in range(4)]
+
+	with Downloader(index=index) as d:
+		assert [r.status_code for r in d.run(jobs)] == [200] * 4
+	index.save()
+
+	jobs[1].savefile.write_text("locally modified")
+	jobs[2].savefile.write_text("select 9;")  # edited in place, to the same size
+	os.utime(jobs[3].savefile, ns=(0, 0))  # only touched
+	with Downloader(index=DownloadIndex(index.path)) as d:
+		results = list(d.run(jobs))
+
+	assert [r.status_code for r in results] == [304, 200, 200, 304]
+	assert [j.savefile.read_text() for j in jobs] == [f"select {n};" for n in range(4)]
+
+
+class FlakyHandler(QuietHandler):
+	"static file handler that answers 503 to the first request for each path"
+	seen: Set[str] = set()
+
+	def do_GET(self) -> None:
+		if self.path not in self.seen:
+			self.seen.add(self.path)
+			self.send_error(503)
+		else:
+			super().do_GET()
+
+
+def test_download_retry(githost: str, tmp_path: Path) -> None:
+	"assert transient failures are retried, and reported without stopping other downloads once retries run out"
+	server = ThreadingHTTPServer(("127.0.0.1", 0), partial(FlakyHandler, directory=str(tmp_path / "git")))
+	Thread(target=server.serve_forever, daemon=True).start()
+	flaky = f"http://127.0.0.1:{server.server_port}/"
+	jobs = [DownloadJob(f"{flaky}demo/file{n}.coa.sql", tmp_path / f"file{n}.coa.sql") for n in range(3)]
+
+	try:
+		with Downloader(retries=0) as d:
+			assert [r.status_code for r in d.run(jobs[:1])] == [503]
+		with Downloader(retries=2, backoff=0.01) as d:
+			results = list(d.run(jobs))
+	finally:
+		server.shutdown()
+
+	assert [(r.status_code, r.attempts) for r in results] == [(200, 1), (200, 2), (200, 2)]
+	assert [j.savefile.read_text() for j in jobs] == [f"select {n};" for n in range(3)]
+
+
+def test_download_resume(githost: str, tmp_path: Path) -> None:
+	"assert files journaled by an unfinished run are not requested again"
+	index = DownloadIndex(tmp_path / "download_index.json")
+	jobs = [DownloadJob(f"{githost}demo/file{n}.coa.sql", tmp_path / f"file{n}.coa.sql") for n in range(2)] \
+		+ [DownloadJob(f"{githost}demo/missing.coa.sql", tmp_path / "missing.coa.sql")]
+
+	with Downloader(index=index) as d:
+		assert [r.status_code for r in d.run(jobs)] == [200, 200, 404]
+
+	jobs[1].savefile.write_text("select 9;")
+	with Downloader(index=DownloadIndex(index.path)) as d:
+		results = list(d.run(jobs))
+
+	assert [(r.resumed, r.status_code) for r in results] == [(True, 304), (False, 200), (False, 404)]
+	assert jobs[1].savefile.read_text() == "select 1;"
+
+	index.clear_journal()
+	assert not DownloadIndex(index.path).journaled
+
+
+def test_download_files_partial(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+	"assert a fileset with a missing gitfile is reported and left unrecorded, while the rest of the run completes"
+	git = make_githost(tmp_path / "git")
+	(git / "filesets" / "extra").mkdir()
+	(git / "filesets" / "extra" / "x.coa.sql").write_text("select 'x';")
+	filesets = (git / "filesets" / "filesets.yaml").read_text()
+	filesets += 'extra: {active: "True", fileset_version: "1.0", files: {x: {gitfile: extra/x.coa.sql}}}\n'
+	approot = tmp_path / "app"
+	(approot / "1_download").mkdir(parents=True)
+	config = (Path(tdcsm.__file__).parent / "config.yaml").read_text()
+	config = config.replace("settings:\n", 'settings:\n  skip_git: "True"\n').replace(
+		'"https://raw.githubusercontent.com/tdcoa/sql/master/"', f'"{git.as_uri()}/"').replace(
+		'skip_unchanged_filesets: "False"', 'skip_unchanged_filesets: "True"')
+	(approot / "config.yaml").write_text(config)
+	(approot / "source_systems.yaml").write_text("""systems:
+  SysA: {active: 'True', siteid: s, host: h, username: u, password: p, logmech: TD2, filesets: {demo: {active: 'True'}, extra: {active: 'True'}}}
+""")
+	(approot / "1_download" / "filesets.yaml").write_text(filesets)
+
+	log = []
+	monkeypatch.chdir(tmp_path)  # a relative approot, as run_gui and the cli use, gives ./app/... paths
+	coa = tdcoa("app", printlog=False, skip_dbs=True)
+	coa.utils.sink, coa.utils.printlog = log.append, True
+	coa.download_files(motd=False)
+
+	assert [f.read_text() for f in sorted((approot / "1_download" / "demo").iterdir())] == ["select 1;", "select 2;"]
+	assert any("1 of 4 files could not be downloaded" in msg and "gone.coa.sql" in msg for msg in log)
+	assert "demo" not in json.loads((approot / "1_download" / "fileset_versions.json").read_text()).get("download", {})
+
+	# the files of the unchanged fileset are not requested again, nor counted
+	log.clear()
+	coa.download_files(motd=False)
+	assert any("fileset extra version 1.0 unchanged" in msg for msg in log)
+	assert any("1 of 3 files could not be downloaded" in msg for msg in log)
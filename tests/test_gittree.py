@@ -0,0 +1,49 @@
+"test cases for git tree delta sync"
+import shutil
+import subprocess
+from pathlib import Path
+import pytest
+from tdcsm.download import DownloadIndex, DownloadJob
+from tdcsm.gittree import GitTreeSync, blob_sha, local_tree
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason="git is not installed")
+
+
+def git(repo: Path, *args: str) -> str:
+	return subprocess.run(['git', '-C', str(repo), '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args],
+		check=True, capture_output=True, text=True).stdout
+
+
+def test_blob_sha(tmp_path: Path) -> None:
+	"assert blob SHAs are computed the way git does"
+	(tmp_path / "f.sql").write_bytes(b"select 1;\n")
+	assert blob_sha(b"select 1;\n") == git(tmp_path, 'hash-object', 'f.sql').strip()
+
+
+def test_gittree_sync(tmp_path: Path) -> None:
+	"assert only files whose blob changed are read from the tree"
+	work = tmp_path / "work"
+	(work / "filesets" / "demo").mkdir(parents=True)
+	git(work, 'init', '-q')
+	for n in range(3):
+		(work / "filesets" / "demo" / f"file{n}.coa.sql").write_text(f"select {n};")
+	git(work, 'add', '-A')
+	git(work, 'commit', '-qm', 'init')
+	git(tmp_path, 'clone', '-q', '--bare', str(work), str(tmp_path / "bare"))
+
+	githost = "http://example.invalid/"
+	jobs = [DownloadJob(f"{githost}filesets/demo/file{n}.coa.sql", tmp_path / "dl" / f"file{n}.coa.sql") for n in range(4)]
+	index = DownloadIndex(tmp_path / "download_index.json")
+
+	def sync() -> list:
+		return [r.status_code for r in GitTreeSync(local_tree(tmp_path / "bare"), githost, index).run(jobs)]
+
+	assert sync() == [200, 200, 200, 404]
+	assert sync() == [304, 304, 304, 404]
+
+	(work / "filesets" / "demo" / "file1.coa.sql").write_text("select 'changed';")
+	git(work, 'commit', '-qam', 'change')
+	git(work, 'push', '-q', str(tmp_path / "bare"), 'HEAD')
+
+	assert sync() == [304, 200, 304, 404]
+	assert jobs[1].savefile.read_text() == "select 'changed';"
@@ -0,0 +1,39 @@
+"test cases for the import time of tdcsm.tdcoa"
+import subprocess
+import sys
+from typing import Callable, Dict
+
+# pandas itself imports pandas.plotting, but not its matplotlib backend
+HEAVY = ["matplotlib", "seaborn", "mpl_toolkits", "pptx", "pandas.plotting._matplotlib"]
+
+
+def importtime(module: str) -> Dict[str, int]:
+	"cumulative import time in microseconds of every module imported by a fresh interpreter importing module"
+	proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True)
+	result = {}
+	for line in proc.stderr.splitlines():
+		if not line.startswith("import time:") or "cumulative" in line:
+			continue
+		_, cumulative, name = line[len("import time:"):].split("|")
+		result[name.strip()] = int(cumulative)
+	return result
+
+
+def test_import_lazy(record_property: Callable[[str, object], None]) -> None:
+	"assert importing tdcsm.tdcoa does not load the plotting or pptx stacks, and record its import time"
+	times = importtime("tdcsm.tdcoa")
+	record_property("tdcsm.tdcoa_import_us", times["tdcsm.tdcoa"])
+
+	assert [m for m in HEAVY if m in times] == []
+
+	# and none of them in sys.modules once tdcsm.tdcoa is imported
+	code = f"import sys, tdcsm.tdcoa; loaded = [m for m in {HEAVY!r} if m in sys.modules]; assert not loaded, loaded"
+	subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_charts_lazy() -> None:
+	"assert chart helpers are still reachable through Utils, and load the plotting stack on first use"
+	code = "import sys; from tdcsm.utils import Utils; assert 'matplotlib' not in sys.modules; " \
+		"assert Utils.pad([1], 0, 3) == [1, 0, 0]; assert Utils('1').human_readable_names('a_b') == 'a b'; " \
+		"assert 'matplotlib' in sys.modules"
+	subprocess.run([sys.executable, "-c", code], check=True)
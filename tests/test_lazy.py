@@ -0,0 +1,55 @@
+"test cases for lazy, side-effect-free tdcoa construction"
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pytest
+from tdcsm.tdcoa import tdcoa
+
+
+def test_open_readonly(tmp_path: Path) -> None:
+	"assert a readonly instance loads the default configuration in memory, and never writes to approot"
+	coa = tdcoa.open(str(tmp_path), readonly=True, printlog=False)
+	assert "settings" not in coa.__dict__
+
+	assert "Transcend" in coa.systems
+	assert coa.folders["run"] == "3_ready_to_run"
+	assert coa.filesets == {}
+	with pytest.raises(PermissionError):
+		coa.prepare_sql()
+	assert list(tmp_path.iterdir()) == []
+
+
+def test_open_lazy(tmp_path: Path) -> None:
+	"assert a lazy instance writes default files and folders only once its workspace is prepared"
+	coa = tdcoa.open(str(tmp_path), printlog=False)
+	coa.settings["skip_git"] = "True"
+	assert list(tmp_path.iterdir()) == []
+
+	coa.prepare_workspace()
+	assert {"config.yaml", "secrets.yaml", "source_systems.yaml", "1_download", "3_ready_to_run"} <= {p.name for p in tmp_path.iterdir()}
+	assert (tmp_path / "3_ready_to_run" / "runlog.txt").exists()
+
+
+def test_isolated_instances(tmp_path: Path) -> None:
+	"assert instances driven from concurrent threads keep their configuration and run logs apart"
+	assert not [k for k, v in vars(tdcoa).items() if isinstance(v, (dict, list, set))]
+
+	def run(name: str) -> list:
+		messages = []
+		(tmp_path / name).mkdir()
+		coa = tdcoa.open(str(tmp_path / name), logsink=messages.append)
+		coa.settings["skip_git"] = "True"
+		coa.systems["Transcend"]["siteid"] = name
+		coa.prepare_workspace()
+		for i in range(200):
+			coa.utils.log(name, str(i))
+		return messages
+
+	with ThreadPoolExecutor(2) as pool:
+		results = dict(zip("AB", pool.map(run, "AB")))
+
+	for name, other in ("A", "B"), ("B", "A"):
+		mine, theirs = (name + ":").ljust(30), (other + ":").ljust(30)
+		runlog = (tmp_path / name / "3_ready_to_run" / "runlog.txt").read_text()
+		assert runlog.count("\n" + mine) == 200 and theirs not in runlog
+		assert sum(m.startswith(mine) for m in results[name]) == 200
+		assert not any(m.startswith(theirs) for m in results[name])
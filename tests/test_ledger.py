@@ -0,0 +1,39 @@
+"test cases for the fileset version ledger"
+from pathlib import Path
+from tdcsm.ledger import VersionLedger, fingerprint, referenced
+
+
+def test_referenced() -> None:
+	"assert only values referenced by the text, directly or through other values, are kept"
+	layers = [{"a": "{b}", "unused": "x"}, {"b": "value", "YYYYMMDD": "20200101", "nested": {"a": 1}}]
+	assert referenced(["select {a} from t;"], layers) == [{"a": "{b}"}, {"b": "value"}]
+
+
+def test_ledger(tmp_path: Path) -> None:
+	"assert entries persist, and filesets without a version are never current"
+	ledger = VersionLedger(tmp_path / "fileset_versions.json")
+	key = fingerprint({"b": 1, "a": 2})
+	assert key == fingerprint({"a": 2, "b": 1})
+
+	ledger.record("prepare", "SysA/demo", "1.0", key)
+	ledger.record("prepare", "SysA/dev", None, key)
+	ledger.save()
+
+	ledger = VersionLedger(ledger.path)
+	assert ledger.current("prepare", "SysA/demo", "1.0", key)
+	assert not ledger.current("prepare", "SysA/demo", "1.1", key)
+	assert not ledger.current("prepare", "SysA/demo", "1.0", fingerprint("other"))
+	assert not ledger.current("prepare", "SysA/dev", None, key)
+
+
+def test_ledger_keys(tmp_path: Path) -> None:
+	"assert the entries under a prefix are read back at their version, and replaced as a whole"
+	ledger = VersionLedger(tmp_path / "fileset_versions.json")
+	ledger.replace("prepare files", "SysA/demo", "1.0", {"a.coa.sql": "ka", "b.coa.sql": "kb"})
+	ledger.record("prepare files", "SysA/demo2/c.coa.sql", "1.0", "kc")
+	assert ledger.keys("prepare files", "SysA/demo", "1.0") == {"a.coa.sql": "ka", "b.coa.sql": "kb"}
+	assert ledger.keys("prepare files", "SysA/demo", "1.1") == {}
+
+	ledger.replace("prepare files", "SysA/demo", "1.1", {"a.coa.sql": "ka2"})
+	assert ledger.keys("prepare files", "SysA/demo", "1.1") == {"a.coa.sql": "ka2"}
+	assert ledger.keys("prepare files", "SysA/demo2", "1.0") == {"c.coa.sql": "kc"}
@@ -0,0 +1,96 @@
+"test cases for the database connection pool"
+import re
+from typing import Any, List
+import pytest
+from tdcsm.pool import ConnectionPool
+
+
+class Conn:
+	"stand-in for a database connection, keeping the session state jobs change"
+	def __init__(self, database: str = "dbc") -> None:
+		self.closed = False
+		self.database = database
+		self.volatile: List[str] = []
+
+	def cursor(self) -> 'Cursor':
+		return Cursor(self)
+
+	def close(self) -> None:
+		self.closed = True
+
+
+class Cursor:
+	"runs the few statements the pool and the tests use against a Conn"
+	def __init__(self, conn: Conn) -> None:
+		self.conn = conn
+		self.description: Any = None
+		self.rows: List[tuple] = []
+
+	def execute(self, sql: str) -> None:
+		if sql == "SELECT DATABASE":
+			self.description, self.rows = [("Database",)], [(self.conn.database,)]
+		elif sql == "HELP VOLATILE TABLE":
+			self.description = [("Session Id",), ("Table Name",)]
+			self.rows = [(1, f"{name}   ") for name in self.conn.volatile]
+		elif re.match(r"CREATE MULTISET VOLATILE TABLE (\w+)", sql):
+			name = sql.split()[4]
+			if name in self.conn.volatile:
+				raise RuntimeError(f"table {name} already exists")
+			self.conn.volatile.append(name)
+		elif sql.startswith("DROP TABLE "):
+			self.conn.volatile.remove(sql[len("DROP TABLE "):].strip('"'))
+		elif sql.startswith("DATABASE "):
+			self.conn.database = sql[len("DATABASE "):].strip('"')
+
+	def fetchone(self) -> tuple:
+		return self.rows[0]
+
+	def fetchall(self) -> List[tuple]:
+		return self.rows
+
+	def __enter__(self) -> 'Cursor':
+		return self
+
+	def __exit__(self, *exc: Any) -> None:
+		pass
+
+
+def test_session_reuse() -> None:
+	"assert connections are handed back when a session ends, and reused by the next one for the same logon"
+	opened = []
+	pool = ConnectionPool(connect=lambda **c: opened.append(Conn()) or opened[-1], max_idle=1)
+	with pool.session() as session:
+		a, b = session(host="h", username="u"), session(host="h", username="u")
+	assert len(opened) == 2 and len(pool) == 1 and b.closed and not a.closed
+
+	with pool.session() as session:
+		assert session(host="h", username="u") is a
+		assert session(host="h", username="other") is opened[-1] is not a
+
+	with pytest.raises(RuntimeError):
+		with pool.session() as session:
+			c = session(host="h", username="u")
+			raise RuntimeError("job failed")
+	assert c.closed and len(pool) == 1
+
+	pool.idle_timeout = 0
+	pool.expire()
+	assert len(pool) == 0 and all(c.closed for c in opened)
+
+
+def test_session_state_reset() -> None:
+	"assert volatile tables and database changes of one job never reach the next job given the same connection"
+	pool = ConnectionPool(connect=lambda **c: Conn())
+	for _ in range(2):
+		with pool.session() as session:
+			conn = session(host="h", username="u")
+			with conn.cursor() as csr:
+				csr.execute("CREATE MULTISET VOLATILE TABLE temp_csv (a INT)")
+				csr.execute('DATABASE "other"')
+	assert len(pool) == 1 and conn.volatile == [] and conn.database == "dbc" and not conn.closed
+
+	# connections that can't be reset are closed rather than pooled
+	unresettable = ConnectionPool(connect=lambda **c: Conn(), reset=None)
+	with unresettable.session() as session:
+		conn = session(host="h", username="u")
+	assert conn.closed and len(unresettable) == 0
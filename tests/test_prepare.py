@@ -0,0 +1,90 @@
+"test cases for preparing filesets in worker processes"
+import filecmp
+from pathlib import Path
+import tdcsm
+from tdcsm.tdcoa import tdcoa
+
+SYSTEM = """  Sys{n}:
+    active: "True"
+    siteid: "SITE{n}"
+    host: "{n}.example.com"
+    logmech: "ldap"
+    username: "user"
+    password: "secret{n}"
+    filesets:
+      demo:
+        active: "True"
+"""
+
+
+def prepare(approot: Path, jobs: int) -> list:
+	"the run log of prepare_sql(jobs=jobs), without its time stamps"
+	log = []
+	coa = tdcoa(str(approot), printlog=False, skip_dbs=True)
+	coa.utils.sink, coa.utils.printlog = log.append, True
+	coa.prepare_sql(jobs=jobs)
+	start = next(i for i, msg in enumerate(log) if 'PREPARE_SQL STARTED' in msg)
+	return [msg for msg in log[start:] if not msg.startswith('time')]
+
+
+def make_approot(approot: Path, systems: int, incremental: bool = False) -> None:
+	"an approot with a demo fileset downloaded, active on that many systems, that needs no network"
+	config = (Path(tdcsm.__file__).parent / "config.yaml").read_text()
+	config = config.replace("settings:\n", 'settings:\n  skip_git: "True"\n')
+	if incremental:
+		config = config.replace('skip_unchanged_filesets: "False"', 'skip_unchanged_filesets: "True"')
+	(approot / "config.yaml").write_text(config)
+	(approot / "source_systems.yaml").write_text("systems:\n" + "".join(SYSTEM.format(n=n) for n in range(systems)))
+	demo = approot / "1_download" / "demo"
+	demo.mkdir(parents=True)
+	(approot / "1_download" / "filesets.yaml").write_text("""demo:
+  active: "True"
+  fileset_version: "1.0"
+  files:
+    demo_sql: {gitfile: "demo/demo.coa.sql", part: "one"}
+    demo_plain: {gitfile: "demo/plain.coa.sql"}
+    demo_csv: {gitfile: "demo/loop.csv"}
+""")
+	(demo / "demo.coa.sql").write_text("/* {siteid} */\nSELECT '{part}' as p, '{host}' as h\n/*{{save:{siteid}.csv}}*/;\n\n"
+		"SELECT '{name}' as nm\n/*{{loop:loop.csv}}*/;\n")
+	(demo / "plain.coa.sql").write_text("SELECT '{siteid}' as site;\n")
+	(demo / "loop.csv").write_text("name\nalpha\nbeta\n")
+
+
+def test_prepare_jobs(tmp_path: Path) -> None:
+	"assert filesets prepared in worker processes give the serial run folder and run log, in the same order"
+	make_approot(tmp_path, 4)
+	runroot = tmp_path / "3_ready_to_run"
+	serial = prepare(tmp_path, 1)
+	(tmp_path / "serial").mkdir()
+	for sysfolder in runroot.glob("Sys*"):
+		sysfolder.rename(tmp_path / "serial" / sysfolder.name)
+
+	assert prepare(tmp_path, 2) == serial
+	assert len([msg for msg in serial if 'PREPARING FILESET' in msg]) == 4
+	assert not any('secret' in msg for msg in serial)
+	for n in range(4):
+		cmp = filecmp.dircmp(tmp_path / "serial" / f"Sys{n}" / "demo", runroot / f"Sys{n}" / "demo")
+		assert cmp.left_list == cmp.right_list and not cmp.diff_files and not cmp.funny_files
+		assert f"SITE{n}" in (runroot / f"Sys{n}" / "demo" / "demo.coa.sql").read_text()
+
+
+def test_prepare_incremental(tmp_path: Path) -> None:
+	"assert only outputs whose source, values or collateral changed are prepared again, to what a full prepare gives"
+	make_approot(tmp_path, 1, incremental=True)
+	prepare(tmp_path, 1)
+	loop = tmp_path / "1_download" / "demo" / "loop.csv"
+	loop.write_text(loop.read_text() + "gamma\n")
+
+	log = prepare(tmp_path, 1)
+	assert any("KEEPING COA.SQL FILE" in msg and msg.endswith("plain.coa.sql") for msg in log)
+	assert any("PROCESSING COA.SQL FILE" in msg and msg.endswith("demo.coa.sql") for msg in log)
+	assert not any("PROCESSING COA.SQL FILE" in msg and msg.endswith("plain.coa.sql") for msg in log)
+	outputs = {p.name: p.read_text() for p in (tmp_path / "3_ready_to_run" / "Sys0" / "demo").iterdir()}
+	assert "gamma" in outputs["demo.coa.sql"] and "SITE0" in outputs["plain.coa.sql"]
+
+	(tmp_path / "config.yaml").write_text((tmp_path / "config.yaml").read_text().replace(
+		'skip_unchanged_filesets: "True"', 'skip_unchanged_filesets: "False"'))
+	log = prepare(tmp_path, 1)
+	assert not any("KEEPING" in msg for msg in log)
+	assert outputs == {p.name: p.read_text() for p in (tmp_path / "3_ready_to_run" / "Sys0" / "demo").iterdir()}
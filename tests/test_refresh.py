@@ -0,0 +1,67 @@
+"test cases for background refresh of control files"
+from pathlib import Path
+import pytest
+from tdcsm.download import Downloader, DownloadIndex, DownloadJob
+from tdcsm.refresh import Event, refresh_file
+from tdcsm.tdcoa import tdcoa
+from test_prepare import make_approot
+
+
+def test_refresh_file(tmp_path: Path) -> None:
+	"assert a file is only replaced when its content changed, and never with content that fails validation"
+	src = tmp_path / "git" / "filesets.yaml"
+	src.parent.mkdir()
+	src.write_text("demo: {}")
+	job = DownloadJob(src.as_uri(), tmp_path / "local" / "filesets.yaml")
+	index = DownloadIndex(tmp_path / "download_index.json")
+
+	def validate(content: bytes) -> None:
+		if not content.strip():
+			raise ValueError("empty")
+
+	with Downloader(retries=0) as d:
+		assert refresh_file(d, job, index, validate)
+		assert not refresh_file(d, job, index, validate)
+
+		src.write_text("")
+		with pytest.raises(ValueError):
+			refresh_file(d, job, index, validate)
+
+	assert job.savefile.read_text() == "demo: {}"
+
+
+def test_refresh_swaps_filesets(tmp_path: Path) -> None:
+	"assert refreshed filesets are swapped in as new dictionaries, keeping the selection of systems and filesets"
+	make_approot(tmp_path, 2)
+	coa = tdcoa(str(tmp_path), printlog=False, skip_dbs=True)
+	old_systems, old_filesets = coa.systems, coa.filesets
+	coa.systems["Sys1"]["filesets"]["demo"]["active"] = "False"
+
+	src = tmp_path / "git" / "filesets.yaml"
+	src.parent.mkdir()
+	src.write_text((tmp_path / "1_download" / "filesets.yaml").read_text() + 'extra:\n  active: "True"\n  files: {}\n')
+	updated = []
+	coa.filesets_updated.subscribe(updated.append)
+	coa._refresh_filesets(src.as_uri())
+
+	assert updated == [coa] and coa.systems is not old_systems and coa.filesets is not old_filesets
+	assert sorted(coa.filesets) == ["demo", "extra"] and sorted(old_filesets) == ["demo"]
+	assert all("extra" not in s["filesets"] for s in old_systems.values())
+	assert coa.systems["Sys0"]["filesets"]["extra"] == {"active": False}
+	assert coa.systems["Sys0"]["filesets"]["demo"]["active"] == "True" and coa.systems["Sys1"]["filesets"]["demo"]["active"] == "False"
+
+
+def test_event() -> None:
+	"assert all subscribers are called, even if one of them fails"
+	event, seen = Event("test"), []
+
+	@event.subscribe
+	def failing(value: int) -> None:
+		raise RuntimeError(value)
+
+	event.subscribe(seen.append)
+	event.emit(1)
+	event.unsubscribe(failing)
+	event.emit(2)
+
+	assert seen == [1, 2]
@@ -0,0 +1,41 @@
+"test cases for the run plan"
+import dataclasses
+import pytest
+from tdcsm.runplan import make_run_plan
+
+FILESETS = {
+	"demo": {"active": "True", "fileset_version": 1.0, "files": {
+		"all": {"gitfile": "demo/all.coa.sql"},
+		"v17": {"gitfile": "demo/v17.coa.sql", "dbsversion": ["17.10"]},
+	}},
+	"old": {"active": "False", "files": {"x": {"gitfile": "old/x.coa.sql"}}},
+}
+
+
+def system(dbsversion: str, *filesets: str, active: str = "True") -> dict:
+	return {"active": active, "siteid": "site", "host": "host", "username": "user", "password": "pass", "logmech": "TD2",
+		"dbsversion": dbsversion, "collection": "pdcr", "filesets": {k: {"active": "True"} for k in filesets}}
+
+
+def test_run_plan() -> None:
+	"assert work units, real boolean flags and the download plan of the matching units"
+	systems = {
+		"A": system("16.20", "demo", "old", "missing"),
+		"B": system("17.10", "demo", active="False"),
+		"C": {"active": "True"},
+	}
+	plan = make_run_plan(systems, FILESETS)
+
+	assert [(u.system, u.file, u.matches) for u in plan.units] == [("A", "all", True), ("A", "v17", False)]
+	assert [u.gitfile for u in plan.work()] == ["demo/all.coa.sql"]
+	assert dict(plan.systems) == {"A": True, "B": False, "C": False}
+	assert [name for name, _ in plan.invalid] == ["C"]
+	assert dict(plan.filesets) == {"demo": True, "old": False}
+	assert plan.unknown == (("A", "missing"),)
+	assert plan.active("A", "demo") and not plan.active("A", "old") and not plan.active("B")
+
+	assert [(f.gitfile, f.systems) for f in plan.download_plan()] == [("demo/all.coa.sql", ("A",))]
+	with pytest.raises(dataclasses.FrozenInstanceError):
+		plan.units = ()
+	with pytest.raises(TypeError):
+		plan.systems["B"] = True
@@ -0,0 +1,55 @@
+"test cases for the job server"
+from pathlib import Path
+from threading import Thread
+import tdcsm
+from tdcsm import serve
+
+
+def test_jobs(tmp_path: Path) -> None:
+	"assert jobs stream their run log, reuse the approot's tdcoa instance, and report failures"
+	config = (Path(tdcsm.__file__).parent / "config.yaml").read_text()
+	(tmp_path / "config.yaml").write_text(config.replace("settings:\n", 'settings:\n  skip_git: "True"\n'))
+	address = str(tmp_path / "serve.sock")
+	server = serve.UnixServer(address, serve.Handler)
+	server.jobs = serve.Jobs()
+	Thread(target=server.serve_forever, daemon=True).start()
+	try:
+		coas = []
+		for _ in range(2):
+			log = []
+			assert serve.submit(serve.connect(address), {"approot": str(tmp_path), "actions": [], "systems": ["Transcend"]}, log.append)
+			assert any(msg.startswith("selected systems:") and msg.endswith("Transcend") for msg in log)
+			coas.append(server.jobs.app(str(tmp_path), "secrets.yaml").coa)
+		assert coas[0] is coas[1] and len(server.jobs.apps) == 1
+
+		assert not serve.submit(serve.connect(address), {"approot": str(tmp_path), "actions": [], "systems": ["Nope"]}, log.append)
+		assert not serve.submit(serve.connect(address), {"approot": str(tmp_path), "actions": ["drop"]}, log.append)
+		assert server.jobs.apps == {}
+	finally:
+		server.shutdown()
+		server.server_close()
+
+
+
+def test_tcp_token(tmp_path: Path, monkeypatch) -> None:
+	"assert a server on a TCP port only runs jobs carrying the token it saved for the user"
+	config = (Path(tdcsm.__file__).parent / "config.yaml").read_text()
+	(tmp_path / "config.yaml").write_text(config.replace("settings:\n", 'settings:\n  skip_git: "True"\n'))
+	monkeypatch.setattr(Path, "home", lambda: tmp_path / "home")
+	server = serve.TCPServer(("127.0.0.1", 0), serve.Handler)
+	server.token = serve.write_token()
+	server.jobs = serve.Jobs()
+	assert serve.token_path().stat().st_mode & 0o777 == 0o600
+	Thread(target=server.serve_forever, daemon=True).start()
+	try:
+		address = server.server_address[:2]
+		job = {"approot": str(tmp_path), "actions": [], "systems": ["Transcend"]}
+		assert serve.submit(serve.connect(address), job, [].append)  # the client sends the saved token
+
+		serve.token_path().write_text("guess")
+		log = []
+		assert not serve.submit(serve.connect(address), job, log.append)
+		assert log == [] and len(server.jobs.apps) == 1
+	finally:
+		server.shutdown()
+		server.server_close()
@@ -0,0 +1,106 @@
+"test cases for the sql lexer and special command parser"
+import timeit
+from typing import Callable
+from tdcsm.sqllexer import first_statement, special_commands, split_sql, statements
+from tdcsm.utils import Utils
+
+
+def legacy_special_commands(sql, replace_with='', keys_to_skip=()):
+	"the special command parser sqllexer.special_commands replaced, as reference and baseline"
+	cmdstart = '/*{{'
+	cmdend = '}}*/'
+	found = []
+	cmds = {}
+	sqltext = sql
+	replace_with = '/* %s */' % replace_with if replace_with != '' else replace_with
+
+	# first, get a unique dict of sql commands to iterate:
+	while cmdstart in sqltext and cmdend in sqltext:
+		pos1 = sqltext.find(cmdstart)
+		pos2 = sqltext.find(cmdend)
+		cmdstr = sqltext[pos1:pos2 + len(cmdend)]
+		cmdlst = cmdstr.replace(cmdstart, '').replace(cmdend, '').split(':')
+		cmdkey = cmdlst[0].strip()
+		if len(cmdlst) == 2:
+			cmdval = cmdlst[1].strip()
+		else:
+			cmdval = ''
+		found.append((cmdkey, cmdval, cmdkey in keys_to_skip, cmdstr))
+		cmds[cmdkey] = {'value': cmdval, 'find': cmdstr,
+						'replace': replace_with.replace('{cmdname}', cmdkey).replace('{cmdkey}', cmdkey).replace('{cmdvalue}', cmdval)}
+		sqltext = sqltext.replace(cmdstr, '')
+
+	# now we have a unique list of candidates, build return object:
+	finalsql = sql
+	rtn = {}
+	for cmd, cmdobj in cmds.items():
+		# add non-skipped special cmds
+		if cmd not in keys_to_skip:
+			rtn[cmd] = cmdobj['value']
+			finalsql = finalsql.replace(cmdobj['find'], cmdobj['replace'])
+	return found, rtn, finalsql
+
+
+def parsed(sql: str, replace_with: str = "", keys_to_skip: tuple = ()) -> tuple:
+	"special_commands as the tuple the legacy parser returns"
+	result = special_commands(sql, replace_with, keys_to_skip)
+	return [(c.name, c.value, c.skipped, c.text) for c in result.found], result.commands, result.sql
+
+
+def test_split() -> None:
+	"assert text splits on ';' outside of quotes and comments only, and like str.split otherwise"
+	for text in ["", "select 1", "select 1;\nselect 2;\n", ";;", "a;b;"]:
+		assert split_sql(text) == text.split(';')
+	text = "select 'a;b', \"c;d\" -- e;f\nfrom t /* g;h */;\nselect 'it''s;';\nselect 'open;"
+	assert split_sql(text) == [
+		"select 'a;b', \"c;d\" -- e;f\nfrom t /* g;h */", "\nselect 'it''s;'", "\nselect 'open;"]
+	assert first_statement("/* x; */ select 1; select 2") == "/* x; */ select 1"
+
+
+def test_statements() -> None:
+	"assert special commands are attached to their statement, with offsets into the text"
+	text = "select 1\n/*{{save:a.csv}}*/\n/*{{load:db.t}}*/;\n select 2 /* {{not}} */ /*{{vis}}*/;"
+	result = list(statements(text))
+	assert [st.commands for st in result] == [(("save", "a.csv"), ("load", "db.t")), (("vis", ""),), ()]
+	assert [text[st.start:st.start + len(st.text)] for st in result] == [st.text for st in result]
+
+
+def test_format_sql() -> None:
+	"assert statements are cut at their first ';' and blank lines collapsed"
+	assert Utils.format_sql("\n\nselect ';'\n\n\n\nfrom t\n\n;select 2") == "select ';'\nfrom t\n;\n\n"
+	assert Utils.format_sql(" \n;\n") == ""
+
+
+def test_special_commands() -> None:
+	"assert commands, their positions, and the replaced sql are as the legacy parser had them"
+	sql = "select 1\n/*{{save:a.csv}}*/ /*{{ vis : x }}*/\n/*{{save:b.csv}}*/ /*{{save:a.csv}}*/ /*{{load:db:t}}*/"
+	for replace_with, skip in [("", ()), ("{{replaceMe:{cmdname}}}", ("vis",)), ("{cmdkey}={cmdvalue}", ("save", "load"))]:
+		assert parsed(sql, replace_with, skip) == legacy_special_commands(sql, replace_with, skip)
+	result = special_commands(sql)
+	assert [sql[c.start:c.end] for c in result.found] == [c.text for c in result.found]
+	assert result.commands == {"save": "b.csv", "vis": "x", "load": ""}
+	# a stray }}*/ ahead of the first command kept the legacy parser looping forever
+	assert parsed("x }}*/ /*{{vis:y}}*/")[1] == {"vis": "y"}
+
+
+def test_statement_special_commands() -> None:
+	"assert the commands attached to each statement give what parsing its text gives, but for those in comments"
+	text = "select 1 /*{{save:a.csv}}*/ /*{{vis:x}}*/;\nselect ';' /*{{save:b.csv}}*/ /*{{save:a.csv}}*/;\n"
+	for statement in statements(text):
+		for replace_with, skip in [("", ()), ("{{replaceMe:{cmdname}}}", ("vis",))]:
+			assert statement.special_commands(replace_with, skip) == special_commands(statement.text, replace_with, skip)
+	assert [st.special_commands().commands for st in statements(text)] == [{"save": "a.csv", "vis": "x"}, {"save": "a.csv"}, {}]
+
+	commented = next(statements("select 1 -- /*{{save:no.csv}}*/\n/*{{vis:x}}*/"))
+	assert commented.special_commands("{cmdname}").commands == {"vis": "x"}
+	assert commented.special_commands().sql == "select 1 -- /*{{save:no.csv}}*/\n"
+
+
+def test_special_commands_benchmark(record_property: Callable[[str, object], None]) -> None:
+	"assert the one pass parser parses a statement with many commands as the legacy one, and record both timings"
+	sql = "select 1\n" + "".join("/*{{save:%i.csv}}*/ from t%i\n" % (i, i) for i in range(300))
+	assert parsed(sql, "{{replaceMe:{cmdname}}}") == legacy_special_commands(sql, "{{replaceMe:{cmdname}}}")
+	new = min(timeit.repeat(lambda: special_commands(sql, "{{replaceMe:{cmdname}}}"), number=10, repeat=3)) / 10
+	old = min(timeit.repeat(lambda: legacy_special_commands(sql, "{{replaceMe:{cmdname}}}"), number=10, repeat=3)) / 10
+	record_property("special_commands_us", new * 1e6)
+	record_property("legacy_special_commands_us", old * 1e6)
@@ -0,0 +1,67 @@
+"test cases for the content-addressed store shared by approots"
+import os
+from pathlib import Path
+import pytest
+from tdcsm.download import Downloader, DownloadIndex, DownloadJob
+from tdcsm.store import ContentStore
+from test_download import githost  # noqa: F401, fixture
+
+
+def test_store_shared(githost: str, tmp_path: Path) -> None:
+	"assert a file downloaded by one approot is linked into another, only revalidated, and its blob is read-only"
+	url = f"{githost}demo/file1.coa.sql"
+	savefiles = []
+	for approot in ("a", "b"):
+		store = ContentStore(tmp_path / "store")  # fresh for each approot, sharing only the store folder
+		savefile = tmp_path / approot / "1_download" / "demo" / "file1.coa.sql"
+		with Downloader(index=DownloadIndex(tmp_path / approot / "download_index.json"), store=store) as d:
+			result = d.fetch(DownloadJob(url, savefile))
+		store.save()
+		assert result.ok and result.not_modified == (approot == "b")
+		savefiles.append(savefile)
+
+	blob = store.blob(store.lookup(url)["sha256"])
+	assert savefiles[0].read_text() == "select 1;" and savefiles[0].samefile(savefiles[1]) and savefiles[1].samefile(blob)
+	if os.name != "nt":
+		assert not blob.stat().st_mode & 0o222
+	assert store.put_bytes(b"select 1;") == blob.name and len([p for p in store.root.iterdir() if not p.name.startswith(".")]) == 2
+
+
+def test_store_adopt(githost: str, tmp_path: Path) -> None:
+	"assert a file downloaded before the approot used a store is moved into it once revalidated"
+	url = f"{githost}demo/file2.coa.sql"
+	job = DownloadJob(url, tmp_path / "dl" / "file2.coa.sql")
+	index = DownloadIndex(tmp_path / "download_index.json")
+	with Downloader(index=index) as d:
+		assert d.fetch(job).status_code == 200
+	index.save()
+	index.clear_journal()  # as after a complete download run
+
+	store = ContentStore(tmp_path / "store")
+	with Downloader(index=index, store=store) as d:
+		assert d.fetch(job).not_modified
+
+	entry = store.lookup(url)
+	assert entry is not None and entry["sha256"] == index.entries[url]["sha256"]
+	assert job.savefile.samefile(store.blob(entry["sha256"])) and job.savefile.read_text() == "select 2;"
+
+
+def test_store_copy_fallback(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+	"assert a blob is copied where it can't be hard-linked, and the copy can be changed without changing the blob"
+	store = ContentStore(tmp_path / "store")
+	digest = store.put_bytes(b"select 1;")
+	dst = tmp_path / "sql" / "file.coa.sql"
+	dst.parent.mkdir()
+	dst.write_text("replaced")
+
+	def no_link(src: Path, dst: Path) -> None:
+		raise OSError("cross-device link")
+
+	monkeypatch.setattr(os, "link", no_link)
+	store.link(digest, dst)
+	assert dst.read_text() == "select 1;" and not dst.samefile(store.blob(digest))
+
+	dst.write_text("edited")
+	assert store.blob(digest).read_bytes() == b"select 1;"
+	store.discard(digest)
+	assert digest in store
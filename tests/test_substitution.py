@@ -0,0 +1,31 @@
+"test cases for single-pass substitution"
+from tdcsm.substitution import Scope
+
+
+def sequential(text: str, layers: list) -> str:
+	"substitution layer by layer and key by key, as tdcoa did before"
+	for _, values, skip in layers:
+		for k, v in values.items():
+			if k not in skip:
+				text = text.replace("{%s}" % k, str(v))
+	return text
+
+
+def test_scope() -> None:
+	"assert the precedence, the expansion of tokens in values and the positions used match sequential substitution"
+	layers = [
+		("override", {"table": "{db}.dbqlogtbl", "days": 7}, []),
+		("system", {"db": "{prefix}_pdcr", "host": "sys", "filesets": {"x": 1}, "prefix": "sys"}, ["filesets"]),
+		("config", {"prefix": "cfg", "days": 30, "startdate": "date - {days}", "account": "{{weird}}"}, []),
+		("transcend", {"host": "tx", "db_coa": "coa"}, ["host"]),
+	]
+	text = "sel * from {table} where d > {startdate} /* {{save:x.csv}} {account} {missing} {filesets} {host} {db_coa} */"
+	scope = Scope(layers)
+	result, used = scope.substitute(text)
+	assert result == sequential(text, layers)
+	assert "sys_pdcr.dbqlogtbl" in result and "date - {days}" in result and "{filesets}" in result
+	assert used == {(0, 0), (1, 0), (1, 1), (1, 2), (2, 2), (2, 3), (3, 0)}
+
+	layers.insert(2, ("file", {"days": 1, "db_coa": "file"}, []))
+	result, _ = scope.insert(2, *layers[2][:2]).substitute(text)
+	assert result == sequential(text, layers)
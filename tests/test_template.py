@@ -0,0 +1,65 @@
+"test cases for compiled .coa.sql templates"
+from typing import List, Optional, Tuple
+from tdcsm.sqllexer import split_sql
+from tdcsm.substitution import Scope
+from tdcsm.template import TemplateCache
+from tdcsm.utils import Utils
+
+TEXT = """/* demo for {account} on {siteid} */
+SELECT '{name}' as val, {startdate} as sd, '{siteid}' as site, '{{literal}}' as l
+/*{{save:{siteid}.demo.csv}}*/
+/*{{file:{siteid}.sql}}*/;
+
+{prefix}SELECT '{name}' as nm, {x} as x from {db}.t
+/*{{loop:loop.csv}}*/;;
+"""
+SKIP = ("save", "load")
+
+
+def slow(text: str, scope: Scope) -> List[Tuple[str, dict]]:
+	"statements of text as prepare_sql parsed them, substituted first"
+	utils = Utils("test")
+	utils.printlog = False
+	statements = []
+	for raw in split_sql(utils.substitute_scope(text, scope)):
+		sql = utils.format_sql(raw)
+		cmds = utils.get_special_commands(sql, "{{replaceMe:{cmdname}}}", keys_to_skip=SKIP) if sql else {"sql": ""}
+		statements.append((cmds.pop("sql"), cmds))
+	return statements
+
+
+def fast(text: str, scope: Scope) -> Optional[List[Tuple[str, dict]]]:
+	"statements of text rendered from its compiled template, parsed once rendered where needed"
+	rendered = TemplateCache("{{replaceMe:{cmdname}}}", SKIP).get(text).render(scope)
+	if rendered is None:
+		return None
+	statements = []
+	for text, sql, _, cmds in rendered.statements:
+		if sql is None and text:
+			cmds = Utils("test").get_special_commands(text, "{{replaceMe:{cmdname}}}", keys_to_skip=SKIP)
+			sql = cmds.pop("sql")
+		statements.append((sql if text else "", cmds or {}))
+	return statements
+
+
+def test_render() -> None:
+	"assert rendered templates parse as the substituted text does, or are refused"
+	base = {"account": "Acme", "siteid": "SITE01", "name": "n", "startdate": "date - {days}", "days": "7", "db": "pdcr", "prefix": "--x\n"}
+	for values, usable in [
+		(base, False),                                        # newline in a value
+		({**base, "prefix": "sel"}, True),
+		({**base, "prefix": "sel", "siteid": "a:b"}, True),   # changes commands, parsed once rendered
+		({**base, "prefix": "sel", "name": "a;b"}, False),    # statement delimiter
+		({**base, "prefix": "sel", "literal": "x"}, False),   # within {{ }}
+		({**base, "prefix": "sel", "db": ""}, False),         # empty, could join blank lines
+		({**base, "prefix": "sel", "startdate": "'2020-01-01'"}, True),
+		({**base, "prefix": "sel", "name": "o'brien"}, False),  # unbalanced quote
+	]:
+		scope = Scope([("values", values, [])])
+		result = fast(TEXT, scope)
+		assert (result is not None) == usable, values
+		if usable:
+			assert result == slow(TEXT, scope)
+
+	cache = TemplateCache()
+	assert cache.get(TEXT) is cache.get(str(TEXT)) and len(cache.templates) == 1
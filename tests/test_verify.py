@@ -0,0 +1,38 @@
+"test cases for download integrity verification"
+from hashlib import sha256
+from pathlib import Path
+from tdcsm.download import Downloader, DownloadJob
+from tdcsm.verify import verify
+
+
+def digest(text: str) -> str:
+	return sha256(text.encode()).hexdigest()
+
+
+def test_verify(tmp_path: Path) -> None:
+	"assert matching, damaged and missing files are told apart, in order"
+	for n in range(3):
+		(tmp_path / f"file{n}.coa.sql").write_text(f"select {n};")
+	(tmp_path / "file1.coa.sql").write_text("damaged")
+	files = [(tmp_path / f"file{n}.coa.sql", digest(f"select {n};")) for n in range(4)]
+
+	results = list(verify(files, max_workers=2))
+
+	assert [r.path for r in results] == [p for p, _ in files]
+	assert [r.ok for r in results] == [True, False, True, False]
+	assert results[3].actual is None
+
+
+def test_download_sha256(tmp_path: Path) -> None:
+	"assert downloaded content that doesn't match the published sha256 is rejected"
+	src = tmp_path / "demo.coa.sql"
+	src.write_text("select 1;")
+	good = DownloadJob(src.as_uri(), tmp_path / "dl" / "good.coa.sql", digest("select 1;").upper())
+	bad = DownloadJob(src.as_uri(), tmp_path / "dl" / "bad.coa.sql", digest("select 2;"))
+
+	with Downloader() as d:
+		results = list(d.run([good, bad]))
+
+	assert [r.ok for r in results] == [True, False]
+	assert "sha256 mismatch" in results[1].text
+	assert good.savefile.exists() and not bad.savefile.exists()
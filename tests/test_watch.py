@@ -0,0 +1,30 @@
+"test cases for configuration file watching"
+import os
+from pathlib import Path
+from tdcsm.watch import FileWatcher, diff
+
+
+def test_watcher(tmp_path: Path) -> None:
+	"assert only content changes, appearing and disappearing files are reported, once"
+	config, systems = tmp_path / "config.yaml", tmp_path / "source_systems.yaml"
+	config.write_text("settings: {}")
+	watcher = FileWatcher({"config": config, "systems": systems})
+	assert watcher.changed() == set()
+
+	os.utime(config, ns=(1, 1))
+	assert watcher.changed() == set()
+
+	config.write_text("settings: {a: 1}")
+	systems.write_text("systems: {}")
+	assert watcher.changed() == {"config", "systems"}
+	assert watcher.changed() == set()
+
+	systems.unlink()
+	assert watcher.changed() == {"systems"}
+
+
+def test_diff() -> None:
+	"assert added, removed and changed names"
+	d = diff({"A": {"password": "1"}, "B": {}, "C": {}}, {"A": {"password": "2"}, "B": {}, "D": {}})
+	assert (d.added, d.removed, d.changed) == ({"D"}, {"C"}, {"A"})
+	assert not diff({"A": 1}, {"A": 1})